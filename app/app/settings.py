@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -45,7 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'recipe.middleware.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,9 +90,28 @@ DATABASES = {
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # seconds a thread keeps its connection between requests
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
     }
 }
 
+# Set DB_POOL=1 to share connections between the threads of a process
+# through core.db.pool instead of opening one per request. Each process
+# of a multi-process server has its own pool, so the database needs
+# max_connections >= processes * DB_POOL_MAX_SIZE.
+if os.environ.get('DB_POOL', '0') == '1':
+    DATABASES['default']['ENGINE'] = 'core.db.backends.postgresql_pool'
+    DATABASES['default']['POOL'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 0)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        # seconds to wait for a free connection
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+        # idle seconds after which SELECT 1 runs before reuse
+        'check_interval': float(os.environ.get('DB_POOL_CHECK_INTERVAL', 30)),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -107,6 +131,65 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing, see user.hashers. The first available of
+# PASSWORD_HASHER, argon2 and bcrypt hashes new passwords, falling back to
+# PBKDF2 when neither argon2-cffi nor bcrypt is installed. argon2-cffi is
+# in requirements.txt, so argon2 is used unless PASSWORD_HASHER says
+# otherwise. The others stay listed so existing hashes still verify and
+# get upgraded on login.
+# The work factors are the minimums of the OWASP password storage cheat
+# sheet: Argon2 with 19 MiB, 2 passes and 1 lane, bcrypt with 2^10
+# rounds and PBKDF2-SHA256 with 600000 iterations. Measured per hash on
+# one core with the benchmark_login command: Argon2 about 36 ms, bcrypt
+# about 90 ms and PBKDF2 about 230 ms, so the default Argon2 costs less
+# CPU per login than Django's PBKDF2 with 120000 iterations (about
+# 48 ms) while being memory-hard. Operators may lower them through the
+# environment at their own risk; the login throttle keeps attackers from
+# making the server hash much either way.
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+# KiB
+PASSWORD_ARGON2_MEMORY_COST = int(
+    os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19 * 1024)
+)
+PASSWORD_ARGON2_PARALLELISM = int(
+    os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1)
+)
+PASSWORD_BCRYPT_ROUNDS = int(os.environ.get('PASSWORD_BCRYPT_ROUNDS', 10))
+PASSWORD_PBKDF2_ITERATIONS = int(
+    os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600000)
+)
+
+# hasher name: (class, module it needs)
+_password_hashers = {
+    'argon2': ('user.hashers.Argon2PasswordHasher', 'argon2'),
+    'bcrypt': ('user.hashers.BCryptSHA256PasswordHasher', 'bcrypt'),
+    'pbkdf2': ('user.hashers.PBKDF2PasswordHasher', None),
+}
+PASSWORD_HASHER = next(
+    name for name in (os.environ.get('PASSWORD_HASHER'), 'argon2', 'bcrypt', 'pbkdf2')
+    if name in _password_hashers and
+    (_password_hashers[name][1] is None or find_spec(_password_hashers[name][1]))
+)
+PASSWORD_HASHERS = [
+    hasher for hasher, _ in sorted(
+        _password_hashers.values(),
+        key=lambda item: item[0] != _password_hashers[PASSWORD_HASHER][0]
+    )
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+# Login attempts allowed to the token endpoint per client IP and per
+# email, as DRF rates ('<count>/<sec|min|hour|day>', None to disable).
+# Counted in fixed windows in the LOGIN_THROTTLE_CACHE alias before any
+# password is hashed, see user.throttling. Every process counts against
+# the same limit when the alias is shared (CACHE_REDIS_URL below). The
+# client IP is REMOTE_ADDR unless NUM_PROXIES below says how many
+# proxies add to X-Forwarded-For.
+LOGIN_THROTTLE_RATES = {
+    'login_ip': os.environ.get('LOGIN_THROTTLE_IP_RATE', '60/min'),
+    'login_email': os.environ.get('LOGIN_THROTTLE_EMAIL_RATE', '10/min'),
+}
+LOGIN_THROTTLE_CACHE = 'default'
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.1/topics/i18n/
@@ -133,7 +216,162 @@ MEDIA_URL = '/media/'
 
 # Tell Django where to store all the media files
 MEDIA_ROOT = '/vol/web/media'
+
+# How uploaded media is sent, see core.views.serve_media:
+# 'django', 'accel' (nginx X-Accel-Redirect) or 'sendfile' (X-Sendfile).
+# For 'accel', nginx needs an internal location at MEDIA_ACCEL_PREFIX
+# that aliases MEDIA_ROOT.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Max age of media that isn't content addressed
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 3600))
+
 # Tell Django where to store all the static fieldsets
 STATIC_ROOT = '/vol/web/static'
 
 AUTH_USER_MODEL = 'core.User'
+
+# JSON goes through orjson when it is installed, the stdlib otherwise
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Proxies in front of the app, each adding the address it received
+    # the request from to X-Forwarded-For. With 0 the header is ignored,
+    # so clients can't pick the IP they are throttled by.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Keyset pagination for the recipe API list endpoints. Clients opt in
+# with ?page_size= or ?cursor=, and can never ask for more than the max
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+
+# Most items a single bulk create/update/delete request may contain
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 10000))
+
+# Most used tags and ingredients returned by the recipe stats action,
+# by default and at most
+RECIPE_STATS_TOP = 10
+RECIPE_STATS_MAX_TOP = 100
+
+# Ingredient matching, see recipe.matching. Bitset indexes are kept for
+# up to RECIPE_MATCH_INDEX_SIZE users per process.
+RECIPE_MATCH_INDEX_SIZE = int(os.environ.get('RECIPE_MATCH_INDEX_SIZE', 1000))
+RECIPE_MATCH_MAX_MISSING = 5
+RECIPE_MATCH_LIMIT = 20
+RECIPE_MATCH_MAX_LIMIT = 100
+
+# ?prefix= autocomplete of tags and ingredients, see recipe.autocomplete.
+# Users with up to AUTOCOMPLETE_TRIE_MAX_NAMES names per model get an in
+# process trie, kept for AUTOCOMPLETE_CACHE_SIZE (model, user) pairs.
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+AUTOCOMPLETE_TRIE_MAX_NAMES = int(
+    os.environ.get('AUTOCOMPLETE_TRIE_MAX_NAMES', 5000)
+)
+AUTOCOMPLETE_CACHE_SIZE = int(os.environ.get('AUTOCOMPLETE_CACHE_SIZE', 1000))
+
+# Resized copies of uploaded recipe images, by name: longest side in px.
+# They are made by a pool of RECIPE_IMAGE_WORKERS threads, or during the
+# upload request when RECIPE_IMAGE_EAGER is set (e.g. for tests).
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': 150,
+    'small': 480,
+    'large': 1200,
+}
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_EAGER = os.environ.get('RECIPE_IMAGE_EAGER', '0') == '1'
+RECIPE_IMAGE_QUALITY = int(os.environ.get('RECIPE_IMAGE_QUALITY', 85))
+
+# Limits checked while an image is uploaded, before it is decoded
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = int(
+    os.environ.get('RECIPE_IMAGE_MAX_UPLOAD_SIZE', 20 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 40 * 1000 * 1000)
+)
+# Resumable uploads. Their files are kept in RECIPE_UPLOAD_SESSION_DIR,
+# which must be shared by all web workers, and the state in the database
+RECIPE_UPLOAD_SESSION_DIR = os.environ.get(
+    'RECIPE_UPLOAD_SESSION_DIR', '/tmp/recipe-uploads'
+)
+RECIPE_UPLOAD_SESSION_TTL = int(
+    os.environ.get('RECIPE_UPLOAD_SESSION_TTL', 24 * 60 * 60)
+)
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# Local memory by default. Set CACHE_REDIS_URL to share the cache between
+# processes, this needs the django-redis package.
+
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ.get('CACHE_REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Per-user response cache of the recipe API list endpoints. Entries are
+# keyed on the user's change version, read from the database, so with a
+# per-process cache every worker still drops them on the next write.
+RECIPE_CACHE_ENABLED = os.environ.get('RECIPE_CACHE_ENABLED', '1') == '1'
+RECIPE_CACHE_ALIAS = 'default'
+RECIPE_CACHE_TIMEOUT = int(os.environ.get('RECIPE_CACHE_TIMEOUT', 300))
+# GETs under this path get ETags from the user's change version and
+# 304s from recipe.middleware.ConditionalGetMiddleware
+RECIPE_CONDITIONAL_GET_PREFIX = '/api/recipe/'
+
+# Response compression, see core.middleware.CompressionMiddleware.
+# Brotli is offered when the brotli package is installed.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 5)
+)
+# Content-Type prefixes worth compressing
+COMPRESSION_CONTENT_TYPES = (
+    'application/json', 'application/javascript', 'text/', 'image/svg+xml',
+)
+
+# Per endpoint request metrics, see core.middleware.MetricsMiddleware.
+# /metrics serves them in the Prometheus text format, to requests with
+# "Authorization: Bearer <METRICS_TOKEN>". It is not found while no
+# token is set.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Requests taking longer are logged to core.metrics with their slowest
+# SLOW_REQUEST_LOG_QUERIES statements, out of the first
+# SLOW_REQUEST_MAX_QUERIES kept per request
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+SLOW_REQUEST_MAX_QUERIES = int(
+    os.environ.get('SLOW_REQUEST_MAX_QUERIES', 200)
+)
+SLOW_REQUEST_LOG_QUERIES = int(
+    os.environ.get('SLOW_REQUEST_LOG_QUERIES', 10)
+)
+
+# Token authentication cache. Authenticated tokens are kept in a per
+# process LRU for TOKEN_AUTH_CACHE_TTL seconds, and in the cache alias
+# named by TOKEN_AUTH_SHARED_CACHE when it is set. Set it when running
+# several processes: it also carries the revocations that make every
+# process drop a deleted token or deactivated user at once.
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+TOKEN_AUTH_SHARED_CACHE = os.environ.get('TOKEN_AUTH_SHARED_CACHE')
+TOKEN_AUTH_SHARED_CACHE_TTL = int(
+    os.environ.get('TOKEN_AUTH_SHARED_CACHE_TTL', 600)
+)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # Connect the signal handlers that maintain derived data
+        from core import signals  # noqa: F401
@@ -0,0 +1,61 @@
+"""PostgreSQL backend that takes its connections from a ConnectionPool
+
+Pool options go in the POOL dict of the database settings, next to
+OPTIONS, with the keyword arguments of core.db.pool.ConnectionPool.
+"""
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as \
+    BaseDatabaseCreation
+
+from core.db.pool import get_pool
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the database from dropping
+        self.connection.get_pool().closeall()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_pool(self):
+        """Return the pool of the database this wrapper connects to"""
+        conn_params = self.get_connection_params()
+        key = (self.alias, tuple(sorted(
+            (name, str(value)) for name, value in conn_params.items()
+        )))
+        return get_pool(
+            key,
+            lambda: base.Database.connect(**conn_params),
+            **self.settings_dict.get('POOL', {})
+        )
+
+    def get_new_connection(self, conn_params):
+        connection = self.get_pool().getconn()
+
+        # as in the base class, the isolation level must be read before
+        # autocommit is set
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps using self.connection until the atomic
+                # block exits, so it can't go back to the pool
+                self.get_pool().discard(self.connection)
+            else:
+                self.get_pool().putconn(self.connection)
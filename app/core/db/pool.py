@@ -0,0 +1,266 @@
+"""A process wide pool of psycopg2 connections
+
+Used by the core.db.backends.postgresql_pool database backend. Django
+keeps one connection per thread and closes it after each request; with
+the pool the close hands the connection back, and the next request in
+any thread of the process reuses it instead of paying for TCP and
+authentication again.
+"""
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No connection became free within the pool timeout"""
+
+
+class ConnectionPool:
+    """Keep between min_size and max_size connections to one database
+
+    Connections idle longer than check_interval seconds run SELECT 1
+    before they are handed out, and ones idle longer than max_idle
+    (beyond min_size) or older than max_lifetime are closed. Eviction
+    happens on checkout and checkin, there is no background thread.
+    """
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=10,
+                 max_idle=300, max_lifetime=3600, check_interval=30):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+
+        self._lock = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # (connection, created at, returned at), most recently used last
+        self._idle = []
+        self._created = {}
+        self._in_use = 0
+        self._stats = dict.fromkeys((
+            'connects', 'reuses', 'health_checks', 'closed_broken',
+            'closed_idle', 'closed_expired', 'waits', 'timeouts',
+        ), 0)
+        self._stats['wait_seconds'] = 0.0
+
+    def _check_pid(self):
+        # A forked worker inherits the parent's sockets. Using or closing
+        # them would corrupt the parent's sessions, so they are dropped.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def getconn(self):
+        """Return a healthy connection, open one if none is idle"""
+        with self._lock:
+            self._check_pid()
+            deadline = None
+            while True:
+                self._evict(time.monotonic())
+                if self._idle:
+                    conn, created, returned = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    conn = None
+                    self._in_use += 1
+                    break
+
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    self._stats['waits'] += 1
+                    waited_from = time.monotonic()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection free after {self.timeout}s'
+                    )
+                self._lock.wait(remaining)
+            if deadline is not None:
+                self._stats['wait_seconds'] += time.monotonic() - waited_from
+
+        # connecting and health checks happen outside the lock
+        if conn is not None and self._healthy(conn, returned):
+            self._count('reuses')
+            return conn
+        if conn is not None:
+            self._discard(conn, 'closed_broken', release=False)
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._created[id(conn)] = time.monotonic()
+            self._stats['connects'] += 1
+
+        return conn
+
+    def putconn(self, conn):
+        """Give a connection back, close it if it can't be reused"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # checked out before a fork, belongs to the parent
+                return
+        if not self._reusable(conn):
+            self._discard(conn, 'closed_broken')
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            created = self._created.get(id(conn), now)
+            if now - created > self.max_lifetime:
+                expired = True
+            else:
+                expired = False
+                self._idle.append((conn, created, now))
+                self._in_use -= 1
+                self._lock.notify()
+        if expired:
+            self._discard(conn, 'closed_expired')
+
+    def discard(self, conn):
+        """Close a checked out connection instead of giving it back"""
+        self._discard(conn, 'closed_broken')
+
+    def warm(self):
+        """Open connections until min_size are idle, return how many"""
+        conns = []
+        try:
+            while len(conns) + self.stats()['idle'] < self.min_size:
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+        return len(conns)
+
+    def closeall(self):
+        """Close the idle connections"""
+        with self._lock:
+            self._check_pid()
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Return counters and the current size of the pool"""
+        with self._lock:
+            self._check_pid()
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._in_use
+            stats['max_size'] = self.max_size
+
+        return stats
+
+    def _healthy(self, conn, returned):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned < self.check_interval:
+            return True
+
+        # the server may have dropped a connection idle for a while
+        self._count('health_checks')
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not conn.autocommit:
+                conn.rollback()
+        except psycopg2.Error:
+            return False
+
+        return True
+
+    def _reusable(self, conn):
+        if conn.closed:
+            return False
+        status = conn.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        if status in (extensions.TRANSACTION_STATUS_INTRANS,
+                      extensions.TRANSACTION_STATUS_INERROR):
+            # never hand out a connection with an open transaction
+            try:
+                conn.rollback()
+                return True
+            except psycopg2.Error:
+                return False
+
+        return False
+
+    def _evict(self, now):
+        """Close idle connections over max_idle or max_lifetime
+
+        Called with the lock held.
+        """
+        open_count = len(self._idle) + self._in_use
+        keep = []
+        # least recently used first
+        for conn, created, returned in self._idle:
+            if now - created > self.max_lifetime:
+                reason = 'closed_expired'
+            elif now - returned > self.max_idle and \
+                    open_count > self.min_size:
+                reason = 'closed_idle'
+            else:
+                keep.append((conn, created, returned))
+                continue
+            open_count -= 1
+            self._stats[reason] += 1
+            self._created.pop(id(conn), None)
+            self._close(conn)
+        self._idle = keep
+
+    def _discard(self, conn, reason, release=True):
+        """Close a connection, release=False keeps its slot for a new one"""
+        with self._lock:
+            self._stats[reason] += 1
+            self._created.pop(id(conn), None)
+            if release:
+                self._in_use -= 1
+                self._lock.notify()
+        self._close(conn)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, **options):
+    """Return the pool for key, creating it with options on first use"""
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(connect, **options)
+
+    return pool
+
+
+def all_pools():
+    """Return the pools of this process by key"""
+    with _pools_lock:
+        return dict(_pools)
@@ -0,0 +1,201 @@
+import io
+import json
+import statistics
+import time
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+from core.seed import SEED_EMAIL_PREFIX, SEED_PASSWORD
+
+
+SCENARIOS = ('list', 'filter', 'detail', 'create', 'upload', 'login')
+
+
+def percentile(ordered, p):
+    """Return the nearest rank p percentile of sorted values"""
+    return ordered[int(p / 100 * (len(ordered) - 1))]
+
+
+class BenchmarkUser:
+    """A seeded user and the ids its requests use"""
+
+    def __init__(self, user):
+        self.email = user.email
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.recipe_ids = list(Recipe.objects.filter(user=user).order_by(
+            'id').values_list('id', flat=True)[:100])
+        self.tag_ids = list(Tag.objects.filter(user=user).order_by(
+            'id').values_list('id', flat=True)[:10])
+        self.ingredient_ids = list(Ingredient.objects.filter(
+            user=user).order_by('id').values_list('id', flat=True)[:10])
+
+
+class Command(BaseCommand):
+    """Measure the recipe API under a mix of scenarios
+
+    Requests go through the whole middleware and view stack in process,
+    as the users made by seed_data, against whatever database is
+    configured, e.g. the docker-compose Postgres container. Every
+    scenario reports throughput, latency percentiles and queries per
+    request; --json writes the same numbers to a file to compare runs.
+    Login throttling is turned off for the run, and create and upload
+    add recipes and images to the seeded data.
+    """
+    help = 'Benchmark the recipe API with seeded data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append',
+                            choices=SCENARIOS,
+                            help='Scenario to run, all by default')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Unmeasured requests per scenario')
+        parser.add_argument('--users', type=int, default=20,
+                            help='Seeded users the requests rotate over')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Turn off the recipe response cache')
+        parser.add_argument('--json', dest='json_path',
+                            help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        users = [
+            BenchmarkUser(user) for user in get_user_model().objects.filter(
+                email__startswith=SEED_EMAIL_PREFIX, is_active=True
+            ).order_by('id')[:options['users']]
+        ]
+        users = [user for user in users if user.recipe_ids]
+        if not users:
+            raise CommandError('No seeded users, run seed_data first')
+
+        self.client = APIClient()
+        self.image = self._make_image()
+        overrides = {
+            'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver'],
+            'LOGIN_THROTTLE_RATES': {},
+        }
+        if options['no_cache']:
+            overrides['RECIPE_CACHE_ENABLED'] = False
+
+        results = {}
+        with override_settings(**overrides):
+            for name in options['scenario'] or SCENARIOS:
+                request = getattr(self, f'_request_{name}')
+                for n in range(options['warmup']):
+                    request(users[n % len(users)], n)
+                results[name] = self._run(
+                    request, users, options['requests']
+                )
+                self._report(name, results[name])
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def _run(self, request, users, count):
+        latencies = []
+        queries = []
+        errors = 0
+
+        def count_query(execute, sql, params, many, context):
+            queries[-1] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            for n in range(count):
+                queries.append(0)
+                request_start = time.perf_counter()
+                res = request(users[n % len(users)], n)
+                latencies.append(time.perf_counter() - request_start)
+                if res.status_code >= 400:
+                    errors += 1
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'requests': count,
+            'errors': errors,
+            'throughput': count / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries_per_request': statistics.mean(queries),
+            'max_queries': max(queries),
+        }
+
+    def _report(self, name, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {name}'))
+        self.stdout.write(
+            f'  {result["requests"]} requests, {result["errors"]} errors, '
+            f'{result["throughput"]:.0f}/s'
+        )
+        self.stdout.write(
+            f'  latency ms: p50 {result["p50_ms"]:.2f} '
+            f'p95 {result["p95_ms"]:.2f} p99 {result["p99_ms"]:.2f}'
+        )
+        self.stdout.write(
+            f'  queries: mean {result["queries_per_request"]:.1f} '
+            f'max {result["max_queries"]}'
+        )
+
+    def _make_image(self):
+        buf = io.BytesIO()
+        Image.new('RGB', (800, 600), (200, 120, 40)).save(buf, 'JPEG')
+        return buf.getvalue()
+
+    def _auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Token {user.token}'}
+
+    def _request_list(self, user, n):
+        return self.client.get(
+            reverse('recipe:recipe-list'), **self._auth(user)
+        )
+
+    def _request_filter(self, user, n):
+        return self.client.get(reverse('recipe:recipe-list'), {
+            'tags': ','.join(map(str, user.tag_ids[:2])),
+            'ingredients': ','.join(map(str, user.ingredient_ids[:1])),
+        }, **self._auth(user))
+
+    def _request_detail(self, user, n):
+        recipe_id = user.recipe_ids[n % len(user.recipe_ids)]
+        return self.client.get(
+            reverse('recipe:recipe-detail', args=[recipe_id]),
+            **self._auth(user)
+        )
+
+    def _request_create(self, user, n):
+        return self.client.post(reverse('recipe:recipe-list'), {
+            'title': f'Benchmark recipe {n}',
+            'tags': user.tag_ids[:2],
+            'ingredients': user.ingredient_ids[:3],
+            'time_minutes': 10,
+            'price': '5.00',
+        }, format='json', **self._auth(user))
+
+    def _request_upload(self, user, n):
+        recipe_id = user.recipe_ids[n % len(user.recipe_ids)]
+        image = io.BytesIO(self.image)
+        image.name = 'benchmark.jpg'
+        return self.client.post(
+            reverse('recipe:recipe-upload-image', args=[recipe_id]),
+            {'image': image}, format='multipart', **self._auth(user)
+        )
+
+    def _request_login(self, user, n):
+        return self.client.post(reverse('user:token'), {
+            'email': user.email,
+            'password': SEED_PASSWORD,
+        }, format='json')
@@ -0,0 +1,92 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hashers
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+from django.test.utils import override_settings
+
+from rest_framework.test import APIRequestFactory
+
+from user.views import CreateTokenView
+
+
+class Rollback(Exception):
+    """Raised to undo the benchmark's users and tokens"""
+
+
+class Command(BaseCommand):
+    """Measure the cost of logging in
+
+    Times check_password for every configured hasher that can be loaded,
+    then whole requests to the token endpoint, once allowed and once
+    rejected by the login throttle. Users and tokens made along the way
+    are rolled back.
+    """
+    help = 'Benchmark password hashers and the login endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20,
+                            help='Logins per measurement')
+
+    def handle(self, *args, **options):
+        self.logins = options['logins']
+        self._hashers()
+        try:
+            with transaction.atomic():
+                self._endpoint()
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _hashers(self):
+        self.stdout.write(self.style.MIGRATE_HEADING('== check_password'))
+        for hasher in get_hashers():
+            try:
+                encoded = hasher.encode('password', hasher.salt())
+            except ValueError:
+                # its library isn't installed
+                self.stdout.write(f'  {hasher.algorithm}: not available')
+                continue
+            start = time.perf_counter()
+            for _ in range(self.logins):
+                hasher.verify('password', encoded)
+            self._report(hasher.algorithm, time.perf_counter() - start)
+
+    def _endpoint(self):
+        self.stdout.write(self.style.MIGRATE_HEADING('== token endpoint'))
+        get_user_model().objects.create_user(
+            email='benchmark@example.com', password='password'
+        )
+        view = CreateTokenView.as_view()
+        factory = APIRequestFactory()
+        cache = caches[settings.LOGIN_THROTTLE_CACHE]
+
+        def login(label):
+            cache.clear()
+            start = time.perf_counter()
+            for _ in range(self.logins):
+                request = factory.post('/', {
+                    'email': 'benchmark@example.com', 'password': 'password'
+                })
+                status_code = view(request).status_code
+            self._report(
+                f'{label} ({status_code})', time.perf_counter() - start
+            )
+
+        with override_settings(LOGIN_THROTTLE_RATES={}):
+            login('allowed')
+        # every request after the first is rejected before hashing
+        with override_settings(LOGIN_THROTTLE_RATES={
+            'login_ip': '1/day', 'login_email': '1/day'
+        }):
+            login('throttled')
+        cache.clear()
+
+    def _report(self, label, elapsed):
+        self.stdout.write(
+            f'  {label}: {self.logins / elapsed:.1f}/s '
+            f'({elapsed / self.logins * 1000:.2f} ms each)'
+        )
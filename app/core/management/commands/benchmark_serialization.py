@@ -0,0 +1,115 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+
+from core import renderers
+from core.models import Tag, Ingredient, Recipe
+from recipe.serializers import RecipeSerializer, TagSerializer, \
+    IngredientSerializer
+
+
+class Rollback(Exception):
+    """Raised to undo the benchmark's data"""
+
+
+class Command(BaseCommand):
+    """Compare DRF's list serialization and JSON rendering with ours
+
+    Serializes the same prefetched recipes, tags and ingredients with a
+    plain ListSerializer and with the serializers' FastListSerializer,
+    then renders the result with the stdlib JSONRenderer and with
+    FastJSONRenderer. The data is made in a transaction that is rolled
+    back.
+    """
+    help = 'Benchmark list serialization and JSON rendering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=500,
+                            help='Recipes, tags and ingredients to make')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                self._benchmark(options['objects'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _benchmark(self, count):
+        user = get_user_model().objects.create_user(
+            email='benchmark@example.com', password='password'
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'Tag {n}') for n in range(count)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=f'Ingredient {n}')
+            for n in range(count)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(user=user, title=f'Recipe {n}', time_minutes=n,
+                   price='9.99')
+            for n in range(count)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe, tag in zip(recipes, tags)
+        )
+        Recipe.ingredients.through.objects.bulk_create(
+            Recipe.ingredients.through(
+                recipe_id=recipe.id, ingredient_id=ingredient.id
+            )
+            for recipe, ingredient in zip(recipes, ingredients)
+        )
+
+        # evaluated once, like the list views' querysets
+        cases = [
+            ('recipe', RecipeSerializer, list(
+                Recipe.objects.filter(user=user).defer(
+                    'search_vector'
+                ).prefetch_related(
+                    Prefetch('ingredients',
+                             queryset=Ingredient.objects.only('id')),
+                    Prefetch('tags', queryset=Tag.objects.only('id')),
+                )
+            )),
+            ('tag', TagSerializer, list(Tag.objects.filter(user=user))),
+            ('ingredient', IngredientSerializer,
+             list(Ingredient.objects.filter(user=user))),
+        ]
+        for label, serializer_class, objs in cases:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {label}'))
+            self._measure('ListSerializer', len(objs), lambda: ListSerializer(
+                objs, child=serializer_class()
+            ).data)
+            data = self._measure(
+                'FastListSerializer', len(objs),
+                lambda: serializer_class(objs, many=True).data
+            )
+            self._measure('JSONRenderer', len(objs),
+                          lambda: JSONRenderer().render(data))
+            name = 'FastJSONRenderer'
+            if renderers.orjson is None:
+                name += ' (orjson not installed)'
+            self._measure(name, len(objs),
+                          lambda: renderers.FastJSONRenderer().render(data))
+
+    def _measure(self, label, count, func):
+        """Run func repeat times, report objects per second, return data"""
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            result = func()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'  {label}: {count * self.repeat / elapsed:,.0f} objects/s'
+        )
+
+        return result
@@ -0,0 +1,157 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from core.models import Tag, Ingredient, Recipe
+from core.search import SEARCH_CONFIG
+from core.seed import seed_dataset
+
+from recipe import filters
+
+
+# Indexes added by the core migrations for the API lookups
+LOOKUP_INDEXES = (
+    'core_recipe_user_id_idx',
+    'core_recipe_tags_reverse_idx',
+    'core_recipe_ingredients_reverse_idx',
+    'core_recipe_search_idx',
+    'core_tag_name_prefix_idx',
+    'core_ingredient_name_prefix_idx',
+)
+
+
+class Command(BaseCommand):
+    """Show query plans of the API lookups with and without indexes
+
+    Everything runs in one transaction that is rolled back, the indexes
+    are only dropped inside it. Dropping takes exclusive locks, so don't
+    run this against a database that serves traffic.
+    """
+    help = 'Compare query plans of the per-user lookups before/after indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--ingredients', type=int, default=100)
+        parser.add_argument(
+            '--no-seed', action='store_true',
+            help='Use the existing data instead of seeding a data set'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._get_user(options)
+            with connection.cursor() as cursor:
+                # run the deferred foreign key checks of the seeded rows
+                # now, Postgres won't alter tables with pending triggers
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+                for model in (Tag, Ingredient, Recipe, Recipe.tags.through,
+                              Recipe.ingredients.through):
+                    cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+            after = self._explain_all(user)
+            sid = transaction.savepoint()
+            self._drop_indexes()
+            before = self._explain_all(user)
+            transaction.savepoint_rollback(sid)
+
+            for label in after:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'== {label}'))
+                self.stdout.write('-- before')
+                self.stdout.write(before[label])
+                self.stdout.write('-- after')
+                self.stdout.write(after[label])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('== Summary (ms)'))
+            for label in after:
+                self.stdout.write(
+                    f'{label:<40} before {_execution_ms(before[label]):>8} '
+                    f'after {_execution_ms(after[label]):>8}'
+                )
+
+            transaction.set_rollback(True)
+
+    def _get_user(self, options):
+        """Return the user whose lookups are explained"""
+        if not options['no_seed']:
+            self.stdout.write('Seeding data set...')
+            users = seed_dataset(
+                users=options['users'],
+                recipes=options['recipes'],
+                tags=options['tags'],
+                ingredients=options['ingredients'],
+            )
+            return users[0]
+
+        # the user with the most recipes is the interesting case
+        user_id = Recipe.objects.values('user').annotate(
+            n=Count('id')
+        ).order_by('-n').values_list('user', flat=True).first()
+        return Recipe.objects.filter(user_id=user_id).first().user
+
+    def _queries(self, user):
+        """Return the querysets the recipe API runs, by label"""
+        tag_ids = list(
+            Tag.objects.filter(user=user).values_list('id', flat=True)[:5]
+        )
+        return {
+            'tag list': Tag.objects.filter(
+                user=user
+            ).order_by('-name', 'id')[:100],
+            'ingredient list': Ingredient.objects.filter(
+                user=user
+            ).order_by('-name', 'id')[:100],
+            'tag prefix': Tag.objects.filter(
+                user=user, name__istartswith='tag 199'
+            ).order_by('-recipe_count', 'name', 'id')[:10],
+            'assigned tags': filters.filter_assigned(
+                Tag.objects.filter(user=user), 'tags'
+            ).order_by('-name', 'id'),
+            'recipe list': Recipe.objects.filter(
+                user=user
+            ).order_by('-id')[:100],
+            'recipes by any tag': filters.filter_linked(
+                Recipe.objects.filter(user=user), 'tags', tag_ids
+            ).order_by('-id')[:100],
+            'recipes by all tags': filters.filter_linked(
+                Recipe.objects.filter(user=user), 'tags', tag_ids[:2],
+                filters.MATCH_ALL
+            ).order_by('-id')[:100],
+            'recipe search': Recipe.objects.filter(
+                user=user,
+                search_vector=SearchQuery('ingredient', config=SEARCH_CONFIG)
+            ).order_by('-id')[:100],
+        }
+
+    def _explain_all(self, user):
+        return {
+            label: queryset.explain(analyze=True)
+            for label, queryset in self._queries(user).items()
+        }
+
+    def _drop_indexes(self):
+        """Drop the indexes and unique constraints the migrations added"""
+        with connection.cursor() as cursor:
+            for name in LOOKUP_INDEXES:
+                cursor.execute(f'DROP INDEX {name}')
+            for model in (Tag, Ingredient):
+                table = model._meta.db_table
+                constraints = connection.introspection.get_constraints(
+                    cursor, table
+                )
+                for name, info in constraints.items():
+                    if info['unique'] and info['columns'] == ['user_id',
+                                                              'name']:
+                        cursor.execute(
+                            f'ALTER TABLE {table} DROP CONSTRAINT {name}'
+                        )
+
+
+def _execution_ms(plan):
+    """Return the execution time reported by EXPLAIN ANALYZE"""
+    match = re.search(r'Execution Time: ([\d.]+) ms', plan)
+    return match.group(1) if match else '?'
@@ -0,0 +1,104 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+from django.db.backends.postgresql import base as plain_base
+
+from core.db.backends.postgresql_pool import base as pool_base
+
+
+class Command(BaseCommand):
+    """Compare connecting per request with the connection pool
+
+    Every simulated request connects, runs SELECT 1 and closes the
+    connection like Django does at the end of a request, from several
+    threads at once.
+    """
+    help = 'Load test database connections with and without the pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per thread')
+        parser.add_argument('--pool-size', type=int, default=4)
+        parser.add_argument('--mode', choices=('both', 'plain', 'pool'),
+                            default='both')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        settings_dict = dict(connections.databases[alias])
+        settings_dict['POOL'] = dict(
+            settings_dict.get('POOL', {}), max_size=options['pool_size']
+        )
+        # also keeps the test connections out of the application's pool
+        settings_dict['OPTIONS'] = dict(
+            settings_dict['OPTIONS'], application_name='load_test_db_pool'
+        )
+        runs = []
+        if options['mode'] in ('both', 'plain'):
+            runs.append(('plain', plain_base.DatabaseWrapper))
+        if options['mode'] in ('both', 'pool'):
+            runs.append(('pool', pool_base.DatabaseWrapper))
+
+        for label, wrapper_class in runs:
+            latencies, elapsed = self._run(
+                wrapper_class, settings_dict, alias,
+                options['threads'], options['requests']
+            )
+            self._report(label, latencies, elapsed)
+            if wrapper_class is pool_base.DatabaseWrapper:
+                pool = wrapper_class(settings_dict, alias).get_pool()
+                self.stdout.write(f'  pool stats: {pool.stats()}')
+                pool.closeall()
+
+    def _run(self, wrapper_class, settings_dict, alias, threads, requests):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            # Django gives every thread its own wrapper as well
+            wrapper = wrapper_class(settings_dict, alias)
+            mine = []
+            try:
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    wrapper.close()
+                    mine.append(time.perf_counter() - start)
+            except DatabaseError as exc:
+                errors.append(exc)
+            with lock:
+                latencies.extend(mine)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if errors:
+            raise CommandError(f'{len(errors)} threads failed: {errors[0]}')
+
+        return latencies, time.perf_counter() - start
+
+    def _report(self, label, latencies, elapsed):
+        latencies = sorted(latencies)
+
+        def percentile(p):
+            return latencies[int(p / 100 * (len(latencies) - 1))] * 1000
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {label}'))
+        self.stdout.write(
+            f'  {len(latencies)} requests in {elapsed:.2f}s '
+            f'({len(latencies) / elapsed:.0f}/s)'
+        )
+        self.stdout.write(
+            f'  latency ms: mean {statistics.mean(latencies) * 1000:.2f} '
+            f'p50 {percentile(50):.2f} p95 {percentile(95):.2f} '
+            f'p99 {percentile(99):.2f}'
+        )
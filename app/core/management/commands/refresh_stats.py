@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core import stats
+
+
+class Command(BaseCommand):
+    """Recompute the recipe statistics of every user or of some users
+
+    The statistics are kept up to date as recipes change. Run this
+    periodically to repair any drift, e.g. after changing rows outside
+    the application, and after changing the histogram buckets.
+    """
+    help = 'Recompute the recipe statistics summaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='*',
+                            help='Users to refresh, all by default')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['emails']:
+            users = users.filter(email__in=options['emails'])
+        count = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            # one transaction per user
+            stats.refresh_user(user_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed the statistics of {count} users'
+        ))
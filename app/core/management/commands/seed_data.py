@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.seed import SEED_PASSWORD, seed_dataset
+
+
+class Command(BaseCommand):
+    """Fill the database with users, tags, ingredients and recipes
+
+    The data is made by core.seed.seed_dataset, in one transaction per
+    --chunk users so large data sets don't build up one huge transaction.
+    The same --seed makes the same data, and every run adds new users.
+    """
+    help = 'Seed the database with sample data for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=100,
+                            help='Recipes per user')
+        parser.add_argument('--tags', type=int, default=20,
+                            help='Tags per user')
+        parser.add_argument('--ingredients', type=int, default=50,
+                            help='Ingredients per user')
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument('--chunk', type=int, default=50,
+                            help='Users seeded per transaction')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        seeded = 0
+        chunk = max(options['chunk'], 1)
+        while seeded < options['users']:
+            users = min(chunk, options['users'] - seeded)
+            seed_dataset(
+                users=users,
+                recipes=options['recipes'],
+                tags=options['tags'],
+                ingredients=options['ingredients'],
+                tags_per_recipe=options['tags_per_recipe'],
+                ingredients_per_recipe=options['ingredients_per_recipe'],
+                # a different but reproducible sample for every chunk
+                seed=options['seed'] + seeded,
+            )
+            seeded += users
+            self.stdout.write(f'  {seeded}/{options["users"]} users')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {seeded} users with {options["recipes"]} recipes each '
+            f'in {time.perf_counter() - start:.1f}s, '
+            f'password {SEED_PASSWORD!r}'
+        ))
@@ -1,23 +1,115 @@
 import time
 
-from django.db import connections
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     """Django command to pause execution untill database is available"""
+    help = 'Wait until the database accepts queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Seconds to wait in total before giving up'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0.1,
+            help='Seconds before the first retry, doubled every retry'
+        )
+        parser.add_argument('--max-interval', type=float, default=5)
+        parser.add_argument(
+            '--check-migrations', action='store_true',
+            help='Also wait until all migrations are applied'
+        )
+        parser.add_argument(
+            '--warm-pool', action='store_true',
+            help='Open the minimum number of pooled connections'
+        )
 
     # Handle function is ran whenever we run management command
     def handle(self, *args, **options):
         """Handle the command"""
+        self.options = options
+        self.deadline = time.monotonic() + options['timeout']
+        started = time.monotonic()
+
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
+        self._phase('connect', self._wait_for_connection)
+        self.stdout.write(self.style.SUCCESS('Database available!'))
+
+        if options['check_migrations']:
+            self._phase('migrations', self._wait_for_migrations)
+        if options['warm_pool']:
+            self._phase('warm pool', self._warm_pool)
+
+        self.stdout.write(f'Ready in {time.monotonic() - started:.3f}s')
+
+    def _phase(self, name, func):
+        """Run a phase and report how long it took"""
+        start = time.monotonic()
+        detail = func()
+        self.stdout.write(
+            f'  {name}: {time.monotonic() - start:.3f}s ({detail})'
+        )
+
+    def _retry(self, attempt, message):
+        """Sleep before the next attempt, fail once the timeout is up"""
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise CommandError(
+                f'{message} after {self.options["timeout"]}s, giving up'
+            )
+        delay = min(
+            self.options['interval'] * 2 ** attempt,
+            self.options['max_interval'],
+            remaining
+        )
+        self.stdout.write(f'{message}, waiting {delay:.2f} seconds...')
+        time.sleep(delay)
+
+    def _wait_for_connection(self):
+        """Run SELECT 1 until it succeeds"""
+        # Fetching a connection doesn't connect, only running a query
+        # shows the database accepts connections and queries
+        attempt = 0
+        while True:
+            db_conn = None
             try:
-                db_conn = connections['default']
+                db_conn = connections[self.options['database']]
+                with db_conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                return f'attempts: {attempt + 1}'
             except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                if db_conn is not None:
+                    # reconnect from scratch on the next attempt
+                    db_conn.close()
+                self._retry(attempt, 'Database unavailable')
+                attempt += 1
 
-        self.stdout.write(self.style.SUCCESS('Database available!'))
+    def _wait_for_migrations(self):
+        """Wait until no migration is left to apply"""
+        attempt = 0
+        while True:
+            executor = MigrationExecutor(
+                connections[self.options['database']]
+            )
+            plan = executor.migration_plan(
+                executor.loader.graph.leaf_nodes()
+            )
+            if not plan:
+                return 'all applied'
+            self._retry(attempt, f'{len(plan)} migrations not applied')
+            attempt += 1
+
+    def _warm_pool(self):
+        """Open the pool's minimum connections ahead of the first request"""
+        db_conn = connections[self.options['database']]
+        if not hasattr(db_conn, 'get_pool'):
+            return 'database is not pooled'
+        opened = db_conn.get_pool().warm()
+
+        return f'{opened} connections opened'
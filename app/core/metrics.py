@@ -0,0 +1,239 @@
+"""In-process request metrics in the Prometheus text format
+
+MetricsMiddleware records every request: latency, the number and time
+of the queries it ran, time spent serializing and rendering, and the
+response size, by view and action. The numbers are kept per process,
+so with several workers each scrape of /metrics sees one of them; the
+Prometheus server sums them up by instance.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace(
+            '"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(names, values)
+    )
+
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic count per label values"""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, labels), value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Counter):
+    """Cumulative bucket counts, sum and count per label values"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels, value):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = {
+                    'buckets': [0] * (len(self.buckets) + 1),
+                    'sum': 0.0,
+                    'count': 0,
+                }
+            # counted in the first bucket the value fits, made
+            # cumulative when exported; the last one is +Inf
+            state['buckets'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {
+                labels: dict(state, buckets=list(state['buckets']))
+                for labels, state in self._values.items()
+            }
+        names = self.labels + ('le',)
+        for labels, state in sorted(values.items()):
+            cumulative = 0
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, state['buckets']):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _format_labels(names, labels + (bound,)), cumulative)
+            yield (f'{self.name}_sum',
+                   _format_labels(self.labels, labels), state['sum'])
+            yield (f'{self.name}_count',
+                   _format_labels(self.labels, labels), state['count'])
+
+
+class Registry:
+    """The metrics exported by this process"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def export(self, extra=()):
+        """Return all metrics in the Prometheus text format"""
+        lines = []
+        for metric in list(self.metrics) + list(extra):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+ENDPOINT_LABELS = ('view', 'action', 'method')
+
+requests_total = REGISTRY.register(Counter(
+    'http_requests_total', 'Requests by view, action and status',
+    ENDPOINT_LABELS + ('status',)
+))
+request_seconds = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Request latency',
+    ENDPOINT_LABELS, LATENCY_BUCKETS
+))
+db_queries = REGISTRY.register(Histogram(
+    'http_request_db_queries', 'Database queries per request',
+    ENDPOINT_LABELS, QUERY_BUCKETS
+))
+db_seconds = REGISTRY.register(Histogram(
+    'http_request_db_seconds', 'Time per request spent in queries',
+    ENDPOINT_LABELS, LATENCY_BUCKETS
+))
+serializer_seconds = REGISTRY.register(Histogram(
+    'http_request_serializer_seconds',
+    'Time per request spent in serializer output',
+    ENDPOINT_LABELS, LATENCY_BUCKETS
+))
+render_seconds = REGISTRY.register(Histogram(
+    'http_request_render_seconds', 'Time per request spent rendering',
+    ENDPOINT_LABELS, LATENCY_BUCKETS
+))
+response_bytes = REGISTRY.register(Histogram(
+    'http_response_size_bytes', 'Response body size',
+    ENDPOINT_LABELS, SIZE_BUCKETS
+))
+
+
+class RequestMetrics:
+    """What one request spent its time on"""
+
+    def __init__(self, max_queries):
+        self.max_queries = max_queries
+        self.query_count = 0
+        self.query_seconds = 0.0
+        # (seconds, sql) of up to max_queries queries for the slow log
+        self.queries = []
+        self.timings = {}
+        self._running = set()
+
+    def record_query(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook timing every query"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_seconds += elapsed
+            if len(self.queries) < self.max_queries:
+                # the SQL with placeholders, parameters can be personal
+                self.queries.append((elapsed, sql))
+
+
+_local = threading.local()
+
+
+def start_request(max_queries):
+    """Start recording the metrics of the current thread's request"""
+    _local.current = RequestMetrics(max_queries)
+    return _local.current
+
+
+def end_request():
+    _local.current = None
+
+
+def current():
+    """Return the metrics of the current request, None outside one"""
+    return getattr(_local, 'current', None)
+
+
+@contextmanager
+def timed(name):
+    """Add the time the block takes to the request's timing name
+
+    Nested blocks of the same name, like a serializer calling another
+    one, are only counted once.
+    """
+    request_metrics = current()
+    if request_metrics is None or name in request_metrics._running:
+        yield
+        return
+    request_metrics._running.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics._running.discard(name)
+        request_metrics.timings[name] = request_metrics.timings.get(
+            name, 0.0
+        ) + time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    """Count the time taken by serializer.data as serializer time"""
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
@@ -0,0 +1,230 @@
+import gzip
+import io
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+
+from core import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger('core.metrics')
+
+
+def parse_accept_encoding(header):
+    """Return the q value of every coding in an Accept-Encoding header"""
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip().lower()] = q
+
+    return codings
+
+
+def gzip_compress(content):
+    buf = io.BytesIO()
+    # mtime=0 keeps the output of the same content the same
+    with gzip.GzipFile(mode='wb', fileobj=buf, mtime=0,
+                       compresslevel=settings.COMPRESSION_GZIP_LEVEL) as f:
+        f.write(content)
+
+    return buf.getvalue()
+
+
+def brotli_compress(content):
+    return brotli.compress(
+        content, quality=settings.COMPRESSION_BROTLI_QUALITY
+    )
+
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip, as the client prefers
+
+    Like Django's GZipMiddleware, with brotli when the brotli package is
+    installed, a configurable level and only for the content types in
+    COMPRESSION_CONTENT_TYPES. Bodies smaller than COMPRESSION_MIN_SIZE
+    cost more CPU to compress than they save on the network, and media
+    is either already compressed or streamed, so both are sent as they
+    are.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.compressors = [('gzip', gzip_compress)]
+        if brotli is not None:
+            # preferred when the client accepts both equally
+            self.compressors.insert(0, ('br', brotli_compress))
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.has_header('Content-Encoding') or
+                len(response.content) < settings.COMPRESSION_MIN_SIZE or
+                not self.compressible(response)):
+            return response
+
+        # the body differs by Accept-Encoding from here on
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding, compress = self.negotiate(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        if compress is None:
+            return response
+
+        compressed = compress(response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # a strong ETag promises the same bytes as the uncompressed body
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        return response
+
+    def compressible(self, response):
+        content_type = response.get('Content-Type', '').split(';')[0]
+
+        return content_type.strip().lower().startswith(
+            settings.COMPRESSION_CONTENT_TYPES
+        )
+
+    def negotiate(self, header):
+        """Return the (coding, compress function) to use, or (None, None)"""
+        accepted = parse_accept_encoding(header)
+        best, best_q = (None, None), 0.0
+        for coding, compress in self.compressors:
+            q = accepted.get(coding, accepted.get('*', 0.0))
+            if q > best_q:
+                best, best_q = (coding, compress), q
+
+        return best
+
+
+def view_labels(view_func, method):
+    """Return the (view, action) metric labels of a view function"""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return view_func.__module__ + '.' + view_func.__name__, ''
+    # the actions of a viewset route, by HTTP method
+    actions = getattr(view_func, 'actions', None) or {}
+
+    return cls.__name__, actions.get(method.lower(), '')
+
+
+class MetricsMiddleware:
+    """Record latency, queries, serializer time and size by endpoint
+
+    Every query of the request goes through an execute wrapper on each
+    database connection, which counts and times it. Requests slower than
+    SLOW_REQUEST_SECONDS are logged to the core.metrics logger with their
+    slowest statements. The metrics are served by core.views.metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        request_metrics = metrics.start_request(
+            settings.SLOW_REQUEST_MAX_QUERIES
+        )
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(
+                        conn.execute_wrapper(request_metrics.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.end_request()
+        elapsed = time.perf_counter() - start
+
+        self.observe(request, response, request_metrics, elapsed)
+        if elapsed >= settings.SLOW_REQUEST_SECONDS:
+            self.log_slow(request, response, request_metrics, elapsed)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_labels = view_labels(view_func, request.method)
+
+    def labels(self, request):
+        labels = getattr(request, 'metrics_labels', None)
+        if labels is None:
+            # answered before the view, like a 304 of
+            # ConditionalGetMiddleware, or not found
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                labels = ('unmatched', '')
+            else:
+                labels = view_labels(match.func, request.method)
+
+        return labels + (request.method,)
+
+    def observe(self, request, response, request_metrics, elapsed):
+        labels = self.labels(request)
+        metrics.requests_total.inc(labels + (str(response.status_code),))
+        metrics.request_seconds.observe(labels, elapsed)
+        metrics.db_queries.observe(labels, request_metrics.query_count)
+        metrics.db_seconds.observe(labels, request_metrics.query_seconds)
+        metrics.serializer_seconds.observe(
+            labels, request_metrics.timings.get('serializer', 0.0)
+        )
+        metrics.render_seconds.observe(
+            labels, request_metrics.timings.get('render', 0.0)
+        )
+        if response.has_header('Content-Length'):
+            metrics.response_bytes.observe(
+                labels, int(response['Content-Length'])
+            )
+        elif not response.streaming:
+            metrics.response_bytes.observe(labels, len(response.content))
+
+    def log_slow(self, request, response, request_metrics, elapsed):
+        view, action, method = self.labels(request)
+        slowest = sorted(request_metrics.queries, reverse=True)[
+            :settings.SLOW_REQUEST_LOG_QUERIES
+        ]
+        logger.warning(
+            'Slow request %s %s (%s%s) %s in %.3fs: %d queries in %.3fs, '
+            'serializer %.3fs, render %.3fs%s',
+            method, request.path, view, '.' + action if action else '',
+            response.status_code, elapsed, request_metrics.query_count,
+            request_metrics.query_seconds,
+            request_metrics.timings.get('serializer', 0.0),
+            request_metrics.timings.get('render', 0.0),
+            ''.join(
+                '\n  %.3fs %s' % (seconds, sql) for seconds, sql in slowest
+            ),
+            extra={
+                'view': view,
+                'action': action,
+                'duration': elapsed,
+                'queries': slowest,
+            }
+        )
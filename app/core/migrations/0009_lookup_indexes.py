@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+# The auto-created M2M tables only get single column indexes. These let
+# the reverse lookups (recipes of a tag, assigned_only) be answered
+# from the index alone.
+THROUGH_INDEXES = (
+    ('core_recipe_tags', 'tag_id'),
+    ('core_recipe_ingredients', 'ingredient_id'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_auto_20200602_0531'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='core_recipe_user_id_idx'),
+        ),
+    ] + [
+        migrations.RunSQL(
+            f'CREATE INDEX {table}_reverse_idx ON {table} ({column}, recipe_id)',
+            reverse_sql=f'DROP INDEX {table}_reverse_idx',
+        )
+        for table, column in THROUGH_INDEXES
+    ]
@@ -0,0 +1,58 @@
+import logging
+
+from django.db import migrations
+
+
+logger = logging.getLogger(__name__)
+
+
+def merge_duplicates(apps, schema_editor):
+    """Merge tags and ingredients sharing a user and name into one row
+
+    The merged rows are deleted, so this can't be reversed: 0011 makes
+    (user, name) unique and the duplicates can't come back.
+    """
+    Recipe = apps.get_model('core', 'Recipe')
+    for field_name in ('tags', 'ingredients'):
+        field = Recipe._meta.get_field(field_name)
+        model = field.related_model
+        table = model._meta.db_table
+        through = field.remote_field.through._meta.db_table
+        column = field.m2m_reverse_name()
+        # the lowest id of each (user, name) group survives
+        dups = (
+            f'SELECT id, keep FROM ('
+            f'SELECT id, MIN(id) OVER (PARTITION BY user_id, name) AS keep '
+            f'FROM {table}) AS groups WHERE id <> keep'
+        )
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {through} (recipe_id, {column}) '
+                f'SELECT DISTINCT t.recipe_id, d.keep FROM {through} t '
+                f'JOIN ({dups}) AS d ON t.{column} = d.id '
+                f'ON CONFLICT DO NOTHING'
+            )
+            cursor.execute(
+                f'DELETE FROM {through} WHERE {column} IN '
+                f'(SELECT id FROM ({dups}) AS d)'
+            )
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN (SELECT id FROM ({dups}) AS d)'
+            )
+            if cursor.rowcount:
+                logger.warning(
+                    'Merged %d duplicate %s into the first with their name',
+                    cursor.rowcount, field_name
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_lookup_indexes'),
+    ]
+
+    operations = [
+        # no reverse, migrating back raises IrreversibleError
+        migrations.RunPython(merge_duplicates),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+# Prefix autocomplete filters on UPPER(name) LIKE 'PREFIX%', which only
+# a text_pattern_ops index can serve outside the C locale. Django can't
+# declare expression indexes on the models.
+PREFIX_INDEXES = ('core_tag', 'core_ingredient')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recipe_stats'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f'CREATE INDEX {table}_name_prefix_idx ON {table} '
+            f'(user_id, UPPER(name) text_pattern_ops)',
+            reverse_sql=f'DROP INDEX {table}_name_prefix_idx',
+        )
+        for table in PREFIX_INDEXES
+    ]
@@ -1,7 +1,13 @@
+import hashlib
+import threading
 import uuid
 import os
+from contextlib import contextmanager
 
-from django.db import models
+from django.db import models, transaction
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 
@@ -13,14 +19,61 @@ from django.conf import settings
 def recipe_image_file_path(instance, filename):
     """Generate file path for new recipe image"""
     ext = filename.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{ext}'
+    image = getattr(instance, 'image', None)
+    if image and not image._committed:
+        # Named after the content, so the file at a URL never changes
+        # and can be cached forever (see core.views.serve_media)
+        filename = f'{_content_hash(image)}.{ext}'
+    else:
+        filename = f'{uuid.uuid4()}.{ext}'
 
     return os.path.join('uploads/recipe/', filename)
 
 
+def _content_hash(file):
+    """Return a hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+
+    return digest.hexdigest()[:32]
+
+
+# Users being deleted by the current thread. Their objects are deleted
+# along with them and need no tombstones or statistics, see core.signals
+_deleting = threading.local()
+
+
+@contextmanager
+def deleting_users(pks):
+    """Mark users as being deleted by this thread for the block"""
+    pks = set(pks)
+    users = _deleting.__dict__.setdefault('users', set())
+    pks -= users
+    users |= pks
+    try:
+        yield
+    finally:
+        # also when the delete fails and is rolled back
+        users -= pks
+
+
+def is_deleting_user(user_id):
+    """Return if the current thread is deleting the user"""
+    return user_id in getattr(_deleting, 'users', ())
+
+
+class UserQuerySet(models.QuerySet):
+
+    def delete(self):
+        with deleting_users(self.values_list('pk', flat=True)):
+            return super().delete()
+
+
 # manager class that provide the helper functions for creating
 # a user or superuser
-class UserManager(BaseUserManager):
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
 
     def create_user(self, email, password=None, **extra_fields):
         """Creates and saves a new user"""
@@ -56,6 +109,10 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
+    def delete(self, *args, **kwargs):
+        with deleting_users([self.pk]):
+            return super().delete(*args, **kwargs)
+
 
 class Tag(models.Model):
     """Tag to be used for a recipe"""
@@ -64,6 +121,26 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # change version of the last write, maintained by core.signals
+    version = models.BigIntegerField(default=0, editable=False)
+    # recipes linked to the tag, maintained by core.stats
+    recipe_count = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        # The unique index on (user, name) also serves the per-user
+        # listing, which is always filtered by user and ordered by name
+        unique_together = (('user', 'name'),)
+        indexes = [
+            # delta sync reads the changes of a user since a version
+            models.Index(
+                fields=['user', 'version'], name='core_tag_user_version_idx'
+            ),
+            # the most used tags of a user, for the recipe stats
+            models.Index(
+                fields=['user', '-recipe_count'],
+                name='core_tag_user_count_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -76,6 +153,21 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    version = models.BigIntegerField(default=0, editable=False)
+    recipe_count = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        unique_together = (('user', 'name'),)
+        indexes = [
+            models.Index(
+                fields=['user', 'version'],
+                name='core_ingredient_user_ver_idx'
+            ),
+            models.Index(
+                fields=['user', '-recipe_count'],
+                name='core_ingredient_user_cnt_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -83,6 +175,15 @@ class Ingredient(models.Model):
 
 class Recipe(models.Model):
     """Recipe object"""
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = (
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    )
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
@@ -94,6 +195,110 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # progress of the resized renditions of image, made by recipe.images
+    image_status = models.CharField(
+        max_length=10, choices=IMAGE_STATUS_CHOICES, blank=True
+    )
+    # {name: {'width': w, 'height': h, 'jpeg': path, 'webp': path}}
+    image_renditions = JSONField(default=dict, blank=True)
+    # title, ingredient and tag names, maintained by core.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+    # bumped when the recipe or its links change
+    version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # recipes are listed per user, newest first
+            models.Index(
+                fields=['user', '-id'], name='core_recipe_user_id_idx'
+            ),
+            GinIndex(fields=['search_vector'], name='core_recipe_search_idx'),
+            models.Index(
+                fields=['user', 'version'],
+                name='core_recipe_user_version_idx'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # post_save applies the statistics delta, it must commit with the
+        # row for core.stats to order it against a recompute
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
+
+
+class ChangeCounter(models.Model):
+    """Last change version given to a user's recipes, tags or ingredients
+
+    Incremented with an upsert by core.sync, whose row lock orders the
+    versions of concurrent writers of a user by commit.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    version = models.BigIntegerField(default=0)
+
+
+class Tombstone(models.Model):
+    """Deleted recipe, tag or ingredient, for delta sync"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    # model_name of the deleted object's model
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    version = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'version'],
+                name='core_tombstone_user_ver_idx'
+            ),
+        ]
+
+
+class RecipeStats(models.Model):
+    """Summary of a user's recipes, maintained by core.stats
+
+    The histograms count recipes per bucket of core.stats.TIME_BUCKETS
+    and PRICE_BUCKETS.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    recipe_count = models.IntegerField(default=0)
+    time_minutes_total = models.BigIntegerField(default=0)
+    price_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+    time_histogram = ArrayField(models.IntegerField(), default=list)
+    price_histogram = ArrayField(models.IntegerField(), default=list)
+
+
+class UploadSession(models.Model):
+    """Resumable upload of a recipe image, see recipe.uploads
+
+    Kept in the database so any worker can take the next chunk, the
+    bytes received so far are in a file of RECIPE_UPLOAD_SESSION_DIR.
+    """
+    # uuid4 hex, also the name of the file
+    id = models.CharField(max_length=32, primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    filename = models.CharField(max_length=100)
+    expires = models.DateTimeField(db_index=True)
+    # set while a request writes a chunk
+    locked_until = models.DateTimeField(null=True)
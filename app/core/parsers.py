@@ -0,0 +1,39 @@
+from django.conf import settings
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils import json
+
+from core.renderers import FastJSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    """JSON parser that uses orjson when it is installed
+
+    The body is read at once instead of through a decoding stream
+    reader. orjson only reads UTF-8 and rejects NaN and Infinity, other
+    encodings and non-strict parsing use the stdlib.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        body = stream.read() if stream is not None else b''
+
+        try:
+            if (orjson is not None and self.strict and
+                    encoding.lower() in ('utf-8', 'utf8')):
+                return orjson.loads(body)
+            parse_constant = json.strict_constant if self.strict else None
+            return json.loads(
+                body.decode(encoding), parse_constant=parse_constant
+            )
+        except ValueError as exc:
+            # orjson.JSONDecodeError and UnicodeDecodeError are ValueErrors
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,48 @@
+"""Maintain the full-text search vectors of recipes"""
+from django.db import connection
+
+from core.models import Recipe
+
+
+# Text search configuration used for indexing and for queries
+SEARCH_CONFIG = 'english'
+
+# Title matches weigh most, then ingredient names, then tag names
+UPDATE_SQL = """
+UPDATE core_recipe AS r SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, r.title), 'A')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(i.name, ' ')
+        FROM core_ingredient i
+        JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = r.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(t.name, ' ')
+        FROM core_tag t
+        JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = r.id
+    ), '')), 'C')
+WHERE r.id = ANY(%(ids)s)
+"""
+
+
+def update_search_vectors(recipe_ids):
+    """Recompute the search vector of the given recipes in one query"""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPDATE_SQL, {'config': SEARCH_CONFIG, 'ids': recipe_ids}
+        )
+
+
+def linked_recipe_ids(field_name, target_id):
+    """Return ids of recipes linked to a tag or ingredient"""
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+
+    return list(through.objects.filter(
+        **{field.m2m_reverse_name(): target_id}
+    ).values_list('recipe_id', flat=True))
@@ -0,0 +1,97 @@
+"""Generate sample data sets for benchmarks"""
+import random
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from core import stats
+from core.models import Tag, Ingredient, Recipe
+from core.signals import bulk_changed
+
+
+BATCH_SIZE = 2000
+SEED_PASSWORD = 'seedpass123'
+# seeded users' emails start with it
+SEED_EMAIL_PREFIX = 'seed-'
+
+
+@transaction.atomic
+def seed_dataset(users=10, recipes=100, tags=20, ingredients=50,
+                 tags_per_recipe=3, ingredients_per_recipe=6, seed=0):
+    """Create users, each with their own tags, ingredients and recipes
+
+    Every user can log in with SEED_PASSWORD. Returns the created users.
+    """
+    rng = random.Random(seed)
+    run = uuid.uuid4().hex[:8]
+    # hashing is deliberately slow, hash once and share the result
+    password = make_password(SEED_PASSWORD)
+
+    created_users = get_user_model().objects.bulk_create(
+        [
+            get_user_model()(
+                email=f'{SEED_EMAIL_PREFIX}{run}-{i}@example.com',
+                name=f'Seed user {i}',
+                password=password,
+            )
+            for i in range(users)
+        ],
+        batch_size=BATCH_SIZE
+    )
+
+    for user in created_users:
+        user_tags = Tag.objects.bulk_create(
+            [Tag(user=user, name=f'Tag {i}') for i in range(tags)],
+            batch_size=BATCH_SIZE
+        )
+        user_ingredients = Ingredient.objects.bulk_create(
+            [
+                Ingredient(user=user, name=f'Ingredient {i}')
+                for i in range(ingredients)
+            ],
+            batch_size=BATCH_SIZE
+        )
+        user_recipes = Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    user=user,
+                    title=f'Recipe {i}',
+                    time_minutes=rng.randint(5, 180),
+                    price=Decimal(rng.randint(100, 9999)) / 100,
+                )
+                for i in range(recipes)
+            ],
+            batch_size=BATCH_SIZE
+        )
+        _link(Recipe.tags.through, 'tag_id', user_recipes, user_tags,
+              tags_per_recipe, rng)
+        _link(Recipe.ingredients.through, 'ingredient_id', user_recipes,
+              user_ingredients, ingredients_per_recipe, rng)
+        # bulk_create doesn't send the per-object signals, like the bulk
+        # API this stamps versions and fills search vectors and counts
+        for model, objects in ((Tag, user_tags),
+                               (Ingredient, user_ingredients),
+                               (Recipe, user_recipes)):
+            bulk_changed.send(
+                sender=model, user_id=user.pk, action='create',
+                ids=[obj.pk for obj in objects],
+                recipe_ids=[obj.pk for obj in user_recipes]
+                if model is Recipe else []
+            )
+        stats.refresh_user(user.pk)
+
+    return created_users
+
+
+def _link(through, column, recipes, targets, per_recipe, rng):
+    """Attach a random sample of targets to every recipe"""
+    per_recipe = min(per_recipe, len(targets))
+    rows = [
+        through(recipe_id=recipe.id, **{column: target.id})
+        for recipe in recipes
+        for target in rng.sample(targets, per_recipe)
+    ]
+    through.objects.bulk_create(rows, batch_size=BATCH_SIZE)
@@ -0,0 +1,212 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, \
+    post_delete, m2m_changed
+from django.dispatch import receiver, Signal
+
+from core import search, stats, sync
+from core.models import Tag, Ingredient, Recipe, is_deleting_user
+
+
+# Recipe field each tag/ingredient model is linked through
+RECIPE_FIELDS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+# Sent by bulk operations, which bypass the per-object model signals.
+# The sender is the model, action is 'create', 'update' or 'delete',
+# ids are the objects that action was applied to and recipe_ids the
+# recipes whose text or links changed as a result. It is sent inside
+# the bulk operation's transaction.
+bulk_changed = Signal(
+    providing_args=['user_id', 'action', 'ids', 'recipe_ids']
+)
+
+
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(sender, instance, created, update_fields, **kwargs):
+    """Update the search vector of a recipe whose title may have changed"""
+    if created or update_fields is None or 'title' in update_fields:
+        search.update_search_vectors([instance.pk])
+
+
+def _relinked(user_id, recipe_ids):
+    """Update recipes whose tags or ingredients changed"""
+    search.update_search_vectors(recipe_ids)
+    sync.mark_changed(Recipe, user_id, recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def index_relinked_recipes(sender, instance, action, reverse, model,
+                           pk_set, **kwargs):
+    """Update search vectors and versions when recipe links change"""
+    if not reverse:
+        # recipe.tags.add(...) etc, only this recipe changed
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _relinked(instance.user_id, [instance.pk])
+        return
+
+    # tag.recipe_set.add(...) etc, pk_set holds the recipes
+    if action == 'pre_clear':
+        # the links are gone by post_clear, remember them now
+        instance._search_recipe_ids = search.linked_recipe_ids(
+            RECIPE_FIELDS[type(instance)], instance.pk
+        )
+    elif action in ('post_add', 'post_remove'):
+        _relinked(instance.user_id, pk_set)
+    elif action == 'post_clear':
+        _relinked(instance.user_id, instance._search_recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def index_renamed_target(sender, instance, created, **kwargs):
+    """Update recipes using a tag or ingredient that was renamed"""
+    if not created:
+        search.update_search_vectors(
+            search.linked_recipe_ids(RECIPE_FIELDS[sender], instance.pk)
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_deleted_target_recipes(sender, instance, **kwargs):
+    """Remember the recipes of a tag or ingredient about to be deleted"""
+    instance._search_recipe_ids = search.linked_recipe_ids(
+        RECIPE_FIELDS[sender], instance.pk
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def index_deleted_target_recipes(sender, instance, **kwargs):
+    """Update recipes that used a deleted tag or ingredient"""
+    if is_deleting_user(instance.user_id):
+        # their recipes are going as well
+        return
+    _relinked(instance.user_id, getattr(instance, '_search_recipe_ids', ()))
+
+
+@receiver(bulk_changed)
+def index_bulk_changed_recipes(sender, action, recipe_ids, **kwargs):
+    """Update search vectors of recipes changed by a bulk operation"""
+    if sender is Recipe and action == 'delete':
+        return
+    search.update_search_vectors(recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+def version_saved(sender, instance, **kwargs):
+    """Give a created or changed object a new change version"""
+    sync.mark_changed(sender, instance.user_id, [instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def tombstone_deleted(sender, instance, **kwargs):
+    """Leave a tombstone for a deleted object"""
+    # a deleted user needs no tombstones, they would reference it
+    if not is_deleting_user(instance.user_id):
+        sync.mark_deleted(sender, instance.user_id, [instance.pk])
+
+
+@receiver(bulk_changed)
+def version_bulk_changed(sender, user_id, action, ids, recipe_ids,
+                         **kwargs):
+    """Give objects changed by a bulk operation a new change version"""
+    if action == 'delete':
+        sync.mark_deleted(sender, user_id, ids)
+        if sender is not Recipe:
+            # the links to the deleted objects are gone
+            sync.mark_changed(Recipe, user_id, recipe_ids)
+    else:
+        # renaming a tag or ingredient doesn't change the recipes,
+        # they only show its id
+        sync.mark_changed(sender, user_id, ids)
+
+
+# Recipe fields the statistics are made of
+STATS_FIELDS = ('time_minutes', 'price')
+
+
+def _stats_values(instance):
+    return instance.time_minutes, instance.price
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_stats(sender, instance, update_fields, **kwargs):
+    """Remember the statistics fields of a recipe about to be changed"""
+    instance._stats_old = None
+    if instance._state.adding or (
+            update_fields is not None and
+            not set(STATS_FIELDS) & set(update_fields)):
+        return
+    instance._stats_old = Recipe.objects.filter(pk=instance.pk).values_list(
+        *STATS_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_saved_recipe(sender, instance, created, **kwargs):
+    """Apply a created or changed recipe to its user's statistics"""
+    if created:
+        stats.apply_delta(instance.user_id, [_stats_values(instance)], 1)
+        return
+    old = getattr(instance, '_stats_old', None)
+    if old is not None and old != _stats_values(instance):
+        stats.apply_delta(instance.user_id, [old], -1)
+        stats.apply_delta(instance.user_id, [_stats_values(instance)], 1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_deleted_recipe_stats(sender, instance, **kwargs):
+    """Remember the statistics and links of a recipe about to be deleted"""
+    if is_deleting_user(instance.user_id):
+        return
+    instance._stats_values = _stats_values(instance)
+    instance._stats_links = {
+        model: list(getattr(instance, field).values_list('pk', flat=True))
+        for model, field in RECIPE_FIELDS.items()
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    """Take a deleted recipe out of its user's statistics"""
+    if not hasattr(instance, '_stats_values'):
+        return
+    stats.apply_delta(instance.user_id, [instance._stats_values], -1)
+    for model, ids in instance._stats_links.items():
+        stats.refresh_link_counts(model, ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_relinked(sender, instance, action, reverse, model, pk_set,
+                   **kwargs):
+    """Recount the recipes of tags or ingredients linked or unlinked"""
+    if reverse:
+        # tag.recipe_set.add(...) etc, only this tag changed
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            stats.refresh_link_counts(type(instance), [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        stats.refresh_link_counts(model, pk_set)
+    elif action == 'pre_clear':
+        # the links are gone by post_clear, remember them now
+        instance._stats_cleared = list(getattr(
+            instance, RECIPE_FIELDS[model]
+        ).values_list('pk', flat=True))
+    elif action == 'post_clear':
+        stats.refresh_link_counts(model, instance._stats_cleared)
+
+
+@receiver(bulk_changed)
+def count_bulk_changed(sender, user_id, action, **kwargs):
+    """Recompute statistics changed by a bulk operation of recipes"""
+    if sender is not Recipe:
+        # new tags and ingredients start unlinked, deleted ones are gone
+        return
+    # the old values are gone, the summary is computed again when read
+    stats.invalidate_user(user_id)
+    for model in RECIPE_FIELDS:
+        stats.refresh_link_counts(model, user_id=user_id)
@@ -0,0 +1,201 @@
+"""Per-user recipe statistics, kept up to date as recipes change
+
+Every tag and ingredient counts the recipes it is linked to, and every
+user has a RecipeStats row with the number of recipes, the totals of
+their times and prices and histograms of both. core.signals applies
+each change to them as a delta, so a dashboard reads a few rows
+instead of aggregating all the recipes. Changes whose delta isn't
+known, like bulk deletes, drop the user's row instead, and it is
+computed again in full by the next read or by the refresh_stats
+command.
+
+A recompute and the deltas of recipes written meanwhile take the same
+per-user lock, so the recompute either sees a recipe or inserts the row
+before its delta is applied, never neither.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from core.models import Tag, Ingredient, Recipe, RecipeStats
+
+
+# Upper bounds of the histogram buckets, the last bucket has none.
+# Changing them needs a refresh_stats run, rows with another number of
+# buckets are recomputed when read until then.
+TIME_BUCKETS = (15, 30, 60, 120)
+PRICE_BUCKETS = (
+    Decimal('5.00'), Decimal('10.00'), Decimal('20.00'), Decimal('50.00'),
+)
+
+LINK_COUNT_SQL = """
+UPDATE {table} AS t SET recipe_count = (
+    SELECT COUNT(*) FROM {through} WHERE {column} = t.id
+)
+WHERE {where}
+"""
+
+DELTA_SQL = """
+UPDATE core_recipestats SET
+    recipe_count = recipe_count + %(count)s,
+    time_minutes_total = time_minutes_total + %(time_minutes)s,
+    price_total = price_total + %(price)s,
+    time_histogram = (
+        SELECT array_agg(a + b ORDER BY n)
+        FROM unnest(time_histogram, %(time_histogram)s::integer[])
+        WITH ORDINALITY AS d(a, b, n)
+    ),
+    price_histogram = (
+        SELECT array_agg(a + b ORDER BY n)
+        FROM unnest(price_histogram, %(price_histogram)s::integer[])
+        WITH ORDINALITY AS d(a, b, n)
+    )
+WHERE user_id = %(user_id)s
+"""
+
+# first key of the advisory locks of lock_user, the user id is the second
+LOCK_NAMESPACE = 1
+LOCK_SQL = 'SELECT pg_advisory_xact_lock(%s, %s)'
+
+
+def bucket(bounds, value):
+    """Return the index of the histogram bucket of a value"""
+    for n, bound in enumerate(bounds):
+        if value < bound:
+            return n
+
+    return len(bounds)
+
+
+def lock_user(user_id):
+    """Wait for other changes of a user's summary, until the commit"""
+    with connection.cursor() as cursor:
+        cursor.execute(LOCK_SQL, [LOCK_NAMESPACE, user_id])
+
+
+def refresh_link_counts(model, ids=None, user_id=None):
+    """Recount the recipes of tags or ingredients, by ids or of a user"""
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return
+        where, params = 't.id = ANY(%s)', [ids]
+    else:
+        where, params = 't.user_id = %s', [user_id]
+    field = next(
+        field for field in Recipe._meta.many_to_many
+        if field.related_model is model
+    )
+    sql = LINK_COUNT_SQL.format(
+        table=model._meta.db_table,
+        through=field.remote_field.through._meta.db_table,
+        column=field.m2m_reverse_name(),
+        where=where,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def apply_delta(user_id, values, sign):
+    """Add (sign=1) or remove (-1) recipes' (time_minutes, price)"""
+    values = list(values)
+    if not values:
+        return
+    time_histogram = [0] * (len(TIME_BUCKETS) + 1)
+    price_histogram = [0] * (len(PRICE_BUCKETS) + 1)
+    values = [
+        (time_minutes, Decimal(str(price))) for time_minutes, price in values
+    ]
+    for time_minutes, price in values:
+        time_histogram[bucket(TIME_BUCKETS, time_minutes)] += sign
+        price_histogram[bucket(PRICE_BUCKETS, price)] += sign
+    # within the transaction that wrote the recipes, see Recipe.save
+    with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+        lock_user(user_id)
+        # a user without a row has it computed on the next read
+        cursor.execute(DELTA_SQL, {
+            'user_id': user_id,
+            'count': sign * len(values),
+            'time_minutes': sign * sum(value[0] for value in values),
+            'price': sign * sum(value[1] for value in values),
+            'time_histogram': time_histogram,
+            'price_histogram': price_histogram,
+        })
+
+
+def invalidate_user(user_id):
+    """Drop a user's summary, to be computed again on the next read"""
+    with transaction.atomic(savepoint=False):
+        lock_user(user_id)
+        RecipeStats.objects.filter(user_id=user_id).delete()
+
+
+def _histogram_aggregates(field, bounds):
+    aggregates = {}
+    lower = None
+    for n in range(len(bounds) + 1):
+        condition = Q()
+        if lower is not None:
+            condition &= Q(**{f'{field}__gte': lower})
+        if n < len(bounds):
+            condition &= Q(**{f'{field}__lt': bounds[n]})
+            lower = bounds[n]
+        aggregates[f'{field}_{n}'] = Count('id', filter=condition)
+
+    return aggregates
+
+
+@transaction.atomic
+def refresh_user(user_id):
+    """Compute a user's summary and link counts from all their recipes"""
+    # read committed: the aggregate sees what writers holding it committed
+    lock_user(user_id)
+    totals = Recipe.objects.filter(user_id=user_id).aggregate(
+        recipe_count=Count('id'),
+        time_minutes_total=Sum('time_minutes'),
+        price_total=Sum('price'),
+        **_histogram_aggregates('time_minutes', TIME_BUCKETS),
+        **_histogram_aggregates('price', PRICE_BUCKETS)
+    )
+    stats, _ = RecipeStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'recipe_count': totals['recipe_count'],
+            'time_minutes_total': totals['time_minutes_total'] or 0,
+            'price_total': totals['price_total'] or 0,
+            'time_histogram': [
+                totals[f'time_minutes_{n}']
+                for n in range(len(TIME_BUCKETS) + 1)
+            ],
+            'price_histogram': [
+                totals[f'price_{n}'] for n in range(len(PRICE_BUCKETS) + 1)
+            ],
+        }
+    )
+    for model in (Tag, Ingredient):
+        refresh_link_counts(model, user_id=user_id)
+
+    return stats
+
+
+def get_stats(user_id):
+    """Return a user's RecipeStats, computing it when it is missing"""
+    stats = RecipeStats.objects.filter(user_id=user_id).first()
+    if (stats is None or
+            len(stats.time_histogram) != len(TIME_BUCKETS) + 1 or
+            len(stats.price_histogram) != len(PRICE_BUCKETS) + 1):
+        stats = refresh_user(user_id)
+
+    return stats
+
+
+def histogram(bounds, counts):
+    """Return histogram counts as a list of {min, max, count} buckets"""
+    lowers = (None,) + tuple(bounds)
+    uppers = tuple(bounds) + (None,)
+
+    return [
+        {'min': lower, 'max': upper, 'count': count}
+        for lower, upper, count in zip(lowers, uppers, counts)
+    ]
@@ -0,0 +1,67 @@
+"""Change versions of recipes, tags and ingredients for delta sync
+
+Every change of a user's data takes the next version from the user's
+ChangeCounter and stamps it on the changed rows, deleted objects get a
+Tombstone with it instead. A client that synced up to version N asks
+for the rows and tombstones above N.
+"""
+from django.db import connection, transaction
+
+from core.models import ChangeCounter, Tombstone
+
+
+NEXT_VERSION_SQL = """
+INSERT INTO core_changecounter (user_id, version) VALUES (%s, 1)
+ON CONFLICT (user_id)
+DO UPDATE SET version = core_changecounter.version + 1
+RETURNING version
+"""
+
+
+def next_version(user_id):
+    """Increment the change version of a user and return it
+
+    The counter row stays locked until the transaction ends, so
+    concurrent changes of a user commit in version order and a reader
+    never sees a version before the rows stamped with it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(NEXT_VERSION_SQL, [user_id])
+        return cursor.fetchone()[0]
+
+
+def current_version(user_id):
+    """Return the last committed change version of a user"""
+    return ChangeCounter.objects.filter(user_id=user_id).values_list(
+        'version', flat=True
+    ).first() or 0
+
+
+def mark_changed(model, user_id, ids):
+    """Stamp objects of a user with a new change version"""
+    ids = list(ids)
+    if not ids:
+        return
+    # the counter and the rows commit together
+    with transaction.atomic():
+        model.objects.filter(pk__in=ids).update(
+            version=next_version(user_id)
+        )
+
+
+def mark_deleted(model, user_id, ids):
+    """Leave tombstones for deleted objects of a user"""
+    ids = list(ids)
+    if not ids:
+        return
+    with transaction.atomic():
+        version = next_version(user_id)
+        Tombstone.objects.bulk_create(
+            Tombstone(
+                user_id=user_id,
+                model=model._meta.model_name,
+                object_id=pk,
+                version=version
+            )
+            for pk in ids
+        )
@@ -1,8 +1,17 @@
-from unittest.mock import patch
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import MagicMock, patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+
+from core import seed
+from core.models import Tag, Ingredient, Recipe, RecipeStats
 
 
 class CommandTests(TestCase):
@@ -11,14 +20,208 @@ class CommandTests(TestCase):
     def test_wait_for_db_ready(self):
         """Test waiting for db when db is available"""
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
+            db_conn = MagicMock()
+            gi.return_value = db_conn
+            call_command('wait_for_db', stdout=StringIO())
             self.assertEqual(gi.call_count, 1)
+            # a query actually ran on the connection
+            cursor = db_conn.cursor.return_value.__enter__.return_value
+            cursor.execute.assert_called_once_with('SELECT 1')
 
     @patch('time.sleep', return_value=None)
     def test_wait_for_db(self, ts):
         """Test waiting for db"""
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
+            gi.side_effect = [OperationalError] * 5 + [MagicMock()]
+            call_command('wait_for_db', stdout=StringIO())
             self.assertEqual(gi.call_count, 6)
+
+    @patch('time.sleep', return_value=None)
+    def test_wait_for_db_query_fails(self, ts):
+        """Test a connection that can't run queries isn't available"""
+        db_conn = MagicMock()
+        db_conn.cursor.side_effect = [OperationalError] * 2 + [MagicMock()]
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.return_value = db_conn
+            call_command('wait_for_db', stdout=StringIO())
+
+        self.assertEqual(db_conn.cursor.call_count, 3)
+        # the broken connection is dropped before retrying
+        self.assertEqual(db_conn.close.call_count, 2)
+
+    @patch('time.sleep', return_value=None)
+    def test_wait_for_db_backoff(self, ts):
+        """Test the wait doubles after every attempt up to a maximum"""
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.side_effect = [OperationalError] * 5 + [MagicMock()]
+            call_command('wait_for_db', interval=1, max_interval=5,
+                         stdout=StringIO())
+
+        delays = [c[0][0] for c in ts.call_args_list]
+        self.assertEqual(delays, [1, 2, 4, 5, 5])
+
+    @patch('time.sleep', return_value=None)
+    def test_wait_for_db_timeout(self, ts):
+        """Test the command fails once the timeout is up"""
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=0, stdout=StringIO())
+
+    def test_wait_for_db_phases(self):
+        """Test migrations and the pool are checked and timed"""
+        out = StringIO()
+
+        call_command('wait_for_db', check_migrations=True, warm_pool=True,
+                     stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('connect:', output)
+        self.assertIn('migrations:', output)
+        self.assertIn('all applied', output)
+        self.assertIn('warm pool:', output)
+
+
+class ExplainLookupsCommandTests(TestCase):
+
+    def test_explain_lookups(self):
+        """Test query plans are shown before and after the indexes"""
+        out = StringIO()
+        call_command(
+            'explain_lookups', users=2, recipes=5, tags=3, ingredients=3,
+            stdout=out
+        )
+
+        output = out.getvalue()
+        self.assertIn('== recipe list', output)
+        self.assertIn('-- before', output)
+        self.assertIn('-- after', output)
+        self.assertIn('== Summary', output)
+        # the seeded data set is rolled back
+        self.assertFalse(Recipe.objects.exists())
+
+
+class LoadTestDbPoolCommandTests(TestCase):
+
+    def test_load_test_db_pool(self):
+        """Test the pool load test reports both modes"""
+        out = StringIO()
+
+        call_command('load_test_db_pool', threads=2, requests=3,
+                     pool_size=1, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('== plain', output)
+        self.assertIn('== pool', output)
+        self.assertIn("'connects': 1", output)
+
+
+class BenchmarkLoginCommandTests(TestCase):
+
+    def test_benchmark_login(self):
+        """Test the login benchmark reports hashers and the endpoint"""
+        out = StringIO()
+
+        call_command('benchmark_login', logins=2, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('pbkdf2_sha256:', output)
+        self.assertIn('allowed (200)', output)
+        self.assertIn('throttled (429)', output)
+        # the benchmark user is rolled back
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class BenchmarkSerializationCommandTests(TestCase):
+
+    def test_benchmark_serialization(self):
+        """Test the serialization benchmark reports every case"""
+        out = StringIO()
+
+        call_command('benchmark_serialization', objects=3, repeat=1,
+                     stdout=out)
+
+        output = out.getvalue()
+        for label in ('== recipe', '== tag', '== ingredient',
+                      'FastListSerializer:', 'JSONRenderer:'):
+            self.assertIn(label, output)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class SeedDataCommandTests(TestCase):
+
+    def test_seed_data(self):
+        """Test seeding makes data for every user, chunk by chunk"""
+        out = StringIO()
+
+        call_command('seed_data', users=3, recipes=4, tags=2, ingredients=3,
+                     chunk=2, stdout=out)
+
+        self.assertEqual(get_user_model().objects.count(), 3)
+        self.assertEqual(Recipe.objects.count(), 12)
+        self.assertIn('Seeded 3 users', out.getvalue())
+
+    def test_seeded_data_maintained(self):
+        """Test seeded rows get versions, search vectors and statistics"""
+        users = seed.seed_dataset(users=1, recipes=5, tags=2, ingredients=3,
+                                  tags_per_recipe=1)
+        user = users[0]
+
+        for model in (Tag, Ingredient, Recipe):
+            self.assertFalse(model.objects.filter(version=0).exists())
+        self.assertFalse(
+            Recipe.objects.filter(search_vector__isnull=True).exists()
+        )
+        self.assertEqual(
+            sum(Tag.objects.values_list('recipe_count', flat=True)), 5
+        )
+        self.assertEqual(RecipeStats.objects.get(user=user).recipe_count, 5)
+
+
+class BenchmarkApiCommandTests(TestCase):
+
+    def test_no_seeded_users(self):
+        """Test the benchmark needs seeded data"""
+        with self.assertRaises(CommandError):
+            call_command('benchmark_api', stdout=StringIO())
+
+    def test_benchmark_api(self):
+        """Test every scenario runs without errors and is reported"""
+        call_command('seed_data', users=2, recipes=3, tags=3, ingredients=3,
+                     stdout=StringIO())
+        out = StringIO()
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root,
+                                  RECIPE_IMAGE_EAGER=True):
+            json_path = os.path.join(media_root, 'results.json')
+            call_command('benchmark_api', requests=4, warmup=1,
+                         json_path=json_path, stdout=out)
+            with open(json_path) as f:
+                results = json.load(f)
+
+        for scenario in ('list', 'filter', 'detail', 'create', 'upload',
+                         'login'):
+            self.assertIn(f'== {scenario}', out.getvalue())
+            self.assertEqual(results[scenario]['errors'], 0)
+            self.assertGreater(results[scenario]['queries_per_request'], 0)
+        self.assertIn('p99', out.getvalue())
+
+
+class RefreshStatsCommandTests(TestCase):
+
+    def test_refresh_stats(self):
+        """Test the summaries of all users are recomputed"""
+        user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass'
+        )
+        Recipe.objects.create(user=user, title='Soup', time_minutes=20,
+                              price='7.00')
+        out = StringIO()
+
+        call_command('refresh_stats', stdout=out)
+
+        row = RecipeStats.objects.get(user=user)
+        self.assertEqual(row.recipe_count, 1)
+        self.assertEqual(row.time_minutes_total, 20)
+        self.assertIn('1 users', out.getvalue())
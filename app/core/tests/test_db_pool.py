@@ -0,0 +1,180 @@
+import psycopg2
+from psycopg2 import extensions
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from core.db.backends.postgresql_pool.base import DatabaseWrapper
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql):
+        if self.conn.dropped:
+            raise psycopg2.OperationalError('server closed the connection')
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection in the pool logic tests"""
+
+    def __init__(self):
+        self.closed = False
+        self.dropped = False
+        self.autocommit = True
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test checking connections out of and into the pool"""
+
+    def make_pool(self, **options):
+        self.opened = []
+
+        def connect():
+            conn = FakeConnection()
+            self.opened.append(conn)
+            return conn
+
+        return ConnectionPool(connect, **options)
+
+    def test_connection_reused(self):
+        """Test a returned connection is handed out again"""
+        pool = self.make_pool()
+
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['connects'], 1)
+        self.assertEqual(pool.stats()['reuses'], 1)
+
+    def test_pool_exhausted_times_out(self):
+        """Test waiting for a connection is bounded by the timeout"""
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        pool.getconn()
+
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_closed_connection_discarded(self):
+        """Test connections closed while checked out aren't reused"""
+        pool = self.make_pool(max_size=1)
+        conn = pool.getconn()
+        conn.close()
+
+        pool.putconn(conn)
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['closed_broken'], 1)
+
+    def test_open_transaction_rolled_back(self):
+        """Test a connection is returned without an open transaction"""
+        pool = self.make_pool()
+        conn = pool.getconn()
+        conn.status = extensions.TRANSACTION_STATUS_INTRANS
+
+        pool.putconn(conn)
+
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertIs(pool.getconn(), conn)
+
+    def test_idle_connection_evicted(self):
+        """Test connections idle longer than max_idle are closed"""
+        pool = self.make_pool(max_idle=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['closed_idle'], 1)
+
+    def test_min_size_kept_when_idle(self):
+        """Test idle eviction keeps min_size connections open"""
+        pool = self.make_pool(max_idle=0, min_size=1)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertIs(pool.getconn(), conn)
+
+    def test_dropped_connection_fails_health_check(self):
+        """Test connections the server dropped are replaced"""
+        pool = self.make_pool(check_interval=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.dropped = True
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['health_checks'], 1)
+
+    def test_connections_not_shared_after_fork(self):
+        """Test a forked process doesn't use its parent's connections"""
+        pool = self.make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        # what a forked child sees: a pool created by another process
+        pool._pid = -1
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertFalse(conn.closed)
+
+    def test_warm_opens_min_size(self):
+        """Test warming the pool opens min_size idle connections"""
+        pool = self.make_pool(min_size=3)
+
+        self.assertEqual(pool.warm(), 3)
+        self.assertEqual(pool.stats()['idle'], 3)
+        self.assertEqual(pool.warm(), 0)
+
+
+class PooledBackendTests(TestCase):
+    """Test the pooled backend against the database"""
+
+    def setUp(self):
+        settings_dict = dict(connection.settings_dict)
+        # a pool of its own instead of the application's
+        settings_dict['OPTIONS'] = dict(
+            settings_dict['OPTIONS'], application_name='test_db_pool'
+        )
+        self.wrapper = DatabaseWrapper(settings_dict, connection.alias)
+        self.pool = self.wrapper.get_pool()
+        self.addCleanup(self.pool.closeall)
+
+    def test_connection_reused_after_close(self):
+        """Test closing hands the connection back to the pool"""
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            first_pid = cursor.fetchone()[0]
+        self.wrapper.close()
+
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            second_pid = cursor.fetchone()[0]
+        self.wrapper.close()
+
+        self.assertEqual(first_pid, second_pid)
+        self.assertEqual(self.pool.stats()['in_use'], 0)
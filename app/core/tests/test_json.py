@@ -0,0 +1,72 @@
+import datetime
+import io
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core import renderers
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+
+DATA = {
+    'id': 1,
+    'title': 'Crème brûlée\u2028\u2029',
+    'price': Decimal('5.50'),
+    'created': datetime.datetime(
+        2019, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc
+    ),
+    'label': _('Not found.'),
+    'tags': [1, 2, None, True],
+    2: 'non string key',
+}
+
+
+class FastJSONTests(SimpleTestCase):
+    """Test the fast JSON renderer and parser match DRF's"""
+
+    def test_render_same_as_stdlib(self):
+        """Test the rendered bytes are the stdlib renderer's"""
+        self.assertEqual(
+            FastJSONRenderer().render(DATA), JSONRenderer().render(DATA)
+        )
+
+    def test_render_indent(self):
+        """Test indented output, as the browsable API asks for"""
+        context = {'indent': 4}
+        self.assertEqual(
+            FastJSONRenderer().render(DATA, renderer_context=context),
+            JSONRenderer().render(DATA, renderer_context=context)
+        )
+
+    @unittest.skipIf(renderers.orjson is None, 'orjson is not installed')
+    def test_render_uses_orjson(self):
+        """Test orjson renders when it is installed"""
+        with mock.patch.object(
+                renderers.orjson, 'dumps',
+                wraps=renderers.orjson.dumps) as dumps:
+            FastJSONRenderer().render(DATA)
+
+        dumps.assert_called_once()
+
+    def test_parse_same_as_stdlib(self):
+        """Test the parsed data is the stdlib parser's"""
+        body = '{"title": "Crème", "tags": [1, 2], "price": 5.5}'.encode()
+
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body)),
+            JSONParser().parse(io.BytesIO(body))
+        )
+
+    def test_parse_errors(self):
+        """Test invalid JSON raises a parse error"""
+        for body in (b'{"title": ', b'[NaN]', b'"\xff"'):
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
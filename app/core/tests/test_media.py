@@ -0,0 +1,99 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from core.views import IMMUTABLE_CACHE_CONTROL
+
+
+CONTENT = b'0123456789' * 10
+HASHED_NAME = 'uploads/recipe/0123456789abcdef0123456789abcdef.jpg'
+
+
+class ServeMediaTests(TestCase):
+    """Test serving uploaded media files"""
+
+    def setUp(self):
+        self.name = default_storage.save(HASHED_NAME, ContentFile(CONTENT))
+        self.url = f'/media/{self.name}'
+
+    def tearDown(self):
+        default_storage.delete(self.name)
+
+    def test_serve_whole_file(self):
+        """Test files are sent with long lived cache headers"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertEqual(res['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+    def test_serve_other_names_short_cache(self):
+        """Test names that aren't content hashes may change"""
+        name = default_storage.save('uploads/recipe/photo.jpg',
+                                    ContentFile(CONTENT))
+        self.addCleanup(default_storage.delete, name)
+
+        res = self.client.get(f'/media/{name}')
+
+        self.assertNotIn('immutable', res['Cache-Control'])
+
+    def test_serve_range(self):
+        """Test a byte range is sent with 206"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT[10:20])
+        self.assertEqual(res['Content-Length'], '10')
+        self.assertEqual(res['Content-Range'], f'bytes 10-19/{len(CONTENT)}')
+
+    def test_serve_suffix_range(self):
+        """Test the last bytes of a file can be asked for"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT[-5:])
+
+    def test_serve_unsatisfiable_range(self):
+        """Test ranges past the end of the file are rejected"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=1000-')
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_not_modified(self):
+        """Test a cached copy is revalidated without sending the file"""
+        etag = self.client.get(self.url)['ETag']
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+
+    @override_settings(MEDIA_SERVE_MODE='accel',
+                       MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        """Test nginx is told to send the file"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Accel-Redirect'],
+                         f'/protected-media/{self.name}')
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_sendfile(self):
+        """Test the front server is told to send the file"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res['X-Sendfile'], default_storage.path(self.name))
+
+    def test_missing_file(self):
+        """Test unknown files and paths outside the media root are 404"""
+        self.assertEqual(
+            self.client.get('/media/uploads/missing.jpg').status_code, 404
+        )
+        self.assertEqual(
+            self.client.get('/media/../../etc/passwd').status_code, 404
+        )
@@ -0,0 +1,187 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Recipe
+
+
+METRICS_URL = reverse('metrics')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def sample_value(text, sample):
+    """Return the value of a sample in Prometheus text output"""
+    for line in text.splitlines():
+        if line.startswith(sample + ' '):
+            return float(line.rsplit(' ', 1)[1])
+
+    return None
+
+
+class RegistryTests(SimpleTestCase):
+    """Test the metrics are exported in the Prometheus format"""
+
+    def test_histogram_export(self):
+        """Test histogram buckets are cumulative"""
+        histogram = metrics.Histogram(
+            'test_seconds', 'Test', ('view',), (0.1, 1)
+        )
+        histogram.observe(('a',), 0.05)
+        histogram.observe(('a',), 0.5)
+        histogram.observe(('a',), 5)
+        registry = metrics.Registry()
+        registry.register(histogram)
+
+        text = registry.export()
+
+        self.assertIn('# TYPE test_seconds histogram', text)
+        self.assertEqual(
+            sample_value(text, 'test_seconds_bucket{view="a",le="0.1"}'), 1
+        )
+        self.assertEqual(
+            sample_value(text, 'test_seconds_bucket{view="a",le="1"}'), 2
+        )
+        self.assertEqual(
+            sample_value(text, 'test_seconds_bucket{view="a",le="+Inf"}'), 3
+        )
+        self.assertEqual(sample_value(text, 'test_seconds_sum{view="a"}'),
+                         5.55)
+        self.assertEqual(sample_value(text, 'test_seconds_count{view="a"}'),
+                         3)
+
+    def test_label_values_escaped(self):
+        """Test quotes in label values are escaped"""
+        counter = metrics.Counter('test_total', 'Test', ('path',))
+        counter.inc(('say "hi"',))
+
+        self.assertEqual(
+            list(counter.samples()),
+            [('test_total', r'{path="say \"hi\""}', 1)]
+        )
+
+    def test_timed_counts_nested_once(self):
+        """Test nested timers of the same name are counted once"""
+        request_metrics = metrics.start_request(10)
+        try:
+            with metrics.timed('serializer'):
+                with metrics.timed('serializer'):
+                    pass
+        finally:
+            metrics.end_request()
+
+        self.assertEqual(list(request_metrics.timings), ['serializer'])
+        self.assertIsNone(metrics.current())
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsMiddlewareTests(TestCase):
+    """Test requests are measured by view and action"""
+
+    def setUp(self):
+        metrics.REGISTRY.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        for n in range(3):
+            Recipe.objects.create(
+                user=self.user, title=f'Recipe {n}', time_minutes=5,
+                price=5.00
+            )
+
+    def scrape(self):
+        res = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+
+        return res.content.decode()
+
+    def test_recipe_list_measured(self):
+        """Test a list request records queries, serializer time and size"""
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        text = self.scrape()
+
+        labels = '{view="RecipeViewSet",action="list",method="GET"'
+        self.assertEqual(
+            sample_value(text, 'http_requests_total' + labels +
+                         ',status="200"}'), 1
+        )
+        self.assertEqual(
+            sample_value(text, 'http_request_duration_seconds_count' +
+                         labels + '}'), 1
+        )
+        self.assertGreater(
+            sample_value(text, 'http_request_db_queries_sum' + labels + '}'),
+            0
+        )
+        self.assertGreater(
+            sample_value(text, 'http_request_serializer_seconds_sum' +
+                         labels + '}'), 0
+        )
+        self.assertGreater(
+            sample_value(text, 'http_request_render_seconds_sum' +
+                         labels + '}'), 0
+        )
+        self.assertEqual(
+            sample_value(text, 'http_response_size_bytes_sum' +
+                         labels + '}'), len(res.content)
+        )
+
+    def test_unmatched_measured(self):
+        """Test requests to no view are counted together"""
+        self.client.get('/nowhere/')
+
+        text = self.scrape()
+
+        self.assertEqual(
+            sample_value(
+                text, 'http_requests_total{view="unmatched",action="",'
+                'method="GET",status="404"}'
+            ), 1
+        )
+
+    @override_settings(SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_logged(self):
+        """Test slow requests are logged with their SQL"""
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.client.get(RECIPES_URL)
+
+        self.assertIn('RecipeViewSet.list', logs.output[0])
+        self.assertIn('core_recipe', logs.output[0])
+
+    def test_token_required(self):
+        """Test the metrics need the token"""
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_not_served_without_token(self):
+        """Test the metrics aren't public when no token is set"""
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        """Test nothing is recorded or served when disabled"""
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn(
+            'RecipeViewSet', metrics.REGISTRY.export()
+        )
@@ -0,0 +1,85 @@
+import gzip
+import json
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import middleware
+
+
+def json_view(size):
+    """Return a view responding with about size bytes of JSON"""
+    def view(request):
+        body = json.dumps([{'id': n, 'title': 'Recipe'} for n in range(
+            size // 28 + 1
+        )])
+        return HttpResponse(body, content_type='application/json')
+
+    return view
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test responses are compressed when it is worth it"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get(self, view, accept_encoding='gzip, deflate'):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return middleware.CompressionMiddleware(view)(request)
+
+    def test_large_json_gzipped(self):
+        """Test large JSON responses are gzipped"""
+        res = self.get(json_view(5000))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(res['Content-Length'], str(len(res.content)))
+        self.assertIn('Accept-Encoding', res['Vary'])
+        data = json.loads(gzip.decompress(res.content))
+        self.assertEqual(data[0], {'id': 0, 'title': 'Recipe'})
+
+    def test_small_response_not_compressed(self):
+        """Test responses below the threshold are sent as they are"""
+        res = self.get(json_view(100))
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertFalse(res.has_header('Vary'))
+
+    def test_not_accepted(self):
+        """Test clients that don't accept gzip get the plain body"""
+        for accept_encoding in ('', 'identity', 'gzip;q=0'):
+            res = self.get(json_view(5000), accept_encoding)
+
+            self.assertFalse(res.has_header('Content-Encoding'))
+            self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_images_not_compressed(self):
+        """Test content types not listed aren't compressed"""
+        def view(request):
+            return HttpResponse(b'\0' * 5000, content_type='image/jpeg')
+
+        res = self.get(view)
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_strong_etag_made_weak(self):
+        """Test a strong ETag becomes weak on the compressed body"""
+        def view(request):
+            response = json_view(5000)(request)
+            response['ETag'] = '"abc"'
+            return response
+
+        res = self.get(view)
+
+        self.assertEqual(res['ETag'], 'W/"abc"')
+
+    def test_negotiate_prefers_highest_q(self):
+        """Test the coding the client prefers most is picked"""
+        mw = middleware.CompressionMiddleware(None)
+        mw.compressors = [('br', None), ('gzip', None)]
+
+        self.assertEqual(mw.negotiate('gzip, br')[0], 'br')
+        self.assertEqual(mw.negotiate('gzip;q=1, br;q=0.5')[0], 'gzip')
+        self.assertEqual(mw.negotiate('*;q=0.1, br;q=0')[0], 'gzip')
+        self.assertEqual(mw.negotiate('deflate'), (None, None))
@@ -1,5 +1,7 @@
+import hashlib
 from unittest.mock import patch
 
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 # get_user_model returns a user model that is currently active in project
@@ -98,3 +100,15 @@ class ModelTests(TestCase):
 
         exp_path = f'uploads/recipe/{uuid}.jpg'
         self.assertEqual(file_path, exp_path)
+
+    def test_recipe_file_name_content_hash(self):
+        """Test that new uploads are named after their content"""
+        recipe = models.Recipe(
+            user=sample_user(), title='Steak', time_minutes=5, price=5.00
+        )
+        recipe.image = SimpleUploadedFile('myimage.jpg', b'image bytes')
+
+        file_path = models.recipe_image_file_path(recipe, 'myimage.jpg')
+
+        digest = hashlib.sha256(b'image bytes').hexdigest()[:32]
+        self.assertEqual(file_path, f'uploads/recipe/{digest}.jpg')
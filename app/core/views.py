@@ -0,0 +1,184 @@
+import hmac
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseForbidden
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from core import metrics as core_metrics
+
+
+MEDIA_SERVE_DJANGO = 'django'
+MEDIA_SERVE_ACCEL = 'accel'
+MEDIA_SERVE_SENDFILE = 'sendfile'
+
+# Names made by core.models.recipe_image_file_path from the content
+# hash, and renditions named after them. The bytes behind such a name
+# never change, so clients may cache them forever.
+CONTENT_ADDRESSED_RE = re.compile(r'(^|/)[0-9a-f]{32}[-_.][^/]*$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# returned by _parse_range for ranges outside the file
+UNSATISFIABLE = object()
+
+
+class MediaFileResponse(FileResponse):
+    # bigger reads than the 4KB default when no sendfile is available
+    block_size = 64 * 1024
+
+
+class RangeFile:
+    """Read only length bytes of a file, starting at start
+
+    Has no fileno() on purpose: a WSGI server's sendfile would send the
+    rest of the file instead of the range.
+    """
+
+    def __init__(self, f, start, length):
+        self.file = f
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def serve_media(request, path):
+    """Serve an uploaded file, or have the front server send it
+
+    MEDIA_SERVE_MODE picks how the bytes are sent:
+    'accel' answers with an X-Accel-Redirect to MEDIA_ACCEL_PREFIX for
+    nginx, 'sendfile' with an X-Sendfile header for Apache/lighttpd,
+    and 'django' streams the file itself, which WSGI servers turn into
+    an OS sendfile for whole files. Range requests are answered by the
+    front server in the first two modes.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        response = _file_response(request, path, fullpath, stat.st_size,
+                                  etag)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = (
+        IMMUTABLE_CACHE_CONTROL if CONTENT_ADDRESSED_RE.search(path)
+        else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    )
+
+    return response
+
+
+def _file_response(request, path, fullpath, size, etag):
+    content_type = mimetypes.guess_type(fullpath)[0] or \
+        'application/octet-stream'
+    mode = settings.MEDIA_SERVE_MODE
+
+    if mode == MEDIA_SERVE_ACCEL:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = \
+            settings.MEDIA_ACCEL_PREFIX + quote(path)
+        return response
+    if mode == MEDIA_SERVE_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+        return response
+
+    byte_range = _parse_range(request, size, etag)
+    if byte_range is UNSATISFIABLE:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        response = MediaFileResponse(
+            open(fullpath, 'rb'), content_type=content_type
+        )
+    else:
+        start, end = byte_range
+        response = MediaFileResponse(
+            RangeFile(open(fullpath, 'rb'), start, end - start + 1),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+
+    return response
+
+
+def _parse_range(request, size, etag):
+    """Return the (first, last) byte of a single range request
+
+    None means the whole file is sent: no Range header, several ranges
+    or an If-Range that no longer matches.
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    match = RANGE_RE.match(header)
+    if not match:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        # the last n bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        return UNSATISFIABLE
+
+    return start, end
+
+
+def metrics(request):
+    """Serve the request metrics of this process to Prometheus"""
+    # never public, they show the endpoints, traffic and queries
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+        raise Http404
+    expected = 'Bearer ' + settings.METRICS_TOKEN
+    if not hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', '').encode(),
+            expected.encode()):
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        core_metrics.REGISTRY.export(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
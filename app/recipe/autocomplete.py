@@ -0,0 +1,99 @@
+"""Prefix autocomplete of tag and ingredient names
+
+Suggestions are the names starting with the prefix, case-insensitively,
+most used first. Every process keeps a trie of a user's names per model,
+built from one query on the first lookup and used until the user's cache
+generation (see recipe.cache) changes, so repeated keystrokes only cost
+the read of the generation. Users with more names than
+AUTOCOMPLETE_TRIE_MAX_NAMES are looked up in the database instead,
+through the (user_id, UPPER(name) text_pattern_ops) indexes.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from recipe import cache
+
+
+def _ranking(obj):
+    return -obj.recipe_count, obj.name, obj.id
+
+
+class NameTrie:
+    """Trie of upper-cased names, every node knowing its top names"""
+
+    def __init__(self, objs, top):
+        # node: (children by character, top objects below the node)
+        self.root = ({}, [])
+        # in ranking order, so every node's list comes out sorted
+        for obj in sorted(objs, key=_ranking):
+            node = self.root
+            self._add(node, obj, top)
+            for char in obj.name.upper():
+                node = node[0].setdefault(char, ({}, []))
+                self._add(node, obj, top)
+
+    @staticmethod
+    def _add(node, obj, top):
+        if len(node[1]) < top:
+            node[1].append(obj)
+
+    def lookup(self, prefix, limit):
+        """Return the top limit objects whose name starts with prefix"""
+        node = self.root
+        for char in prefix.upper():
+            node = node[0].get(char)
+            if node is None:
+                return []
+
+        return node[1][:limit]
+
+
+# (model label, user id): (generation, NameTrie or None when too big)
+_tries = OrderedDict()
+_lock = threading.Lock()
+
+
+def _get_trie(model, user_id):
+    key = (model._meta.label, user_id)
+    generation = cache.get_generation(user_id)
+    with _lock:
+        entry = _tries.get(key)
+        if entry is not None and entry[0] == generation:
+            _tries.move_to_end(key)
+            return entry[1]
+
+    limit = settings.AUTOCOMPLETE_TRIE_MAX_NAMES
+    objs = list(model.objects.filter(user_id=user_id).only(
+        'id', 'name', 'user', 'recipe_count'
+    )[:limit + 1])
+    # too many names to keep in memory, remembered so the next lookups
+    # go to the database straight away
+    trie = None if len(objs) > limit else NameTrie(
+        objs, settings.AUTOCOMPLETE_MAX_LIMIT
+    )
+    with _lock:
+        _tries[key] = (generation, trie)
+        _tries.move_to_end(key)
+        while len(_tries) > settings.AUTOCOMPLETE_CACHE_SIZE:
+            _tries.popitem(last=False)
+
+    return trie
+
+
+def suggest(model, user_id, prefix, limit):
+    """Return up to limit of a user's objects named with the prefix"""
+    trie = _get_trie(model, user_id)
+    if trie is not None:
+        return trie.lookup(prefix, limit)
+
+    return list(model.objects.filter(
+        user_id=user_id, name__istartswith=prefix
+    ).order_by('-recipe_count', 'name', 'id')[:limit])
+
+
+def clear_tries():
+    """Forget the tries of every user in this process"""
+    with _lock:
+        _tries.clear()
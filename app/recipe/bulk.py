@@ -0,0 +1,333 @@
+from abc import ABC, abstractmethod
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Value, When
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from core.models import Recipe, UploadSession
+from core.signals import bulk_changed
+
+from recipe import images
+from recipe.serializers import BulkDeleteSerializer
+
+
+# Rows per INSERT / UPDATE statement
+BATCH_SIZE = 1000
+RECIPE_LINKS = ('ingredients', 'tags')
+
+DELETE_OWNED_SQL = 'DELETE FROM {table} WHERE user_id = %s AND id = ANY(%s)'
+DELETE_IN_SQL = 'DELETE FROM {table} WHERE {column} = ANY(%s)'
+
+
+def _batches(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bulk_update_fields(model, changes):
+    """Apply {pk: {field: value}} changes, one UPDATE per field and batch
+
+    Each statement sets the field with a CASE over the primary keys.
+    """
+    fields = {field for values in changes.values() for field in values}
+    for field in fields:
+        model_field = model._meta.get_field(field)
+        pks = [pk for pk, values in changes.items() if field in values]
+        for batch in _batches(pks):
+            model.objects.filter(pk__in=batch).update(**{
+                field: Case(
+                    *[When(pk=pk, then=Value(changes[pk][field]))
+                      for pk in batch],
+                    output_field=model_field
+                )
+            })
+
+
+def replace_links(field_name, links):
+    """Replace the linked ids of recipes, links is {recipe_id: [ids]}"""
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    column = field.m2m_reverse_name()
+
+    delete_in(through, 'recipe_id', list(links))
+    through.objects.bulk_create(
+        [
+            through(recipe_id=recipe_id, **{column: pk})
+            for recipe_id, pks in links.items()
+            for pk in set(pks)
+        ],
+        batch_size=BATCH_SIZE
+    )
+
+
+def delete_links(field_name, column, ids):
+    """Delete M2M rows whose column is one of ids"""
+    through = Recipe._meta.get_field(field_name).remote_field.through
+    delete_in(through, column, ids)
+
+
+def delete_in(model, column, values):
+    """Delete the rows whose column is one of values with one DELETE
+
+    Like delete_owned, nothing is loaded and no signals are sent.
+    """
+    if not values:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            DELETE_IN_SQL.format(table=model._meta.db_table, column=column),
+            [list(values)]
+        )
+
+
+def delete_owned(model, user, ids):
+    """Delete objects of a user with one DELETE and no model signals
+
+    QuerySet.delete() would load every object to collect cascades and
+    send pre/post_delete, the callers delete what refers to the objects
+    first and send bulk_changed once instead.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            DELETE_OWNED_SQL.format(table=model._meta.db_table),
+            [user.pk, list(ids)]
+        )
+
+
+def create_recipes(user, items):
+    """Create recipes and their links, return their ids"""
+    recipes = Recipe.objects.bulk_create(
+        [
+            Recipe(user=user, **{
+                field: value for field, value in item.items()
+                if field not in RECIPE_LINKS
+            })
+            for item in items
+        ],
+        batch_size=BATCH_SIZE
+    )
+    ids = [recipe.pk for recipe in recipes]
+    for field_name in RECIPE_LINKS:
+        replace_links(field_name, {
+            pk: item[field_name]
+            for pk, item in zip(ids, items) if item.get(field_name)
+        })
+    bulk_changed.send(
+        sender=Recipe, user_id=user.pk, action='create', ids=ids,
+        recipe_ids=ids
+    )
+
+    return ids
+
+
+def update_recipes(user, items):
+    """Update recipes and replace the links that were sent"""
+    ids = [item['id'] for item in items]
+    bulk_update_fields(Recipe, {
+        item['id']: {
+            field: value for field, value in item.items()
+            if field not in RECIPE_LINKS + ('id',)
+        }
+        for item in items
+    })
+    for field_name in RECIPE_LINKS:
+        replace_links(field_name, {
+            item['id']: item[field_name]
+            for item in items if field_name in item
+        })
+    bulk_changed.send(
+        sender=Recipe, user_id=user.pk, action='update', ids=ids,
+        recipe_ids=ids
+    )
+
+    return ids
+
+
+def delete_recipes(user, ids):
+    """Delete recipes with their links and, once committed, their images"""
+    files = list(Recipe.objects.filter(pk__in=ids).values_list(
+        'image', 'image_renditions'
+    ))
+    image_names = {name for name, _renditions in files if name}
+    rendition_paths = [
+        path
+        for _name, renditions in files
+        for path in images.rendition_paths(renditions)
+    ]
+    for field_name in RECIPE_LINKS:
+        delete_links(field_name, 'recipe_id', ids)
+    # their partial files are purged by recipe.uploads once expired
+    UploadSession.objects.filter(recipe_id__in=ids).delete()
+    delete_owned(Recipe, user, ids)
+    # images are named after their content, another recipe may have
+    # the same one
+    unused_images = image_names - set(
+        Recipe.objects.filter(image__in=image_names).values_list(
+            'image', flat=True
+        )
+    )
+    transaction.on_commit(
+        lambda: _delete_files(list(unused_images) + rendition_paths)
+    )
+    bulk_changed.send(
+        sender=Recipe, user_id=user.pk, action='delete', ids=ids,
+        recipe_ids=ids
+    )
+
+
+def _delete_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def _recipes_linked_to(field_name, ids):
+    """Return the ids of recipes linked to any of ids"""
+    field = Recipe._meta.get_field(field_name)
+    return set(
+        field.remote_field.through.objects.filter(
+            **{f'{field.m2m_reverse_name()}__in': ids}
+        ).values_list('recipe_id', flat=True)
+    )
+
+
+def create_attrs(model, user, items):
+    """Create tags or ingredients, return their ids"""
+    objs = model.objects.bulk_create(
+        [model(user=user, name=item['name']) for item in items],
+        batch_size=BATCH_SIZE
+    )
+    ids = [obj.pk for obj in objs]
+    bulk_changed.send(
+        sender=model, user_id=user.pk, action='create', ids=ids,
+        recipe_ids=[]
+    )
+
+    return ids
+
+
+def update_attrs(model, user, items, recipe_field):
+    """Rename tags or ingredients"""
+    ids = [item['id'] for item in items]
+    bulk_update_fields(model, {
+        item['id']: {'name': item['name']} for item in items if 'name' in item
+    })
+    bulk_changed.send(
+        sender=model, user_id=user.pk, action='update', ids=ids,
+        recipe_ids=_recipes_linked_to(recipe_field, ids)
+    )
+
+    return ids
+
+
+def delete_attrs(model, user, ids, recipe_field):
+    """Delete tags or ingredients and unlink them from recipes"""
+    recipe_ids = _recipes_linked_to(recipe_field, ids)
+    column = Recipe._meta.get_field(recipe_field).m2m_reverse_name()
+    delete_links(recipe_field, column, ids)
+    delete_owned(model, user, ids)
+    bulk_changed.send(
+        sender=model, user_id=user.pk, action='delete', ids=ids,
+        recipe_ids=recipe_ids
+    )
+
+
+class BulkMixin(ABC):
+    """Add a bulk action creating, updating or deleting many objects
+
+    POST creates, PATCH updates and DELETE deletes; everything runs in
+    one transaction, and a request with any invalid item changes
+    nothing and gets a list of errors, one entry per item.
+
+    A viewset sets bulk_serializer_class and implements the perform_bulk_*
+    methods, which run inside the transaction with validated data.
+    """
+    bulk_serializer_class = None
+
+    @abstractmethod
+    def perform_bulk_create(self, items):
+        """Create objects from validated items, return their ids in order"""
+
+    @abstractmethod
+    def perform_bulk_update(self, items):
+        """Apply validated items, each with the id of an owned object
+
+        Returns the ids in the order of items.
+        """
+
+    @abstractmethod
+    def perform_bulk_delete(self, ids):
+        """Delete the objects with ids, all owned by the user"""
+
+    @action(methods=['post', 'patch', 'delete'], detail=False)
+    def bulk(self, request):
+        """Create, update or delete many objects in one request"""
+        if request.method == 'DELETE':
+            return self._bulk_delete(request)
+
+        partial = request.method == 'PATCH'
+        serializer = self.bulk_serializer_class(
+            data=request.data,
+            many=True,
+            partial=partial,
+            context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                if partial:
+                    ids = self.perform_bulk_update(serializer.validated_data)
+                else:
+                    ids = self.perform_bulk_create(serializer.validated_data)
+        except IntegrityError:
+            # e.g. names swapped between tags within one request
+            raise ValidationError(
+                _('The changes conflict with each other or existing data.')
+            )
+
+        return Response(
+            self._bulk_representation(ids),
+            status=status.HTTP_200_OK if partial else status.HTTP_201_CREATED
+        )
+
+    def get_bulk_queryset(self):
+        """Return the objects of the user, without the list filters
+
+        Query params such as ?search= filter the list only, they don't
+        narrow down which objects a bulk request reads and writes.
+        """
+        return self.queryset.filter(user=self.request.user)
+
+    def _bulk_delete(self, request):
+        serializer = BulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        owned = set(self.get_bulk_queryset().filter(
+            pk__in=ids
+        ).values_list('pk', flat=True))
+        errors = [{} if pk in owned else {'id': [_('Not found.')]}
+                  for pk in ids]
+        if any(errors):
+            raise ValidationError({'ids': errors})
+
+        with transaction.atomic():
+            self.perform_bulk_delete(list(owned))
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _bulk_representation(self, ids):
+        """Serialize the objects with ids, in the order of ids"""
+        objs = {
+            obj.pk: obj
+            for obj in self.get_bulk_queryset().filter(pk__in=ids)
+        }
+        serializer = self.get_serializer(
+            [objs[pk] for pk in ids], many=True
+        )
+
+        return serializer.data
@@ -0,0 +1,141 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from core import metrics, sync
+
+
+KEY_PREFIX = 'recipe-api'
+# Query params holding comma separated ids, order and duplicates
+# don't change the result so they are sorted out of the cache key
+ID_LIST_PARAMS = ('tags', 'ingredients')
+FLAG_PARAMS = ('assigned_only',)
+
+# Headers the recipe API responses depend on, besides the URL
+VARY_HEADERS = ('Accept', 'Authorization')
+
+# exported on /metrics with the request metrics, see core.metrics
+requests_total = metrics.REGISTRY.register(metrics.Counter(
+    'recipe_cache_requests_total',
+    'Recipe API list requests by cache result: hit, miss or not_modified',
+    ('result',)
+))
+
+
+def get_cache():
+    """Return the cache backend configured for the recipe API"""
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def get_generation(user_id):
+    """Return the current cache generation of a user
+
+    It is the user's change version (see core.sync), which every write
+    to their recipes, tags or ingredients increments in the database, so
+    all processes see a new generation as soon as the write commits.
+    """
+    return sync.current_version(user_id)
+
+
+def invalidate_user(user_id):
+    """Invalidate every cached response of a user
+
+    Only needed for changes that bypass the signals in core.signals,
+    which already take a new change version.
+    """
+    # A new generation orphans all the user's entries at once, they are
+    # never read again and expire on their own
+    sync.next_version(user_id)
+
+
+def normalize_params(query_params):
+    """Return the query params as a canonical, hashable string"""
+    parts = []
+    for name in sorted(query_params.keys()):
+        values = query_params.getlist(name)
+        if name in ID_LIST_PARAMS:
+            ids = set()
+            for value in values:
+                ids.update(v.strip() for v in value.split(',') if v.strip())
+            values = [','.join(sorted(ids, key=lambda v: (len(v), v)))]
+        elif name in FLAG_PARAMS:
+            values = ['1' if v not in ('', '0') else '0' for v in values]
+        parts.append(f'{name}={"&".join(values)}')
+
+    return '|'.join(parts)
+
+
+def response_key(request, endpoint, user_id=None):
+    """Return the cache key of a response for the requesting user"""
+    if user_id is None:
+        user_id = request.user.pk
+    # read once per request, the middleware and the view both need it
+    http_request = getattr(request, '_request', request)
+    generations = http_request.__dict__.setdefault(
+        '_recipe_cache_generations', {}
+    )
+    if user_id not in generations:
+        generations[user_id] = get_generation(user_id)
+    generation = generations[user_id]
+    # links in paginated responses are absolute, so the host matters.
+    # GET rather than query_params, it is also called from middleware
+    params = f'{request.get_host()}|{normalize_params(request.GET)}'
+    digest = hashlib.md5(params.encode()).hexdigest()
+
+    return f'{KEY_PREFIX}:{user_id}:{generation}:{endpoint}:{digest}'
+
+
+def make_etag(key):
+    """Return a weak ETag for the response stored under key"""
+    # The key changes whenever the user's data changes, so hashing it
+    # is enough, there is no need to render and hash the body
+    return f'W/"{hashlib.md5(key.encode()).hexdigest()}"'
+
+
+def record(result):
+    """Count a hit, miss or not_modified response"""
+    requests_total.inc((result,))
+
+
+class CachedListMixin:
+    """Serve list responses from a per-user cache"""
+    # Entries are keyed on user, generation, endpoint and normalized
+    # query params, every write moves the user to a new generation
+
+    def list(self, request, *args, **kwargs):
+        if not settings.RECIPE_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+
+        # keyed on the path, recipe.middleware computes the same ETag
+        key = response_key(request, request.path)
+        etag = make_etag(key)
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            record('not_modified')
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            return self._finalize_cached(response, etag)
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is not None:
+            record('hit')
+            response = Response(data)
+        else:
+            record('miss')
+            response = super().list(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, settings.RECIPE_CACHE_TIMEOUT)
+
+        return self._finalize_cached(response, etag)
+
+    def _finalize_cached(self, response, etag):
+        response['ETag'] = etag
+        # the same URL returns different data for every token, and
+        # renders differently depending on Accept
+        patch_vary_headers(response, VARY_HEADERS)
+
+        return response
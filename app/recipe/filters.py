@@ -0,0 +1,60 @@
+from django.db.models import Count, Exists, OuterRef
+
+from core.models import Recipe
+
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_MODES = (MATCH_ANY, MATCH_ALL)
+
+
+def _through(field_name):
+    """Return the M2M through model of a recipe field and its column"""
+    field = Recipe._meta.get_field(field_name)
+    # m2m_reverse_name is the through table column of the target,
+    # e.g. tag_id for Recipe.tags
+    return field.remote_field.through, field.m2m_reverse_name()
+
+
+def filter_linked(queryset, field_name, ids, match=MATCH_ANY):
+    """Keep recipes linked to any or all of the given ids
+
+    Joining the M2M table repeats a recipe once per matching row, and
+    every extra filter multiplies the rows again. Here each recipe is
+    checked with one EXISTS probe of the unique (recipe_id, target_id)
+    index, or matched against a grouped semi-join for match=all.
+    """
+    ids = set(ids)
+    through, column = _through(field_name)
+
+    if match == MATCH_ALL:
+        # Recipes having every id, found once from the (target_id,
+        # recipe_id) index: only rows of the requested ids are read
+        matched = through.objects.filter(
+            **{f'{column}__in': ids}
+        ).values('recipe_id').annotate(
+            n=Count(column)
+        ).filter(n=len(ids)).values('recipe_id')
+        return queryset.filter(pk__in=matched)
+
+    links = through.objects.filter(
+        recipe_id=OuterRef('pk'), **{f'{column}__in': ids}
+    )
+    annotation = f'_{field_name}_match'
+
+    return queryset.annotate(
+        **{annotation: Exists(links)}
+    ).filter(**{annotation: True})
+
+
+def filter_assigned(queryset, field_name):
+    """Keep tags or ingredients that are assigned to at least one recipe
+
+    field_name is the recipe field the queryset's model is used in.
+    """
+    through, column = _through(field_name)
+    links = through.objects.filter(**{column: OuterRef('pk')})
+
+    return queryset.annotate(
+        _assigned=Exists(links)
+    ).filter(_assigned=True)
@@ -0,0 +1,171 @@
+"""Resized renditions of uploaded recipe images
+
+Uploads are saved as they are and answered straight away. The
+renditions are made afterwards by a small thread pool, a stand-in for
+a task queue: processing only needs the recipe id and image name.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from core.models import Recipe
+
+from recipe import cache
+
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'uploads/recipe/renditions/'
+# rendition key and Pillow format of the files saved for each rendition
+FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP'}
+# EXIF orientation tag and the transpose that makes the pixels upright
+ORIENTATION_TAG = 274
+ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    # concurrent first uploads must not each start a pool
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+        return _executor
+
+
+def enqueue(recipe_id, image_name):
+    """Make the renditions of a recipe image once the upload is committed"""
+    if settings.RECIPE_IMAGE_EAGER:
+        process(recipe_id, image_name)
+        return
+
+    transaction.on_commit(
+        lambda: _get_executor().submit(_run, recipe_id, image_name)
+    )
+
+
+def _run(recipe_id, image_name):
+    try:
+        process(recipe_id, image_name)
+    finally:
+        # worker threads get their own connection, don't leak it
+        connection.close()
+
+
+def process(recipe_id, image_name):
+    """Make the renditions of an image and record them on the recipe
+
+    Nothing is recorded if the recipe got another image meanwhile.
+    """
+    try:
+        renditions = make_renditions(image_name)
+    except Exception:
+        logger.exception('Processing image %s failed', image_name)
+        _record(recipe_id, image_name, image_status=Recipe.IMAGE_FAILED)
+        return
+
+    if not _record(recipe_id, image_name, image_status=Recipe.IMAGE_READY,
+                   image_renditions=renditions):
+        delete_renditions(renditions)
+
+
+def _record(recipe_id, image_name, **fields):
+    """Update the recipe if it still has the image, return if it did"""
+    recipes = Recipe.objects.filter(pk=recipe_id, image=image_name)
+    updated = recipes.update(**fields)
+    if updated:
+        # update() sends no signals, clients polling the status with
+        # If-None-Match need a new ETag
+        user_id = recipes.values_list('user_id', flat=True).first()
+        if user_id is not None:
+            cache.invalidate_user(user_id)
+
+    return updated
+
+
+def make_renditions(image_name):
+    """Save resized copies of an image, return them by rendition name
+
+    Each rendition is saved as JPEG and, when Pillow supports it, WebP.
+    They are encoded from the pixels alone, so EXIF (GPS position,
+    camera details) and other metadata of the upload are dropped.
+    """
+    with default_storage.open(image_name) as f:
+        image = Image.open(f)
+        image.load()
+    image = _upright(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    # registers every format plugin, WebP needs Pillow built with libwebp
+    Image.init()
+    formats = [
+        (ext, fmt) for ext, fmt in FORMATS.items() if fmt in Image.SAVE
+    ]
+
+    renditions = {}
+    for name, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+        resized = image.copy()
+        # keeps the aspect ratio and never enlarges
+        resized.thumbnail((size, size), Image.LANCZOS)
+        rendition = {'width': resized.width, 'height': resized.height}
+        for ext, fmt in formats:
+            buf = io.BytesIO()
+            resized.save(
+                buf, fmt, quality=settings.RECIPE_IMAGE_QUALITY,
+                optimize=fmt == 'JPEG'
+            )
+            rendition[ext] = default_storage.save(
+                f'{RENDITIONS_DIR}{stem}-{name}.{ext}',
+                ContentFile(buf.getvalue())
+            )
+        renditions[name] = rendition
+
+    return renditions
+
+
+def _upright(image):
+    """Apply the EXIF orientation, which is lost with the metadata"""
+    exif = getattr(image, '_getexif', lambda: None)() or {}
+    transpose = ORIENTATION_TRANSPOSE.get(exif.get(ORIENTATION_TAG))
+
+    return image.transpose(transpose) if transpose is not None else image
+
+
+def rendition_paths(renditions):
+    """Return the storage paths of all files of renditions"""
+    return [
+        path
+        for rendition in renditions.values()
+        for key, path in rendition.items()
+        if key in FORMATS
+    ]
+
+
+def delete_renditions(renditions):
+    """Delete the files of renditions"""
+    for path in rendition_paths(renditions):
+        default_storage.delete(path)
@@ -0,0 +1,57 @@
+"""Change the tags and ingredients of one recipe with a minimal diff
+
+recipe.tags.set(ids) reads the current links, then reads again which of
+the new ones already exist before inserting them. set_links reads the
+links once and changes only the rows that differ, with one DELETE and
+one INSERT, however many ids there are. The m2m_changed signals are
+sent like remove() and add() would, so search vectors, versions, link
+counts and cached responses follow.
+"""
+from django.db import connections
+from django.db.models.signals import m2m_changed
+
+from core.models import Recipe
+
+
+# QuerySet.delete() would read the rows to collect them before deleting
+DELETE_SQL = 'DELETE FROM {table} WHERE {source} = %s AND {target} = ANY(%s)'
+
+
+def set_links(recipe, field_name, pks):
+    """Link the recipe to exactly the objects with the given pks"""
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    model = field.remote_field.model
+    source = field.m2m_column_name()
+    target = field.m2m_reverse_name()
+    using = recipe._state.db
+    rows = through.objects.using(using).filter(**{source: recipe.pk})
+
+    current = set(rows.values_list(target, flat=True))
+    pks = set(pks)
+    removed = current - pks
+    added = pks - current
+
+    def send(action, pk_set):
+        m2m_changed.send(
+            sender=through, instance=recipe, action=action, reverse=False,
+            model=model, pk_set=pk_set, using=using
+        )
+
+    if removed:
+        send('pre_remove', removed)
+        sql = DELETE_SQL.format(
+            table=through._meta.db_table, source=source, target=target
+        )
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, [recipe.pk, list(removed)])
+        send('post_remove', removed)
+    if added:
+        send('pre_add', added)
+        through.objects.using(using).bulk_create([
+            through(**{source: recipe.pk, target: pk}) for pk in added
+        ])
+        send('post_add', added)
+
+    # like the related manager does, drop links prefetched before
+    getattr(recipe, '_prefetched_objects_cache', {}).pop(field_name, None)
@@ -0,0 +1,174 @@
+"""Rank a user's recipes by the ingredients they have on hand
+
+Every user gets an in-process RecipeIndex of their recipes' ingredients
+as bitsets: one bit per recipe in a bitset per ingredient, and one bit
+per ingredient in a bitset per recipe. It is built with one query the
+first time a user matches and kept until their cache generation (see
+recipe.cache) changes, which every write to their recipes, tags or
+ingredients does. Recipes without ingredients are in it too, they miss
+nothing and always match.
+
+Counting what each recipe misses is done on all recipes at once, with
+big int operations over the bitsets of the missing ingredients: no
+Python code runs per recipe until the matches are read.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core.models import Recipe
+
+from recipe import cache
+
+
+class RecipeIndex:
+    """Ingredient bitsets of one user's recipes
+
+    Recipe positions are ordered newest first, so the lowest set bits of
+    a recipe bitset are the newest recipes.
+    """
+
+    def __init__(self, links):
+        """Build the index from (recipe_id, ingredient_id) pairs
+
+        A recipe without ingredients comes with an ingredient_id of None.
+        """
+        recipe_ingredients = {}
+        for recipe_id, ingredient_id in links:
+            ingredients = recipe_ingredients.setdefault(recipe_id, [])
+            if ingredient_id is not None:
+                ingredients.append(ingredient_id)
+        self.recipe_ids = sorted(recipe_ingredients, reverse=True)
+        self.ingredient_ids = sorted({
+            ingredient_id for _, ingredient_id in links
+            if ingredient_id is not None
+        })
+        self.ingredient_bits = {
+            ingredient_id: n
+            for n, ingredient_id in enumerate(self.ingredient_ids)
+        }
+        # bit n of recipe_masks[i] is ingredient n of recipe i, bit i of
+        # ingredient_recipes[n] is recipe i of ingredient n
+        self.recipe_masks = []
+        self.ingredient_recipes = [0] * len(self.ingredient_ids)
+        for position, recipe_id in enumerate(self.recipe_ids):
+            mask = 0
+            for ingredient_id in recipe_ingredients[recipe_id]:
+                bit = self.ingredient_bits[ingredient_id]
+                mask |= 1 << bit
+                self.ingredient_recipes[bit] |= 1 << position
+            self.recipe_masks.append(mask)
+        self.all_recipes = (1 << len(self.recipe_ids)) - 1
+
+    def missing_counts(self, have, max_missing):
+        """Return a recipe bitset per number of missing ingredients
+
+        Item m holds the recipes missing exactly m of their ingredients,
+        up to max_missing, the rest are left out. at_least[k] collects
+        the recipes missing k or more, like a counter per recipe that
+        saturates at max_missing + 1.
+        """
+        have_mask = self.ingredient_mask(have)
+        at_least = [self.all_recipes] + [0] * (max_missing + 1)
+        for bit, recipes in enumerate(self.ingredient_recipes):
+            if have_mask >> bit & 1:
+                continue
+            for k in range(max_missing + 1, 0, -1):
+                at_least[k] |= at_least[k - 1] & recipes
+
+        return [
+            at_least[m] & ~at_least[m + 1] for m in range(max_missing + 1)
+        ]
+
+    def ingredient_mask(self, ingredient_ids):
+        """Return the bitset of ingredient ids, unknown ones are ignored"""
+        mask = 0
+        for ingredient_id in ingredient_ids:
+            bit = self.ingredient_bits.get(ingredient_id)
+            if bit is not None:
+                mask |= 1 << bit
+
+        return mask
+
+    def missing_ingredients(self, position, have_mask):
+        """Return the ids of the ingredients a recipe misses"""
+        return [
+            self.ingredient_ids[bit]
+            for bit in set_bits(self.recipe_masks[position] & ~have_mask)
+        ]
+
+    def match(self, have, max_missing, limit):
+        """Return (recipe_id, missing ingredient ids), best first
+
+        Recipes missing fewer ingredients come first, newest first among
+        equals. Also returns how many recipes matched in total.
+        """
+        have_mask = self.ingredient_mask(have)
+        matches = []
+        total = 0
+        for recipes in self.missing_counts(have, max_missing):
+            total += popcount(recipes)
+            for position in set_bits(recipes):
+                if len(matches) == limit:
+                    break
+                matches.append((
+                    self.recipe_ids[position],
+                    self.missing_ingredients(position, have_mask)
+                ))
+
+        return matches, total
+
+
+def popcount(value):
+    return bin(value).count('1')
+
+
+def set_bits(value):
+    """Yield the positions of the set bits of value, lowest first"""
+    # bin() walks the int in C, far quicker than shifting it bit by bit
+    digits = bin(value)[:1:-1]
+    position = digits.find('1')
+    while position != -1:
+        yield position
+        position = digits.find('1', position + 1)
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def build_index(user_id):
+    """Read a user's recipe ingredients into a new RecipeIndex"""
+    # a LEFT JOIN, recipes without ingredients come with None
+    return RecipeIndex(list(
+        Recipe.objects.filter(user_id=user_id).values_list(
+            'id', 'ingredients'
+        )
+    ))
+
+
+def get_index(user_id):
+    """Return the RecipeIndex of a user, rebuilt when their data changed"""
+    # read before building: a write during the build bumps it again
+    generation = cache.get_generation(user_id)
+    with _lock:
+        entry = _indexes.get(user_id)
+        if entry is not None and entry[0] == generation:
+            _indexes.move_to_end(user_id)
+            return entry[1]
+
+    index = build_index(user_id)
+    with _lock:
+        _indexes[user_id] = (generation, index)
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.RECIPE_MATCH_INDEX_SIZE:
+            _indexes.popitem(last=False)
+
+    return index
+
+
+def clear_indexes():
+    """Forget the indexes of every user in this process"""
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+
+from user.authentication import CachedTokenAuthentication
+
+from recipe import cache
+
+
+class ConditionalGetMiddleware:
+    """Answer conditional GETs of the recipe API before the view runs
+
+    The ETag of a response is made from the user's cache generation,
+    which every write to the user's recipes, tags or ingredients bumps
+    in the database, so it is known without running the view or the
+    serializers, with one query once the token is cached. A matching
+    If-None-Match returns a 304 straight away. The list endpoints
+    compute the same ETag in recipe.cache.CachedListMixin for requests
+    that don't come through here.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.authentication = CachedTokenAuthentication()
+
+    def __call__(self, request):
+        etag = self.get_etag(request)
+        if etag is None:
+            return self.get_response(request)
+
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            cache.record('not_modified')
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            patch_vary_headers(response, cache.VARY_HEADERS)
+            return response
+
+        response = self.get_response(request)
+        # no-store responses (upload sessions) depend on more than the
+        # user's recipes, tags and ingredients
+        if (response.status_code == status.HTTP_200_OK and
+                not response.streaming and not response.has_header('ETag') and
+                'no-store' not in response.get('Cache-Control', '')):
+            response['ETag'] = etag
+            patch_vary_headers(response, cache.VARY_HEADERS)
+
+        return response
+
+    def get_etag(self, request):
+        """Return the ETag of the response, None if it can't have one"""
+        if (request.method not in ('GET', 'HEAD') or
+                not request.path.startswith(
+                    settings.RECIPE_CONDITIONAL_GET_PREFIX)):
+            return None
+        try:
+            # the token cache makes this free, the view checks it again
+            auth = self.authentication.authenticate(request)
+        except AuthenticationFailed:
+            # left to the view to respond with the error
+            return None
+        if auth is None:
+            return None
+        user, _ = auth
+
+        return cache.make_etag(
+            cache.response_key(request, request.path, user.pk)
+        )
@@ -0,0 +1,52 @@
+from django.db import IntegrityError, transaction
+
+from core.signals import bulk_changed
+
+
+# A concurrent request creating one of the names makes the INSERT fail,
+# the names are read again and the rest created, up to this many times
+CREATE_ATTEMPTS = 3
+
+
+def get_or_create_names(model, user, names):
+    """Return the ids of a user's tags or ingredients by name
+
+    The existing objects are read with one SELECT and the missing ones
+    created with one INSERT, in a savepoint: when a concurrent request
+    created one of them first, the unique (user, name) constraint fails
+    the INSERT, which is rolled back and retried with what is left.
+    The ids are returned in the order of the names, without repeats.
+    """
+    names = list(dict.fromkeys(names))
+    ids = {}
+    created = []
+    for attempt in range(CREATE_ATTEMPTS):
+        missing = [name for name in names if name not in ids]
+        if not missing:
+            break
+        ids.update(model.objects.filter(
+            user=user, name__in=missing
+        ).values_list('name', 'id'))
+        missing = [name for name in missing if name not in ids]
+        if not missing:
+            break
+        try:
+            with transaction.atomic():
+                objs = model.objects.bulk_create(
+                    [model(user=user, name=name) for name in missing]
+                )
+        except IntegrityError:
+            if attempt == CREATE_ATTEMPTS - 1:
+                raise
+            continue
+        ids.update((obj.name, obj.pk) for obj in objs)
+        created += [obj.pk for obj in objs]
+
+    if created:
+        # bulk_create sends no post_save, keep caches and versions right
+        bulk_changed.send(
+            sender=model, user_id=user.pk, action='create', ids=created,
+            recipe_ids=[]
+        )
+
+    return [ids[name] for name in names]
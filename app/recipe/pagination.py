@@ -0,0 +1,37 @@
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """Keyset pagination that is used only when the client asks for it"""
+    # Clients that send neither ?cursor= nor ?page_size= keep getting
+    # the plain list they always got, so existing integrations don't break
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Paginate only when a cursor or page size is requested"""
+        params = request.query_params
+        if (self.cursor_query_param not in params and
+                self.page_size_query_param not in params):
+            return None
+
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(OptionalCursorPagination):
+    """Paginate recipes on their primary key, newest first"""
+    # The position in the cursor is the id itself, so every page is
+    # an index range scan (user_id, id < position) no matter how deep
+    ordering = ('-id',)
+
+
+class RecipeAttrCursorPagination(OptionalCursorPagination):
+    """Paginate tags and ingredients on (-name, id)"""
+    # The cursor position is the name; id breaks ties between
+    # equal names so the order is stable across pages
+    ordering = ('-name', 'id')
@@ -1,50 +1,340 @@
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.utils.translation import ugettext_lazy as _
+
 from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import MANY_RELATION_KWARGS, PKOnlyObject
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator
+
+from core import stats
+from core.metrics import TimedSerializerMixin
+from core.models import Tag, Ingredient, Recipe, RecipeStats
+
+from recipe import images, links, names
+
+
+class FastListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """List serializer that reads plain fields straight off the objects
+
+    DRF calls get_attribute and to_representation of every field of
+    every object. Here a reader is picked once per field for the whole
+    list: model attributes already of the field's output type are used
+    as they are, decimals that already have the field's decimal places
+    are formatted directly and primary key relations read the pks of
+    the prefetched objects. Other fields take the usual path.
+    """
+    # field class: type of values it outputs unchanged
+    passthrough_types = {
+        serializers.CharField: str,
+        serializers.IntegerField: int,
+        serializers.BooleanField: bool,
+    }
+
+    def to_representation(self, data):
+        if type(self.child).to_representation is not \
+                serializers.Serializer.to_representation:
+            return super().to_representation(data)
+
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        readers = [
+            (field.field_name, self._reader(field))
+            for field in self.child._readable_fields
+        ]
+        ret = []
+        for instance in iterable:
+            item = OrderedDict()
+            for name, read in readers:
+                try:
+                    item[name] = read(instance)
+                except SkipField:
+                    pass
+            ret.append(item)
+
+        return ret
+
+    def _reader(self, field):
+        """Return a function returning the representation of field"""
+        attrs = field.source_attrs
+        if len(attrs) != 1:
+            return self._generic_reader(field)
+        attr = attrs[0]
+
+        output_type = self.passthrough_types.get(type(field))
+        if output_type is not None:
+            def read(instance):
+                value = getattr(instance, attr)
+                if value is None or type(value) is output_type:
+                    return value
+                return field.to_representation(value)
+            return read
+
+        coerce_to_string = getattr(
+            field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING
+        )
+        if (type(field) is serializers.DecimalField and coerce_to_string and
+                not field.localize and field.decimal_places is not None):
+            exponent = -field.decimal_places
 
-from core.models import Tag, Ingredient, Recipe
+            def read(instance):
+                value = getattr(instance, attr)
+                if value is None:
+                    return None
+                if type(value) is Decimal and \
+                        value.as_tuple().exponent == exponent:
+                    # what quantize would return anyway
+                    return '{0:f}'.format(value)
+                return field.to_representation(value)
+            return read
 
+        if (isinstance(field, serializers.ManyRelatedField) and
+                isinstance(field.child_relation,
+                           serializers.PrimaryKeyRelatedField) and
+                field.child_relation.pk_field is None):
+            def read(instance):
+                if instance.pk is None:
+                    return []
+                # building the related manager costs more than reading
+                # the pks, skip it when the objects were prefetched
+                prefetched = getattr(
+                    instance, '_prefetched_objects_cache', {}
+                ).get(attr)
+                if prefetched is None:
+                    prefetched = getattr(instance, attr).all()
+                return [obj.pk for obj in prefetched]
+            return read
 
-class TagSerializer(serializers.ModelSerializer):
+        return self._generic_reader(field)
+
+    @staticmethod
+    def _generic_reader(field):
+        """Return a reader doing what Serializer.to_representation does"""
+        def read(instance):
+            attribute = field.get_attribute(instance)
+            check_for_none = attribute.pk \
+                if isinstance(attribute, PKOnlyObject) else attribute
+            if check_for_none is None:
+                return None
+            return field.to_representation(attribute)
+
+        return read
+
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """serializer for tag objects"""
+    # Not part of the output, it is only there so the unique
+    # (user, name) constraint can be validated before saving
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
         model = Tag
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'user')
+        list_serializer_class = FastListSerializer
         read_only_fields = ('id',)
+        validators = [
+            UniqueTogetherValidator(
+                queryset=Tag.objects.all(),
+                fields=('user', 'name'),
+                message=_('A tag with this name already exists.')
+            )
+        ]
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     """Serializer for an ingredient object"""
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
         model = Ingredient
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'user')
+        list_serializer_class = FastListSerializer
         read_only_fields = ('id',)
+        validators = [
+            UniqueTogetherValidator(
+                queryset=Ingredient.objects.all(),
+                fields=('user', 'name'),
+                message=_('An ingredient with this name already exists.')
+            )
+        ]
+
 
+class OwnedManyRelatedField(serializers.ManyRelatedField):
+    """Many OwnedPrimaryKeyRelatedField, checked with one query"""
 
-class RecipeSerializer(serializers.ModelSerializer):
+    def to_internal_value(self, data):
+        """Return the pks without repeats, all owned by the user"""
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        pks = []
+        for item in data:
+            try:
+                if isinstance(item, bool):
+                    raise TypeError
+                pk = int(item)
+                if not isinstance(item, str) and pk != item:
+                    # int() would truncate 1.9 to 1
+                    raise TypeError
+                pks.append(pk)
+            except (TypeError, ValueError, OverflowError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+        found = set(child.get_queryset().filter(
+            pk__in=pks
+        ).values_list('pk', flat=True))
+        for pk in pks:
+            if pk not in found:
+                child.fail('does_not_exist', pk_value=pk)
+
+        return list(dict.fromkeys(pks))
+
+
+class OwnedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key of one of the requesting user's objects
+
+    With many=True the pks are validated together and come out as ints
+    rather than objects, PrimaryKeyRelatedField runs a query per pk.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            user=self.context['request'].user
+        )
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return OwnedManyRelatedField(**list_kwargs)
+
+
+class DynamicFieldsMixin:
+    """Serializer that outputs a subset of its fields
+
+    fields= names the fields to keep, expand= the related fields to nest
+    in full with their serializer in expandable_fields instead of as
+    primary keys. Both are validated by the view.
+    """
+    # field name: serializer of the related objects
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            self.fields[name] = self.expandable_fields[name](
+                many=True, read_only=True
+            )
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class RecipeSerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                       serializers.ModelSerializer):
     """Serialize a recipe"""
     # list ingredients with their id,primary key
     # when we retrive full name of the ingredients, use detail API
     # this only returns ID of the ingredients and tags associated to the recipe
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = OwnedPrimaryKeyRelatedField(
         many=True,
-        queryset=Ingredient.objects.all()
+        queryset=Ingredient.objects.all(),
+        required=False
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = OwnedPrimaryKeyRelatedField(
         many=True,
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        required=False
     )
+    # Tags and ingredients can be given by name instead of id, the ones
+    # the user doesn't have yet are created. Like the ids, names sent on
+    # an update, partial or not, replace the recipe's links: a PATCH
+    # with tag_names alone drops the tags that aren't named.
+    tag_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        write_only=True,
+        required=False
+    )
+    ingredient_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        write_only=True,
+        required=False
+    )
+    # name field: the relation and model it names objects of
+    name_fields = {
+        'tag_names': ('tags', Tag),
+        'ingredient_names': ('ingredients', Ingredient),
+    }
+    # ?expand=ingredients,tags nests the objects like the detail view
+    expandable_fields = {
+        'ingredients': IngredientSerializer,
+        'tags': TagSerializer,
+    }
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'title', 'ingredients', 'tags', 'time_minutes',
-            'price', 'link'
+            'price', 'link', 'tag_names', 'ingredient_names'
         )
+        list_serializer_class = FastListSerializer
         # this is to prevent users from updating 'id' when they create and edit
         # and not to update primary key
         read_only_fields = ('id',)
 
+    # the named objects are created in the same transaction as the
+    # recipe, a failed save doesn't leave them behind
+    @transaction.atomic
+    def create(self, validated_data):
+        self._resolve_names(validated_data, validated_data['user'])
+        relations = self._pop_relations(validated_data)
+        recipe = super().create(validated_data)
+        self._set_links(recipe, relations)
+
+        return recipe
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        self._resolve_names(validated_data, instance.user)
+        relations = self._pop_relations(validated_data)
+        recipe = super().update(instance, validated_data)
+        self._set_links(recipe, relations)
+
+        return recipe
+
+    def _pop_relations(self, validated_data):
+        """Take the ids of the relations out, they are set separately"""
+        return {
+            field: validated_data.pop(field)
+            for field in ('ingredients', 'tags') if field in validated_data
+        }
+
+    @staticmethod
+    def _set_links(recipe, relations):
+        """Change only the links that differ from the given ids"""
+        for field, pks in relations.items():
+            links.set_links(recipe, field, pks)
+
+    def _resolve_names(self, validated_data, user):
+        """Add the objects given by name to their relation"""
+        for name_field, (field, model) in self.name_fields.items():
+            if name_field not in validated_data:
+                continue
+            validated_data[field] = list(
+                validated_data.get(field, [])
+            ) + names.get_or_create_names(
+                model, user, validated_data.pop(name_field)
+            )
+
 
 # Inherit from RecipeSerializer, the base of this class will be same as it
 class RecipeDetailSerializer(RecipeSerializer):
@@ -54,10 +344,267 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(TimedSerializerMixin,
+                            serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
+    # URLs of the resized copies, filled in once image_status is ready
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
-        read_only_fields = ('id',)
+        fields = ('id', 'image', 'image_status', 'image_renditions')
+        read_only_fields = ('id', 'image_status')
+
+    def validate_image(self, value):
+        """Check the size of the image from its header"""
+        # The image field opened the file to check it's an image, which
+        # only reads the header; the pixels are decoded in the background
+        width, height = value.image.size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                _('Images can have at most {max} pixels.').format(
+                    max=settings.RECIPE_IMAGE_MAX_PIXELS
+                )
+            )
+
+        return value
+
+    def get_image_renditions(self, obj):
+        return {
+            name: {
+                key: self._url(value) if key in images.FORMATS else value
+                for key, value in rendition.items()
+            }
+            for name, rendition in obj.image_renditions.items()
+        }
+
+    def _url(self, path):
+        """Return the URL of a stored file like the image field does"""
+        url = default_storage.url(path)
+        request = self.context.get('request')
+
+        return request.build_absolute_uri(url) if request else url
+
+
+class BulkListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """Validate a list of items and report errors per item
+
+    The child serializer checks everything that needs the database
+    for the whole list at once in validate_batch, so validating a batch
+    runs a fixed number of queries however long it is.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    _('Expected a list of items.')
+                ]
+            })
+        if not data or len(data) > settings.BULK_MAX_ITEMS:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    _('Send between 1 and {max} items.').format(
+                        max=settings.BULK_MAX_ITEMS
+                    )
+                ]
+            })
+
+        items = []
+        errors = []
+        for item in data:
+            try:
+                items.append(self.child.run_validation(item))
+                errors.append({})
+            except serializers.ValidationError as exc:
+                items.append(None)
+                errors.append(dict(exc.detail))
+
+        self.child.validate_batch(items, errors)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+
+class BulkItemMixin:
+    """Checks shared by the items of bulk create and update requests"""
+
+    def validate_batch(self, items, errors):
+        """Check ids of the items when updating, None items are invalid"""
+        if not self.root.partial:
+            # ids are assigned by the database on create
+            for item in items:
+                if item is not None:
+                    item.pop('id', None)
+            return
+
+        owned = self._owned(
+            self.Meta.model,
+            [item['id'] for item in items if item and 'id' in item]
+        )
+        seen = set()
+        for item, error in zip(items, errors):
+            if item is None:
+                continue
+            pk = item.get('id')
+            if pk is None:
+                error['id'] = [_('This field is required.')]
+            elif pk not in owned:
+                error['id'] = [_('Not found.')]
+            elif pk in seen:
+                error['id'] = [_('Duplicate id in this request.')]
+            seen.add(pk)
+
+    def _owned(self, model, pks):
+        """Return which of the pks belong to the requesting user"""
+        if not pks:
+            return set()
+        return set(model.objects.filter(
+            user=self.context['request'].user, pk__in=pks
+        ).values_list('pk', flat=True))
+
+
+class RecipeBulkSerializer(BulkItemMixin, serializers.ModelSerializer):
+    """Serialize one recipe of a bulk create or update"""
+    id = serializers.IntegerField(required=False)
+    # plain ids, checked for the whole batch instead of one query each
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'title', 'ingredients', 'tags', 'time_minutes',
+            'price', 'link'
+        )
+        list_serializer_class = BulkListSerializer
+
+    def validate_batch(self, items, errors):
+        super().validate_batch(items, errors)
+        for field, model in (('ingredients', Ingredient), ('tags', Tag)):
+            owned = self._owned(model, [
+                pk for item in items if item for pk in item.get(field, ())
+            ])
+            for item, error in zip(items, errors):
+                if item is None:
+                    continue
+                error[field] = [
+                    _('Invalid pk "{pk}" - object does not exist.').format(
+                        pk=pk
+                    )
+                    for pk in item.get(field, ()) if pk not in owned
+                ]
+                if not error[field]:
+                    del error[field]
+
+
+class RecipeAttrBulkSerializer(BulkItemMixin, serializers.ModelSerializer):
+    """Serialize one tag or ingredient of a bulk create or update"""
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        fields = ('id', 'name')
+        list_serializer_class = BulkListSerializer
+
+    def validate_batch(self, items, errors):
+        super().validate_batch(items, errors)
+        model = self.Meta.model
+        renamed = [item['id'] for item in items if item and 'id' in item]
+        names = [item['name'] for item in items if item and 'name' in item]
+        # names held by objects that aren't being renamed in this batch
+        taken = set(model.objects.filter(
+            user=self.context['request'].user, name__in=names
+        ).exclude(pk__in=renamed).values_list('name', flat=True))
+        seen = set()
+        for item, error in zip(items, errors):
+            if item is None or 'name' not in item:
+                continue
+            name = item['name']
+            if name in taken or name in seen:
+                error['name'] = [_('This name already exists.')]
+            seen.add(name)
+
+
+class TagBulkSerializer(RecipeAttrBulkSerializer):
+    """Serialize one tag of a bulk create or update"""
+
+    class Meta(RecipeAttrBulkSerializer.Meta):
+        model = Tag
+
+
+class IngredientBulkSerializer(RecipeAttrBulkSerializer):
+    """Serialize one ingredient of a bulk create or update"""
+
+    class Meta(RecipeAttrBulkSerializer.Meta):
+        model = Ingredient
+
+
+class LinkCountSerializer(serializers.Serializer):
+    """Serializer for a tag or ingredient with its number of recipes"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.ModelSerializer):
+    """Serializer for the summary of a user's recipes"""
+    average_time_minutes = serializers.SerializerMethodField()
+    average_price = serializers.SerializerMethodField()
+    time_histogram = serializers.SerializerMethodField()
+    price_histogram = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RecipeStats
+        fields = (
+            'recipe_count', 'average_time_minutes', 'average_price',
+            'time_histogram', 'price_histogram'
+        )
+
+    def get_average_time_minutes(self, obj):
+        if not obj.recipe_count:
+            return None
+        return round(obj.time_minutes_total / obj.recipe_count, 1)
+
+    def get_average_price(self, obj):
+        if not obj.recipe_count:
+            return None
+        # shown like the recipes' prices
+        return str((obj.price_total / obj.recipe_count).quantize(
+            Decimal('0.01')
+        ))
+
+    def get_time_histogram(self, obj):
+        return stats.histogram(stats.TIME_BUCKETS, obj.time_histogram)
+
+    def get_price_histogram(self, obj):
+        return stats.histogram(
+            [str(bound) for bound in stats.PRICE_BUCKETS],
+            obj.price_histogram
+        )
+
+
+class UploadSessionSerializer(serializers.Serializer):
+    """Serializer for starting a resumable image upload"""
+    size = serializers.IntegerField(min_value=1)
+    filename = serializers.CharField(max_length=100)
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    """Serializer for the ids of a bulk delete"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False
+    )
+
+    def validate_ids(self, value):
+        if len(value) > settings.BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                _('Send at most {max} ids.').format(
+                    max=settings.BULK_MAX_ITEMS
+                )
+            )
+        return value
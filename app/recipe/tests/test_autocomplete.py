@@ -0,0 +1,99 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import autocomplete
+
+
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+class AutocompleteApiTests(TestCase):
+    """Test the ?prefix= autocomplete of tags and ingredients"""
+
+    def setUp(self):
+        autocomplete.clear_tries()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price=5.00
+        )
+        for name in ('Salad', 'Salmon', 'Salt', 'Soup', 'Spicy'):
+            Tag.objects.create(user=self.user, name=name)
+        self.recipe.tags.add(Tag.objects.get(name='Salt'))
+
+    def suggest(self, url=TAGS_URL, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return [obj['name'] for obj in res.data]
+
+    def test_prefix_most_used_first(self):
+        """Test names with the prefix are returned, most used first"""
+        self.assertEqual(
+            self.suggest(prefix='sal'), ['Salt', 'Salad', 'Salmon']
+        )
+
+    def test_limit(self):
+        """Test only the top names are returned"""
+        self.assertEqual(self.suggest(prefix='S', limit=2), ['Salt', 'Salad'])
+
+    def test_no_match(self):
+        """Test a prefix no name has returns nothing"""
+        self.assertEqual(self.suggest(prefix='x'), [])
+
+    def test_ingredients(self):
+        """Test ingredients are suggested the same way"""
+        Ingredient.objects.create(user=self.user, name='Garlic')
+        Ingredient.objects.create(user=self.user, name='Ginger')
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        Ingredient.objects.create(user=other, name='Garam masala')
+
+        self.assertEqual(
+            self.suggest(INGREDIENTS_URL, prefix='ga'), ['Garlic']
+        )
+
+    def test_trie_answers_without_queries(self):
+        """Test repeated lookups of a user only read the generation"""
+        self.suggest(prefix='s')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.suggest(prefix='so'), ['Soup'])
+
+    def test_changes_seen(self):
+        """Test new names and usage are seen by the next lookup"""
+        self.suggest(prefix='s')
+        sauce = Tag.objects.create(user=self.user, name='Sauce')
+        self.recipe.tags.add(sauce)
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=30, price=5.00
+        ).tags.add(sauce)
+
+        self.assertEqual(self.suggest(prefix='sa')[0], 'Sauce')
+
+    @override_settings(AUTOCOMPLETE_TRIE_MAX_NAMES=2)
+    def test_database_lookup(self):
+        """Test users with many names are looked up in the database"""
+        self.assertEqual(
+            self.suggest(prefix='sal'), ['Salt', 'Salad', 'Salmon']
+        )
+        # LIKE wildcards are matched as they are
+        self.assertEqual(self.suggest(prefix='s%'), [])
+
+    def test_invalid_limit(self):
+        """Test the limit must be in range"""
+        res = self.client.get(TAGS_URL, {'prefix': 's', 'limit': 0})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,356 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status, viewsets
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe, UploadSession
+
+from recipe import bulk
+
+
+RECIPES_BULK_URL = reverse('recipe:recipe-bulk')
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
+INGREDIENTS_BULK_URL = reverse('recipe:ingredient-bulk')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=5.00
+    )
+
+
+def recipe_payload(title, **params):
+    """Return the payload of one recipe of a bulk request"""
+    payload = {'title': title, 'time_minutes': 10, 'price': '5.00'}
+    payload.update(params)
+    return payload
+
+
+class BulkRecipeApiTests(TestCase):
+    """Test the bulk recipe endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Salt'
+        )
+
+    def test_bulk_create_recipes(self):
+        """Test creating recipes with their tags and ingredients"""
+        payload = [
+            recipe_payload('Curry', tags=[self.tag.id],
+                           ingredients=[self.ingredient.id]),
+            recipe_payload('Soup'),
+        ]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['title'] for r in res.data], ['Curry', 'Soup'])
+        curry = Recipe.objects.get(id=res.data[0]['id'])
+        self.assertEqual(curry.user, self.user)
+        self.assertEqual(list(curry.tags.all()), [self.tag])
+        self.assertEqual(list(curry.ingredients.all()), [self.ingredient])
+        self.assertEqual(res.data[0]['tags'], [self.tag.id])
+
+    def test_bulk_create_queries_constant(self):
+        """Test the number of queries doesn't grow with the batch"""
+        counts = []
+        for size in (1, 20):
+            payload = [
+                recipe_payload(f'Recipe {i}', tags=[self.tag.id])
+                for i in range(size)
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(
+                    RECIPES_BULK_URL, payload, format='json'
+                )
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_errors_per_item(self):
+        """Test invalid items are reported by position, nothing is saved"""
+        other_user = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        other_tag = Tag.objects.create(user=other_user, name='Other')
+        payload = [
+            recipe_payload('Fine'),
+            recipe_payload(''),
+            recipe_payload('Tagged', tags=[other_tag.id]),
+        ]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('title', res.data[1])
+        self.assertIn('tags', res.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_recipes(self):
+        """Test updating fields and replacing links of many recipes"""
+        recipe1 = sample_recipe(self.user, 'One')
+        recipe1.tags.add(self.tag)
+        recipe2 = sample_recipe(self.user, 'Two')
+        payload = [
+            {'id': recipe1.id, 'title': 'First', 'tags': []},
+            {'id': recipe2.id, 'ingredients': [self.ingredient.id]},
+        ]
+
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.title, 'First')
+        self.assertEqual(recipe1.tags.count(), 0)
+        self.assertEqual(recipe2.title, 'Two')
+        self.assertEqual(list(recipe2.ingredients.all()), [self.ingredient])
+
+    def test_bulk_update_other_users_recipe(self):
+        """Test recipes of other users can't be updated"""
+        other_user = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        recipe = sample_recipe(other_user)
+
+        res = self.client.patch(
+            RECIPES_BULK_URL, [{'id': recipe.id, 'title': 'Mine'}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', res.data[0])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Sample recipe')
+
+    def test_bulk_delete_recipes(self):
+        """Test deleting many recipes"""
+        recipe1 = sample_recipe(self.user)
+        recipe1.tags.add(self.tag)
+        recipe2 = sample_recipe(self.user)
+        kept = sample_recipe(self.user)
+
+        res = self.client.delete(
+            RECIPES_BULK_URL, {'ids': [recipe1.id, recipe2.id]},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Recipe.objects.all()), [kept])
+        self.assertFalse(Recipe.tags.through.objects.exists())
+
+    def test_bulk_delete_recipes_uploading(self):
+        """Test a recipe with an unfinished upload can be deleted"""
+        recipe = sample_recipe(self.user)
+        UploadSession.objects.create(
+            id='a' * 32, user=self.user, recipe=recipe, size=10,
+            filename='image.jpg', expires=timezone.now()
+        )
+
+        res = self.client.delete(
+            RECIPES_BULK_URL, {'ids': [recipe.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(UploadSession.objects.exists())
+        # the foreign keys are checked at commit
+        connection.check_constraints()
+
+    def test_bulk_delete_ignores_list_filters(self):
+        """Test owned recipes are found whatever the list query params"""
+        recipe = sample_recipe(self.user, title='Curry')
+
+        res = self.client.delete(
+            f'{RECIPES_BULK_URL}?search=soup&tags={self.tag.id}',
+            {'ids': [recipe.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Recipe.objects.exists())
+
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_bulk_delete_recipes_files(self):
+        """Test the images and renditions of deleted recipes are removed"""
+        recipe = sample_recipe(self.user)
+        recipe.image.save('photo.jpg', ContentFile(b'image'))
+        rendition = default_storage.save(
+            'uploads/recipe/renditions/photo-small.jpeg', ContentFile(b'small')
+        )
+        recipe.image_renditions = {
+            'small': {'width': 1, 'height': 1, 'jpeg': rendition}
+        }
+        recipe.save()
+        # a recipe keeping the same image, which is named after its content
+        kept = sample_recipe(self.user)
+        kept.image = recipe.image.name
+        kept.save()
+        deleted = sample_recipe(self.user)
+        deleted.image.save('other.jpg', ContentFile(b'other'))
+
+        res = self.client.delete(
+            RECIPES_BULK_URL, {'ids': [recipe.id, deleted.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(default_storage.exists(kept.image.name))
+        self.assertFalse(default_storage.exists(rendition))
+        self.assertFalse(default_storage.exists(deleted.image.name))
+        kept.image.delete()
+
+    def test_bulk_delete_unknown_id(self):
+        """Test unknown ids are reported and nothing is deleted"""
+        recipe = sample_recipe(self.user)
+
+        res = self.client.delete(
+            RECIPES_BULK_URL, {'ids': [recipe.id, recipe.id + 100]},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['ids'][0], {})
+        self.assertIn('id', res.data['ids'][1])
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_create_invalidates_list_cache(self):
+        """Test a bulk create shows in the cached recipe list"""
+        self.client.get(RECIPES_URL)
+
+        self.client.post(
+            RECIPES_BULK_URL, [recipe_payload('New')], format='json'
+        )
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 1)
+
+    def test_bulk_create_indexes_search(self):
+        """Test recipes created in bulk can be searched"""
+        self.client.post(
+            RECIPES_BULK_URL,
+            [recipe_payload('Thai curry', ingredients=[self.ingredient.id])],
+            format='json'
+        )
+
+        res = self.client.get(RECIPES_URL, {'search': 'salt'})
+
+        self.assertEqual([r['title'] for r in res.data], ['Thai curry'])
+
+
+class BulkRecipeAttrApiTests(TestCase):
+    """Test the bulk tag and ingredient endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_tags(self):
+        """Test creating many tags"""
+        res = self.client.post(
+            TAGS_BULK_URL, [{'name': 'Vegan'}, {'name': 'Dessert'}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([t['name'] for t in res.data], ['Vegan', 'Dessert'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_create_ignores_list_filters(self):
+        """Test created tags are returned even if the list would hide them"""
+        res = self.client.post(
+            f'{TAGS_BULK_URL}?assigned_only=1', [{'name': 'Vegan'}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([t['name'] for t in res.data], ['Vegan'])
+
+    def test_bulk_create_duplicate_names(self):
+        """Test names already used or repeated in the batch are rejected"""
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.post(
+            INGREDIENTS_BULK_URL,
+            [{'name': 'Salt'}, {'name': 'Kale'}, {'name': 'Kale'}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', res.data[0])
+        self.assertEqual(res.data[1], {})
+        self.assertIn('name', res.data[2])
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_bulk_rename_tags(self):
+        """Test renaming tags updates the search of linked recipes"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(tag)
+
+        res = self.client.patch(
+            TAGS_BULK_URL, [{'id': tag.id, 'name': 'Breakfast'}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Breakfast')
+        res = self.client.get(RECIPES_URL, {'search': 'breakfast'})
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+
+    def test_bulk_delete_ingredients(self):
+        """Test deleting ingredients unlinks them from recipes"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        kale = Ingredient.objects.create(user=self.user, name='Kale')
+        recipe = sample_recipe(self.user)
+        recipe.ingredients.add(salt, kale)
+
+        res = self.client.delete(
+            INGREDIENTS_BULK_URL, {'ids': [salt.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(recipe.ingredients.all()), [kale])
+        res = self.client.get(RECIPES_URL, {'search': 'salt'})
+        self.assertEqual(res.data, [])
+
+
+class BulkMixinTests(TestCase):
+    """Test the contract of the bulk viewset mixin"""
+
+    def test_perform_methods_required(self):
+        """Test a viewset must implement every bulk operation"""
+        class CreateOnly(bulk.BulkMixin, viewsets.GenericViewSet):
+            def perform_bulk_create(self, items):
+                return []
+
+        with self.assertRaises(TypeError):
+            CreateOnly()
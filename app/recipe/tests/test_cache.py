@@ -0,0 +1,186 @@
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics, sync
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import cache
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def sample_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=5.00
+    )
+
+
+class NormalizeParamsTests(TestCase):
+    """Test query params normalization for cache keys"""
+
+    def test_id_lists_sorted_and_deduplicated(self):
+        """Test id order and duplicates don't change the key"""
+        one = cache.normalize_params(QueryDict('tags=10,2,2&ingredients=3'))
+        two = cache.normalize_params(QueryDict('ingredients=3&tags=2,10'))
+
+        self.assertEqual(one, two)
+
+    def test_flags_normalized(self):
+        """Test truthy assigned_only values share a key"""
+        one = cache.normalize_params(QueryDict('assigned_only=1'))
+        two = cache.normalize_params(QueryDict('assigned_only=2'))
+        off = cache.normalize_params(QueryDict('assigned_only=0'))
+
+        self.assertEqual(one, two)
+        self.assertNotEqual(one, off)
+
+
+class ResponseCacheTests(TestCase):
+    """Test the per-user cache of the list endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        cache.requests_total.clear()
+
+    def test_second_request_served_from_cache(self):
+        """Test repeating a list request hits the cache"""
+        sample_recipe(self.user)
+
+        res1 = self.client.get(RECIPES_URL)
+        # only the generation is read
+        with self.assertNumQueries(1):
+            res2 = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res1.data, res2.data)
+        self.assertEqual(cache.requests_total.get(('miss',)), 1)
+        self.assertEqual(cache.requests_total.get(('hit',)), 1)
+        self.assertIn(
+            'recipe_cache_requests_total{result="hit"} 1',
+            metrics.REGISTRY.export()
+        )
+
+    def test_create_invalidates_cache(self):
+        """Test creating an object through the API invalidates the list"""
+        self.client.get(TAGS_URL)
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['name'], 'Vegan')
+
+    def test_update_and_delete_invalidate_cache(self):
+        """Test updating and deleting a recipe invalidates the list"""
+        recipe = sample_recipe(self.user)
+        self.client.get(RECIPES_URL)
+
+        recipe.title = 'Changed'
+        recipe.save()
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['title'], 'Changed')
+
+        recipe.delete()
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data, [])
+
+    def test_m2m_change_invalidates_cache(self):
+        """Test adding tags and ingredients to a recipe invalidates lists"""
+        recipe = sample_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.client.get(RECIPES_URL)
+
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data), 1)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['tags'], [tag.id])
+        self.assertEqual(res.data[0]['ingredients'], [ingredient.id])
+
+    def test_write_of_other_process_seen(self):
+        """Test a generation taken in the database invalidates the list"""
+        recipe = sample_recipe(self.user)
+        self.client.get(RECIPES_URL)
+
+        # as another worker would, without signals in this process
+        Recipe.objects.filter(pk=recipe.pk).update(title='Changed')
+        sync.next_version(self.user.id)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data[0]['title'], 'Changed')
+
+    def test_vary(self):
+        """Test responses vary on the token and the rendering"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIn('Accept', res['Vary'])
+        self.assertIn('Authorization', res['Vary'])
+
+    def test_cache_limited_to_user(self):
+        """Test that cached responses are never shared between users"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        Ingredient.objects.create(user=user2, name='Salt')
+        self.client.get(INGREDIENTS_URL)
+
+        client2 = APIClient()
+        client2.force_authenticate(user2)
+        res = client2.get(INGREDIENTS_URL)
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['name'], 'Salt')
+
+    def test_if_none_match_returns_not_modified(self):
+        """Test that a matching ETag skips the response body"""
+        sample_recipe(self.user)
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(cache.requests_total.get(('not_modified',)), 1)
+
+    def test_etag_changes_after_write(self):
+        """Test a stale ETag gets the full response"""
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+        sample_recipe(self.user)
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(len(res.data), 1)
+
+    @override_settings(RECIPE_CACHE_ENABLED=False)
+    def test_cache_disabled(self):
+        """Test the cache can be switched off"""
+        self.client.get(RECIPES_URL)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('ETag', res)
+        self.assertEqual(cache.requests_total.get(('miss',)), 0)
@@ -0,0 +1,126 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import sync
+from core.models import Recipe
+
+from recipe import images
+
+from user.authentication import token_cache
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ConditionalGetMiddlewareTests(TestCase):
+    """Test 304 responses from the user's cache generation"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Pancakes',
+            time_minutes=10,
+            price=5.00
+        )
+
+    def test_not_modified_before_view(self):
+        """Test a matching ETag returns 304 before the view runs"""
+        res = self.client.get(detail_url(self.recipe.id))
+        etag = res['ETag']
+
+        # only the generation is read
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(
+                detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+            )
+
+        self.assertEqual(
+            not_modified.status_code, status.HTTP_304_NOT_MODIFIED
+        )
+        self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(not_modified['Vary'], res['Vary'])
+
+    def test_write_of_other_process_changes_etag(self):
+        """Test a generation taken in the database makes the ETag stale"""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+
+        # as another worker would, without signals in this process
+        Recipe.objects.filter(pk=self.recipe.pk).update(title='Waffles')
+        sync.next_version(self.user.id)
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'Waffles')
+
+    def test_list_etag_same_as_cache(self):
+        """Test list responses keep the ETag the response cache gives"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_changes_after_write(self):
+        """Test a write makes the old ETag stale"""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        self.client.patch(detail_url(self.recipe.id), {'title': 'Waffles'})
+
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'Waffles')
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_etag_per_query(self):
+        """Test the ETag of other query params doesn't match"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(
+            RECIPES_URL, {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_invalid_token_not_answered(self):
+        """Test requests with a bad token still get the view's error"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token wrong')
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_image_processing_changes_etag(self):
+        """Test polling the image status sees the background update"""
+        Recipe.objects.filter(pk=self.recipe.pk).update(image='x.jpg')
+        url = reverse('recipe:recipe-upload-image', args=[self.recipe.id])
+        etag = self.client.get(url)['ETag']
+
+        # the file doesn't exist, so processing fails
+        with self.assertLogs('recipe.images'):
+            images.process(self.recipe.id, 'x.jpg')
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_status'], Recipe.IMAGE_FAILED)
@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.test import TestCase
+
+from rest_framework.serializers import ListSerializer
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.serializers import FastListSerializer, RecipeSerializer, \
+    RecipeDetailSerializer, TagSerializer, IngredientSerializer
+
+
+class FastListSerializerTests(TestCase):
+    """Test the fast path returns what DRF's list serialization does"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        for n in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {n}',
+                time_minutes=n,
+                price='4.5',
+                link='' if n else 'https://example.com'
+            )
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'T{n}'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'I{n}')
+            )
+
+    def assertSameAsDRF(self, serializer_class, objs, **kwargs):
+        fast = serializer_class(objs, many=True, **kwargs)
+        drf = ListSerializer(objs, child=serializer_class(**kwargs))
+
+        self.assertIsInstance(fast, FastListSerializer)
+        self.assertEqual(fast.data, drf.data)
+
+    def test_recipes(self):
+        """Test recipes with prefetched relations"""
+        recipes = list(Recipe.objects.prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+            'ingredients'
+        ))
+
+        self.assertSameAsDRF(RecipeSerializer, recipes)
+        self.assertSameAsDRF(RecipeDetailSerializer, recipes)
+        self.assertSameAsDRF(
+            RecipeSerializer, recipes, fields=['id', 'tags'], expand=['tags']
+        )
+
+    def test_recipes_not_prefetched(self):
+        """Test related objects are queried when they weren't prefetched"""
+        self.assertSameAsDRF(RecipeSerializer, Recipe.objects.all())
+
+    def test_unsaved_values(self):
+        """Test values not loaded from the database are converted"""
+        recipe = Recipe(user=self.user, title='New', time_minutes='5',
+                        price=5.999)
+
+        self.assertEqual(
+            RecipeSerializer([recipe], many=True).data[0]['price'], '6.00'
+        )
+        self.assertSameAsDRF(RecipeSerializer, [recipe])
+
+    def test_tags_and_ingredients(self):
+        """Test tag and ingredient lists"""
+        self.assertSameAsDRF(TagSerializer, Tag.objects.all())
+        self.assertSameAsDRF(IngredientSerializer, Ingredient.objects.all())
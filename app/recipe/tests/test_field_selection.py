@@ -0,0 +1,124 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class RecipeFieldSelectionTests(TestCase):
+    """Test the fields= and expand= query params of the recipe API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Thai curry',
+            time_minutes=30,
+            price=8.00
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Coconut milk'
+        )
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.ingredient)
+
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # leave out the read of the cache generation
+        self.queries = [
+            query['sql'] for query in ctx.captured_queries
+            if 'core_changecounter' not in query['sql']
+        ]
+
+        return res
+
+    def test_sparse_fields(self):
+        """Test only the requested fields are returned and loaded"""
+        res = self.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(
+            res.data, [{'id': self.recipe.id, 'title': 'Thai curry'}]
+        )
+        self.assertEqual(len(self.queries), 1)
+        self.assertNotIn('"price"', self.queries[0])
+        self.assertNotIn('"image_renditions"', self.queries[0])
+
+    def test_expand(self):
+        """Test expanded relations are nested objects"""
+        res = self.get(RECIPES_URL, {'expand': 'ingredients,tags'})
+
+        recipe = res.data[0]
+        self.assertEqual(
+            recipe['tags'], [{'id': self.tag.id, 'name': 'Vegan'}]
+        )
+        self.assertEqual(
+            recipe['ingredients'],
+            [{'id': self.ingredient.id, 'name': 'Coconut milk'}]
+        )
+        self.assertEqual(recipe['title'], 'Thai curry')
+        self.assertEqual(len(self.queries), 3)
+
+    def test_expand_with_fields(self):
+        """Test expanding a field includes it with the other fields"""
+        res = self.get(RECIPES_URL, {'fields': 'id', 'expand': 'tags'})
+
+        self.assertEqual(res.data, [{
+            'id': self.recipe.id,
+            'tags': [{'id': self.tag.id, 'name': 'Vegan'}],
+        }])
+        # ingredients aren't requested so they aren't prefetched
+        self.assertEqual(len(self.queries), 2)
+        self.assertFalse(
+            any('core_ingredient' in query for query in self.queries)
+        )
+
+    def test_default_fields_unchanged(self):
+        """Test lists without params keep returning primary keys"""
+        res = self.get(RECIPES_URL, {})
+
+        self.assertEqual(res.data[0]['tags'], [self.tag.id])
+        self.assertIn('price', res.data[0])
+
+    def test_retrieve_fields(self):
+        """Test the detail endpoint returns the selected fields"""
+        res = self.get(
+            detail_url(self.recipe.id), {'fields': 'title,ingredients'}
+        )
+
+        self.assertEqual(res.data, {
+            'title': 'Thai curry',
+            'ingredients': [
+                {'id': self.ingredient.id, 'name': 'Coconut milk'}
+            ],
+        })
+
+    def test_unknown_field_rejected(self):
+        """Test asking for fields that don't exist returns an error"""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,secret'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+        res = self.client.get(RECIPES_URL, {'expand': 'title'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', res.data)
@@ -0,0 +1,237 @@
+import io
+import os
+import tempfile
+from datetime import timedelta
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, UploadSession
+
+
+def image_upload_url(recipe_id):
+    """Return URL for recipe image upload"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def upload_sessions_url(recipe_id):
+    """Return URL for starting a resumable upload"""
+    return reverse('recipe:recipe-upload-sessions', args=[recipe_id])
+
+
+def sample_image_bytes(size=(50, 50)):
+    """Return the bytes of a JPEG image"""
+    buf = io.BytesIO()
+    Image.new('RGB', size).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+def sample_recipe(user):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title='Sample recipe',
+        time_minutes=10,
+        price=5.00
+    )
+
+
+class ImageUploadTestCase(TestCase):
+    """Authenticated client, a recipe and a temporary session directory"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+        self.session_dir = tempfile.TemporaryDirectory()
+        session_settings = override_settings(
+            RECIPE_UPLOAD_SESSION_DIR=self.session_dir.name
+        )
+        session_settings.enable()
+        self.addCleanup(session_settings.disable)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            self.recipe.image.delete()
+        self.session_dir.cleanup()
+
+    def upload(self, data):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(data)
+            ntf.seek(0)
+            return self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+
+
+class StreamingUploadTests(ImageUploadTestCase):
+    """Test the limits checked while an image is uploaded"""
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_upload_too_large_rejected(self):
+        """Test uploads over the size limit are stopped"""
+        res = self.upload(os.urandom(4096))
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_image_too_many_pixels_rejected(self):
+        """Test images with too many pixels are rejected from the header"""
+        res = self.upload(sample_image_bytes((20, 20)))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+
+class ResumableUploadTests(ImageUploadTestCase):
+    """Test uploading an image in several requests"""
+
+    def start(self, data):
+        res = self.client.post(
+            upload_sessions_url(self.recipe.id),
+            {'size': len(data), 'filename': 'photo.jpg'},
+            format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res['Location']
+
+    def send(self, url, chunk, offset):
+        return self.client.generic(
+            'PATCH', url, chunk,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_upload_in_chunks(self):
+        """Test the image is saved when the last chunk arrives"""
+        data = sample_image_bytes()
+        url = self.start(data)
+
+        res = self.send(url, data[:100], 0)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Upload-Offset'], '100')
+
+        res = self.send(url, data[100:], 100)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_status'], Recipe.IMAGE_PENDING)
+        self.recipe.refresh_from_db()
+        with self.recipe.image.open() as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(os.listdir(self.session_dir.name), [])
+
+    def test_resume_from_offset(self):
+        """Test the received offset can be asked for after an error"""
+        data = sample_image_bytes()
+        url = self.start(data)
+        self.send(url, data[:100], 0)
+
+        res = self.client.head(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Upload-Offset'], '100')
+        self.assertEqual(res['Upload-Length'], str(len(data)))
+
+    def test_wrong_offset_conflict(self):
+        """Test chunks sent at the wrong offset are rejected"""
+        data = sample_image_bytes()
+        url = self.start(data)
+
+        res = self.send(url, data[100:], 100)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_chunk_past_size_rejected(self):
+        """Test a session doesn't accept more than its declared size"""
+        data = sample_image_bytes()
+        url = self.start(data)
+
+        res = self.send(url, data + b'extra', 0)
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    def test_invalid_image_rejected(self):
+        """Test a completed upload that isn't an image is discarded"""
+        url = self.start(b'not an image')
+
+        res = self.send(url, b'not an image', 0)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(os.listdir(self.session_dir.name), [])
+
+    def test_other_users_session_not_found(self):
+        """Test sessions can only be used by the user who started them"""
+        url = self.start(sample_image_bytes())
+        other_user = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other_user)
+
+        res = self.client.head(url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_session_kept_outside_the_process(self):
+        """Test a chunk is taken whatever the worker's cache holds"""
+        data = sample_image_bytes()
+        url = self.start(data)
+        self.send(url, data[:100], 0)
+        cache.clear()
+
+        res = self.send(url, data[100:], 100)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_concurrent_write_conflict(self):
+        """Test a chunk isn't written while another request writes one"""
+        url = self.start(sample_image_bytes())
+        UploadSession.objects.update(
+            locked_until=timezone.now() + timedelta(seconds=30)
+        )
+
+        res = self.send(url, b'abc', 0)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_expired_session_not_found(self):
+        """Test a session can't be resumed once it expired"""
+        url = self.start(sample_image_bytes())
+        UploadSession.objects.update(expires=timezone.now())
+
+        res = self.client.head(url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cancel_upload(self):
+        """Test cancelling a session deletes what was uploaded"""
+        url = self.start(sample_image_bytes())
+
+        res = self.client.delete(url)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(os.listdir(self.session_dir.name), [])
+        self.assertEqual(
+            self.client.head(url).status_code, status.HTTP_404_NOT_FOUND
+        )
@@ -76,6 +76,17 @@ class PrivateIngredientsAPITests(TestCase):
         ).exists()
         self.assertTrue(exists)
 
+    def test_create_ingredient_duplicate_name(self):
+        """Test creating an ingredient with an existing name fails"""
+        Ingredient.objects.create(user=self.user, name='Cabbage')
+
+        res = self.client.post(INGREDIENTS_URL, {'name': 'Cabbage'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 1
+        )
+
     def test_create_ingredient_invalid(self):
         """Test creating invalid ingredient fails"""
         payload = {'name': ''}
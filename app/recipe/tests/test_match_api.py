@@ -0,0 +1,187 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe
+
+from recipe import matching
+
+
+MATCH_URL = reverse('recipe:recipe-match')
+
+
+def sample_recipe(user, title, ingredients):
+    """Create and return a sample recipe with the given ingredients"""
+    recipe = Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=5.00
+    )
+    recipe.ingredients.add(*ingredients)
+
+    return recipe
+
+
+class RecipeIndexTests(SimpleTestCase):
+    """Test the ingredient bitset index"""
+
+    def setUp(self):
+        # recipe: ingredients
+        self.index = matching.RecipeIndex([
+            (1, 10), (1, 11),
+            (2, 10), (2, 12), (2, 13),
+            (3, 13),
+        ])
+
+    def test_missing_counts(self):
+        """Test recipes are grouped by the number they miss"""
+        counts = self.index.missing_counts([10, 11], 2)
+
+        # positions are newest first: recipe 3, 2, 1
+        self.assertEqual(counts, [0b100, 0b001, 0b010])
+
+    def test_match_order(self):
+        """Test fewest missing come first, then the newest"""
+        matches, total = self.index.match([13], 2, 10)
+
+        self.assertEqual(matches, [
+            (3, []), (2, [10, 12]), (1, [10, 11]),
+        ])
+        self.assertEqual(total, 3)
+
+    def test_match_limit(self):
+        """Test the limit cuts the matches but not the total"""
+        matches, total = self.index.match([10, 11, 12, 13], 0, 2)
+
+        self.assertEqual([recipe_id for recipe_id, _ in matches], [3, 2])
+        self.assertEqual(total, 3)
+
+    def test_unknown_ingredients_ignored(self):
+        """Test ids of no indexed recipe don't match anything"""
+        matches, total = self.index.match([99], 0, 10)
+
+        self.assertEqual(matches, [])
+        self.assertEqual(total, 0)
+
+    def test_recipe_without_ingredients(self):
+        """Test a recipe without ingredients misses nothing"""
+        index = matching.RecipeIndex([(1, 10), (2, None)])
+
+        matches, total = index.match([], 0, 10)
+
+        self.assertEqual(matches, [(2, [])])
+        self.assertEqual(total, 1)
+
+    def test_set_bits(self):
+        """Test set bit positions are found lowest first"""
+        self.assertEqual(list(matching.set_bits(0b101001)), [0, 3, 5])
+        self.assertEqual(list(matching.set_bits(0)), [])
+
+
+class MatchApiTests(TestCase):
+    """Test the what can I cook endpoint"""
+
+    def setUp(self):
+        matching.clear_indexes()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.egg = Ingredient.objects.create(user=self.user, name='Egg')
+        self.flour = Ingredient.objects.create(user=self.user, name='Flour')
+        self.milk = Ingredient.objects.create(user=self.user, name='Milk')
+        self.omelette = sample_recipe(self.user, 'Omelette', [self.egg])
+        self.pancakes = sample_recipe(
+            self.user, 'Pancakes', [self.egg, self.flour, self.milk]
+        )
+
+    def match(self, **params):
+        res = self.client.get(MATCH_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = APIClient().get(MATCH_URL, {'ingredients': self.egg.id})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_all_available(self):
+        """Test only recipes with everything at hand match by default"""
+        data = self.match(ingredients=f'{self.egg.id}')
+
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['title'], 'Omelette')
+        self.assertEqual(data['results'][0]['missing'], 0)
+
+    def test_missing_ranked(self):
+        """Test recipes missing more ingredients rank lower"""
+        data = self.match(
+            ingredients=f'{self.egg.id},{self.milk.id}', max_missing=1
+        )
+
+        self.assertEqual(
+            [(r['title'], r['missing'], r['missing_ingredients'])
+             for r in data['results']],
+            [('Omelette', 0, []), ('Pancakes', 1, [self.flour.id])]
+        )
+
+    def test_other_users_not_matched(self):
+        """Test only the user's recipes are matched"""
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        salt = Ingredient.objects.create(user=other, name='Salt')
+        sample_recipe(other, 'Salty', [salt])
+
+        data = self.match(ingredients=f'{salt.id}')
+
+        self.assertEqual(data['results'], [])
+
+    def test_index_rebuilt_on_change(self):
+        """Test changed ingredients are seen by the next match"""
+        self.match(ingredients=f'{self.flour.id}')
+        self.omelette.ingredients.add(self.flour)
+        self.omelette.ingredients.remove(self.egg)
+
+        data = self.match(ingredients=f'{self.flour.id}')
+
+        self.assertEqual(
+            [r['title'] for r in data['results']], ['Omelette']
+        )
+
+    def test_index_reused(self):
+        """Test an unchanged index is not read again"""
+        self.match(ingredients=f'{self.egg.id}')
+
+        # the generation, the matched recipes, their ingredients and tags
+        with self.assertNumQueries(4):
+            self.match(ingredients=f'{self.egg.id}')
+
+    def test_recipe_without_ingredients_matched(self):
+        """Test recipes that need no ingredients are matched"""
+        Recipe.objects.create(
+            user=self.user, title='Water', time_minutes=1, price=0
+        )
+
+        data = self.match(ingredients=f'{self.milk.id}')
+
+        self.assertEqual(
+            [r['title'] for r in data['results']], ['Water']
+        )
+
+    def test_invalid_params(self):
+        """Test the ingredients are required and numbers checked"""
+        for params in ({}, {'ingredients': 'abc'},
+                       {'ingredients': '1', 'max_missing': '99'},
+                       {'ingredients': '1', 'limit': '0'}):
+            res = self.client.get(MATCH_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def sample_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=5.00
+    )
+
+
+class CursorPaginationTests(TestCase):
+    """Test keyset pagination of the recipe API list endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _walk(self, url, page_size):
+        """Follow next links from the first page and return all results"""
+        results = []
+        res = self.client.get(url, {'page_size': page_size})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            results.extend(res.data['results'])
+            if not res.data['next']:
+                return results
+            res = self.client.get(res.data['next'])
+
+    def test_list_unpaginated_by_default(self):
+        """Test that a plain list is returned without pagination params"""
+        sample_recipe(self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(res.data, list)
+
+    def test_recipes_paginated_newest_first(self):
+        """Test walking recipe pages returns every recipe once"""
+        recipes = [
+            sample_recipe(self.user, title=f'Recipe {i}') for i in range(5)
+        ]
+
+        results = self._walk(RECIPES_URL, page_size=2)
+
+        ids = [recipe.id for recipe in reversed(recipes)]
+        self.assertEqual([item['id'] for item in results], ids)
+
+    def test_recipes_page_has_cursor_links(self):
+        """Test the first page links to the next one only"""
+        for i in range(3):
+            sample_recipe(self.user, title=f'Recipe {i}')
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIn('cursor=', res.data['next'])
+        self.assertIsNone(res.data['previous'])
+
+    def test_tags_paginated_by_name(self):
+        """Test walking tag pages keeps the -name ordering"""
+        for name in ('Vegan', 'Dessert', 'Lunch', 'Breakfast', 'Curry'):
+            Tag.objects.create(user=self.user, name=name)
+
+        results = self._walk(TAGS_URL, page_size=2)
+
+        names = [item['name'] for item in results]
+        self.assertEqual(
+            names,
+            ['Vegan', 'Lunch', 'Dessert', 'Curry', 'Breakfast']
+        )
+
+    def test_ingredients_paginated_by_name(self):
+        """Test walking ingredient pages keeps the -name ordering"""
+        for name in ('Salt', 'Kale', 'Eggs'):
+            Ingredient.objects.create(user=self.user, name=name)
+
+        results = self._walk(INGREDIENTS_URL, page_size=1)
+
+        names = [item['name'] for item in results]
+        self.assertEqual(names, ['Salt', 'Kale', 'Eggs'])
+
+    @override_settings(API_MAX_PAGE_SIZE=2)
+    def test_page_size_capped(self):
+        """Test that the page size can't exceed the configured maximum"""
+        for i in range(4):
+            sample_recipe(self.user, title=f'Recipe {i}')
+
+        res = self.client.get(RECIPES_URL, {'page_size': 50})
+
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected"""
+        res = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
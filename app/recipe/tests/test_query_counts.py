@@ -0,0 +1,140 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class QueryCountMixin:
+    """Helpers to catch N+1 queries in API tests"""
+
+    def count_queries(self, func):
+        """Run func and return the number of queries it executed"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = func()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, func, grow, sizes=(1, 5, 20)):
+        """Assert func runs the same number of queries as data grows
+
+        grow(n) is called before each measurement and should bring
+        the data set up to n objects.
+        """
+        counts = []
+        for size in sizes:
+            grow(size)
+            counts.append(self.count_queries(func))
+
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'Query count grows with data size: '
+            f'{dict(zip(sizes, counts))}'
+        )
+
+
+class RecipeQueryCountTests(QueryCountMixin, TestCase):
+    """Test the recipe endpoints don't issue N+1 queries"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipes = []
+
+    def _grow_recipes(self, size):
+        """Create recipes with two tags and ingredients each up to size"""
+        while len(self.recipes) < size:
+            n = len(self.recipes)
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {n}',
+                time_minutes=10,
+                price=5.00
+            )
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {n}a'),
+                Tag.objects.create(user=self.user, name=f'Tag {n}b'),
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Ing {n}a'),
+                Ingredient.objects.create(user=self.user, name=f'Ing {n}b'),
+            )
+            self.recipes.append(recipe)
+
+    def test_list_recipes_constant_queries(self):
+        """Test listing recipes doesn't run a query per recipe"""
+        self.assertConstantQueries(
+            lambda: self.client.get(RECIPES_URL),
+            self._grow_recipes
+        )
+
+    def test_list_recipes_paginated_constant_queries(self):
+        """Test a page of recipes doesn't run a query per recipe"""
+        self.assertConstantQueries(
+            lambda: self.client.get(RECIPES_URL, {'page_size': 50}),
+            self._grow_recipes
+        )
+
+    def test_filter_recipes_constant_queries(self):
+        """Test filtering recipes doesn't run a query per recipe"""
+        tag_ids = []
+
+        def grow(size):
+            self._grow_recipes(size)
+            tag_ids[:] = Tag.objects.values_list('id', flat=True)
+
+        self.assertConstantQueries(
+            lambda: self.client.get(
+                RECIPES_URL,
+                {'tags': ','.join(str(tag_id) for tag_id in tag_ids)}
+            ),
+            grow
+        )
+
+    def test_retrieve_recipe_constant_queries(self):
+        """Test recipe detail queries don't grow with related objects"""
+        self._grow_recipes(1)
+        recipe = self.recipes[0]
+
+        def grow(size):
+            while recipe.tags.count() < size:
+                n = recipe.tags.count()
+                recipe.tags.add(
+                    Tag.objects.create(user=self.user, name=f'Extra {n}')
+                )
+                recipe.ingredients.add(
+                    Ingredient.objects.create(user=self.user, name=f'X {n}')
+                )
+
+        self.assertConstantQueries(
+            lambda: self.client.get(detail_url(recipe.id)),
+            grow
+        )
+
+    def test_retrieve_recipe_query_count(self):
+        """Test recipe detail loads recipe, ingredients and tags only"""
+        self._grow_recipes(1)
+
+        count = self.count_queries(
+            lambda: self.client.get(detail_url(self.recipes[0].id))
+        )
+
+        self.assertEqual(count, 3)
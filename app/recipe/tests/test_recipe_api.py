@@ -204,6 +204,69 @@ class PrivateRecipeAPITests(TestCase):
         # check if new tag in tags from database
         self.assertIn(new_tag, tags)
 
+    def test_filter_recipes_by_tags_unique(self):
+        """Test a recipe matching several tags is returned once"""
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        ingredient1 = sample_ingredient(user=self.user, name='Kale')
+        ingredient2 = sample_ingredient(user=self.user, name='Salt')
+        recipe.tags.add(tag1, tag2)
+        recipe.ingredients.add(ingredient1, ingredient2)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{tag1.id},{tag2.id}',
+            'ingredients': f'{ingredient1.id},{ingredient2.id}',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['id'], recipe.id)
+
+    def test_filter_recipes_match_all_tags(self):
+        """Test match=all only returns recipes having every tag"""
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        both = sample_recipe(user=self.user, title='Vegan brownies')
+        both.tags.add(tag1, tag2)
+        one = sample_recipe(user=self.user, title='Vegan curry')
+        one.tags.add(tag1)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{tag1.id},{tag2.id},{tag2.id}',
+            'match': 'all',
+        })
+
+        self.assertEqual([item['id'] for item in res.data], [both.id])
+
+    def test_filter_recipes_match_all_ingredients(self):
+        """Test match=all applies to ingredients as well"""
+        ingredient1 = sample_ingredient(user=self.user, name='Eggs')
+        ingredient2 = sample_ingredient(user=self.user, name='Flour')
+        both = sample_recipe(user=self.user, title='Pancakes')
+        both.ingredients.add(ingredient1, ingredient2)
+        one = sample_recipe(user=self.user, title='Omelette')
+        one.ingredients.add(ingredient1)
+
+        res = self.client.get(RECIPES_URL, {
+            'ingredients': f'{ingredient1.id},{ingredient2.id}',
+            'match': 'all',
+        })
+
+        self.assertEqual([item['id'] for item in res.data], [both.id])
+
+    def test_filter_recipes_invalid_match(self):
+        """Test an unknown match mode is rejected"""
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_recipes_invalid_ids(self):
+        """Test that ids that aren't integers are rejected"""
+        res = self.client.get(RECIPES_URL, {'tags': '1,abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def tast_full_update_recipe(self):
         """Test updating a recipe with put"""
         recipe = sample_recipe(user=self.user)
@@ -0,0 +1,127 @@
+import io
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe import images
+
+
+# EXIF block with only the orientation tag set to 6 (rotate 90° CW)
+EXIF_ROTATED = (
+    b'Exif\x00\x00II*\x00\x08\x00\x00\x00\x01\x00'
+    b'\x12\x01\x03\x00\x01\x00\x00\x00\x06\x00\x00\x00\x00\x00\x00\x00'
+)
+
+
+def image_upload_url(recipe_id):
+    """Return URL for recipe image upload"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def sample_image(size=(400, 200), **params):
+    """Return a JPEG file of the given size"""
+    buf = io.BytesIO()
+    Image.new('RGB', size).save(buf, format='JPEG', **params)
+    upload = ContentFile(buf.getvalue(), name='photo.jpg')
+
+    return upload
+
+
+@override_settings(RECIPE_IMAGE_EAGER=True)
+class RecipeImageProcessingTests(TestCase):
+    """Test the renditions made of uploaded recipe images"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=5.00
+        )
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        images.delete_renditions(self.recipe.image_renditions)
+        self.recipe.image.delete()
+
+    def test_upload_makes_renditions(self):
+        """Test resized renditions are recorded on the recipe"""
+        res = self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': sample_image()},
+            format='multipart'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+        thumbnail = self.recipe.image_renditions['thumbnail']
+        self.assertEqual((thumbnail['width'], thumbnail['height']), (150, 75))
+        self.assertTrue(default_storage.exists(thumbnail['jpeg']))
+
+    def test_renditions_upright_without_metadata(self):
+        """Test the EXIF orientation is applied and metadata dropped"""
+        self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': sample_image(exif=EXIF_ROTATED)},
+            format='multipart'
+        )
+
+        self.recipe.refresh_from_db()
+        small = self.recipe.image_renditions['small']
+        self.assertEqual((small['width'], small['height']), (200, 400))
+        with default_storage.open(small['jpeg']) as f:
+            self.assertNotIn('exif', Image.open(f).info)
+
+    def test_poll_image_status(self):
+        """Test the status and rendition URLs can be polled"""
+        self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': sample_image()},
+            format='multipart'
+        )
+
+        res = self.client.get(image_upload_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_status'], Recipe.IMAGE_READY)
+        url = res.data['image_renditions']['large']['jpeg']
+        self.assertTrue(url.startswith('http://testserver/media/'))
+
+    def test_unreadable_image_failed(self):
+        """Test an image that can't be processed is marked failed"""
+        self.recipe.image.save('broken.jpg', ContentFile(b'not an image'))
+
+        with self.assertLogs('recipe.images', 'ERROR'):
+            images.process(self.recipe.id, self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_FAILED)
+
+    def test_replaced_image_not_recorded(self):
+        """Test renditions of an image replaced meanwhile are discarded"""
+        self.recipe.image.save('photo.jpg', sample_image())
+        old_name = self.recipe.image.name
+        self.recipe.image.save('new.jpg', sample_image())
+
+        images.process(self.recipe.id, old_name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_renditions, {})
+        default_storage.delete(old_name)
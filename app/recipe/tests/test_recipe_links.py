@@ -0,0 +1,204 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import links
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class RecipeLinksApiTests(TestCase):
+    """Test setting the tags and ingredients of a recipe"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price=8.00
+        )
+
+    def tags(self, n, prefix='Tag'):
+        return [
+            Tag.objects.create(user=self.user, name=f'{prefix} {i}').id
+            for i in range(n)
+        ]
+
+    def patch(self, payload):
+        return self.client.patch(
+            detail_url(self.recipe.id), payload, format='json'
+        )
+
+    def test_other_users_pks_rejected(self):
+        """Test linking another user's tag is refused"""
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        theirs = Tag.objects.create(user=other, name='Theirs')
+        mine = self.tags(1)
+
+        res = self.patch({'tags': mine + [theirs.id]})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['tags'],
+            [f'Invalid pk "{theirs.id}" - object does not exist.']
+        )
+        self.assertFalse(self.recipe.tags.exists())
+
+    def test_invalid_pk_type(self):
+        """Test pks that aren't numbers are refused"""
+        res = self.patch({'ingredients': ['abc']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ingredients', res.data)
+
+    def test_non_integral_pks_rejected(self):
+        """Test fractional pks aren't truncated to another object's pk"""
+        tag = self.tags(1)[0]
+
+        for pk in (tag + 0.9, f'{tag}.5'):
+            res = self.patch({'tags': [pk]})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('Incorrect type', res.data['tags'][0])
+        self.assertFalse(self.recipe.tags.exists())
+
+    def test_only_differences_written(self):
+        """Test links that stay are neither deleted nor inserted again"""
+        kept, removed, added = self.tags(3)
+        self.recipe.tags.add(kept, removed)
+        through = Recipe.tags.through
+        kept_row = through.objects.get(recipe=self.recipe, tag_id=kept).id
+
+        res = self.patch({'tags': [kept, added, added]})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(res.data['tags']), sorted([kept, added]))
+        self.assertEqual(
+            through.objects.get(recipe=self.recipe, tag_id=kept).id,
+            kept_row
+        )
+        self.assertFalse(through.objects.filter(tag_id=removed).exists())
+
+    def test_constant_queries(self):
+        """Test the number of queries doesn't grow with the pks"""
+        def count(n):
+            self.recipe = Recipe.objects.create(
+                user=self.user, title='Curry', time_minutes=30, price=8.00
+            )
+            old = self.tags(n, f'Old {n}')
+            self.recipe.tags.set(old)
+            new = self.tags(n, f'New {n}')
+            ingredients = [
+                Ingredient.objects.create(
+                    user=self.user, name=f'Ingredient {n} {i}'
+                ).id
+                for i in range(n)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                res = self.patch({
+                    'tags': old[:n // 2] + new, 'ingredients': ingredients
+                })
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        self.assertEqual(count(2), count(20))
+
+    def test_links_followed_by_counts(self):
+        """Test changed links update the tags' recipe counts"""
+        old, new = self.tags(2)
+        self.recipe.tags.add(old)
+
+        self.patch({'tags': [new]})
+
+        self.assertEqual(Tag.objects.get(id=old).recipe_count, 0)
+        self.assertEqual(Tag.objects.get(id=new).recipe_count, 1)
+
+    def test_links_followed_by_search(self):
+        """Test a recipe can be searched by a tag linked on update"""
+        tag = Tag.objects.create(user=self.user, name='Vegetarian')
+
+        self.patch({'tags': [tag.id]})
+        res = self.client.get(RECIPES_URL, {'search': 'vegetarian'})
+
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data],
+            [self.recipe.id]
+        )
+
+    def test_links_kept_when_left_out(self):
+        """Test a partial update without the relation leaves it alone"""
+        tag = self.tags(1)
+        self.recipe.tags.set(tag)
+
+        self.patch({'title': 'Green curry'})
+
+        self.assertEqual(
+            list(self.recipe.tags.values_list('id', flat=True)), tag
+        )
+
+
+class SetLinksTests(TestCase):
+    """Test applying the difference between old and new links"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price=8.00
+        )
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+
+    def test_unchanged_writes_nothing(self):
+        """Test the same links only cost the read of the current ones"""
+        self.recipe.ingredients.add(self.salt)
+
+        with self.assertNumQueries(1):
+            links.set_links(self.recipe, 'ingredients', [self.salt.id])
+
+    def test_removed_with_one_delete(self):
+        """Test removed links cost one DELETE after the read"""
+        self.recipe.ingredients.add(self.salt, self.rice)
+
+        with CaptureQueriesContext(connection) as queries:
+            links.set_links(self.recipe, 'ingredients', [])
+
+        # the rest are the signals' updates of search vectors and counts
+        statements = [
+            query['sql'].split()[0] for query in queries.captured_queries
+            if query['sql'].split()[0] != 'UPDATE'
+        ]
+        self.assertEqual(statements[0], 'SELECT')
+        self.assertEqual(statements.count('DELETE'), 1)
+        self.assertEqual(statements.count('SELECT'), 1)
+        self.assertFalse(self.recipe.ingredients.exists())
+
+    def test_prefetched_links_dropped(self):
+        """Test links prefetched before the change are read again"""
+        recipe = Recipe.objects.prefetch_related('ingredients').get(
+            id=self.recipe.id
+        )
+
+        links.set_links(recipe, 'ingredients', [self.rice.id])
+
+        self.assertEqual(list(recipe.ingredients.all()), [self.rice])
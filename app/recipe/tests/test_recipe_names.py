@@ -0,0 +1,198 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import names
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class RecipeNamesApiTests(TestCase):
+    """Test giving recipe tags and ingredients by name"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def create(self, **payload):
+        payload = dict(
+            {'title': 'Curry', 'time_minutes': 30, 'price': '8.00'},
+            **payload
+        )
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        return Recipe.objects.get(id=res.data['id'])
+
+    def test_create_with_names(self):
+        """Test existing names are reused and missing ones created"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+
+        recipe = self.create(
+            tag_names=['Vegan', 'Spicy'],
+            ingredient_names=['Rice', 'Chili', 'Rice']
+        )
+
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertIn(vegan, recipe.tags.all())
+        self.assertEqual(
+            sorted(recipe.ingredients.values_list('name', flat=True)),
+            ['Chili', 'Rice']
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_names_and_ids_combined(self):
+        """Test names add to the ids that were sent"""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+
+        recipe = self.create(tags=[tag.id], tag_names=['Quick'])
+
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Dinner', 'Quick']
+        )
+
+    def test_other_users_names_not_used(self):
+        """Test another user's object of the same name isn't linked"""
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        theirs = Ingredient.objects.create(user=other, name='Salt')
+
+        recipe = self.create(ingredient_names=['Salt'])
+
+        ingredient = recipe.ingredients.get()
+        self.assertNotEqual(ingredient.id, theirs.id)
+        self.assertEqual(ingredient.user, self.user)
+
+    def test_update_with_names(self):
+        """Test names given on update replace the links"""
+        recipe = self.create(tag_names=['Old'])
+
+        res = self.client.patch(
+            detail_url(recipe.id), {'tag_names': ['New']}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(recipe.tags.values_list('name', flat=True)), ['New']
+        )
+        self.assertNotIn('tag_names', res.data)
+
+    def test_partial_update_names_replace_links(self):
+        """Test a PATCH with names alone drops the links not named"""
+        kept = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = self.create(tag_names=['Old'], ingredients=[kept.id])
+        recipe.tags.add(Tag.objects.create(user=self.user, name='By id'))
+
+        res = self.client.patch(
+            detail_url(recipe.id), {'tag_names': ['New', 'Old']},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(recipe.tags.values_list('name', flat=True)), {'New', 'Old'}
+        )
+        self.assertEqual(list(recipe.ingredients.all()), [kept])
+
+    def test_failed_save_creates_no_names(self):
+        """Test the named objects are rolled back with a failed save"""
+        with patch('recipe.links.set_links', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.post(RECIPES_URL, {
+                    'title': 'Curry', 'time_minutes': 30, 'price': '8.00',
+                    'tag_names': ['Vegan'],
+                }, format='json')
+
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_created_names_synced(self):
+        """Test created tags get a change version"""
+        self.create(tag_names=['Vegan'])
+
+        self.assertGreater(Tag.objects.get(name='Vegan').version, 0)
+
+    def test_constant_queries(self):
+        """Test the number of queries doesn't grow with the names"""
+        def count(n):
+            with CaptureQueriesContext(connection) as queries:
+                self.create(
+                    tag_names=[f'Tag {n} {i}' for i in range(n)],
+                    ingredient_names=[f'Ingredient {n} {i}'
+                                      for i in range(n)]
+                )
+            return len(queries)
+
+        self.assertEqual(count(2), count(20))
+
+    def test_names_not_selectable(self):
+        """Test the write-only name fields can't be asked for"""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,tag_names'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class GetOrCreateNamesTests(TestCase):
+    """Test resolving names to objects"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+
+    def test_order_kept(self):
+        """Test ids come in the order of the names"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+        ids = names.get_or_create_names(
+            Ingredient, self.user, ['Pepper', 'Salt', 'Pepper']
+        )
+
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(ids[1], salt.id)
+        self.assertEqual(Ingredient.objects.get(id=ids[0]).name, 'Pepper')
+
+    def test_concurrently_created(self):
+        """Test a name created by someone else in between is reused"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        real_filter = Tag.objects.filter
+        calls = []
+
+        def filter(*args, **kwargs):
+            # the first read misses it, as if it was created after
+            calls.append(kwargs)
+            if len(calls) == 1:
+                return Tag.objects.none()
+            return real_filter(*args, **kwargs)
+
+        with patch.object(Tag.objects, 'filter', side_effect=filter):
+            ids = names.get_or_create_names(
+                Tag, self.user, ['Vegan', 'Quick']
+            )
+
+        self.assertEqual(ids[0], vegan.id)
+        self.assertEqual(Tag.objects.get(id=ids[1]).name, 'Quick')
+        # read again after the INSERT failed
+        self.assertEqual(calls[1]['name__in'], ['Vegan', 'Quick'])
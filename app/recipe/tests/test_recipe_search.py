@@ -0,0 +1,131 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=5.00
+    )
+
+
+class RecipeSearchApiTests(TestCase):
+    """Test full-text search of recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def search(self, text):
+        """Search recipes and return the ids of the results"""
+        res = self.client.get(RECIPES_URL, {'search': text})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return [item['id'] for item in res.data]
+
+    def test_search_by_title(self):
+        """Test searching matches words of the title, stemmed"""
+        recipe = sample_recipe(self.user, title='Roasted potatoes')
+        sample_recipe(self.user, title='Fish and chips')
+
+        self.assertEqual(self.search('potato'), [recipe.id])
+
+    def test_search_by_ingredient_and_tag(self):
+        """Test searching matches ingredient and tag names"""
+        recipe1 = sample_recipe(self.user, title='Soup')
+        recipe1.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Pumpkin')
+        )
+        recipe2 = sample_recipe(self.user, title='Salad')
+        recipe2.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        self.assertEqual(self.search('pumpkin'), [recipe1.id])
+        self.assertEqual(self.search('vegan'), [recipe2.id])
+
+    def test_search_ranked(self):
+        """Test title matches rank above ingredient matches"""
+        by_ingredient = sample_recipe(self.user, title='Pie')
+        by_ingredient.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Apple')
+        )
+        by_title = sample_recipe(self.user, title='Apple crumble')
+
+        self.assertEqual(self.search('apple'), [by_title.id, by_ingredient.id])
+
+    def test_search_limited_to_user(self):
+        """Test searching only returns the user's recipes"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        sample_recipe(user2, title='Lemon tart')
+
+        self.assertEqual(self.search('lemon'), [])
+
+    def test_vector_follows_title_change(self):
+        """Test the search vector is updated when the title changes"""
+        recipe = sample_recipe(self.user, title='Pancakes')
+
+        recipe.title = 'Waffles'
+        recipe.save()
+
+        self.assertEqual(self.search('pancakes'), [])
+        self.assertEqual(self.search('waffles'), [recipe.id])
+
+    def test_vector_follows_m2m_changes(self):
+        """Test removing and clearing links updates the search vector"""
+        recipe = sample_recipe(self.user, title='Stew')
+        beef = Ingredient.objects.create(user=self.user, name='Beef')
+        recipe.ingredients.add(beef)
+        tag = Tag.objects.create(user=self.user, name='Winter')
+        tag.recipe_set.add(recipe)
+        self.assertEqual(self.search('beef'), [recipe.id])
+        self.assertEqual(self.search('winter'), [recipe.id])
+
+        recipe.ingredients.remove(beef)
+        tag.recipe_set.clear()
+
+        self.assertEqual(self.search('beef'), [])
+        self.assertEqual(self.search('winter'), [])
+
+    def test_vector_follows_rename_and_delete(self):
+        """Test renaming or deleting a tag updates its recipes"""
+        recipe = sample_recipe(self.user, title='Curry')
+        tag = Tag.objects.create(user=self.user, name='Spicy')
+        recipe.tags.add(tag)
+
+        tag.name = 'Mild'
+        tag.save()
+        self.assertEqual(self.search('spicy'), [])
+        self.assertEqual(self.search('mild'), [recipe.id])
+
+        tag.delete()
+        self.assertEqual(self.search('mild'), [])
+
+    def test_search_via_api_create(self):
+        """Test recipes created through the API are searchable"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Basil')
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Pesto pasta',
+            'ingredients': [ingredient.id],
+            'time_minutes': 15,
+            'price': 7.00,
+        })
+
+        self.assertEqual(self.search('basil pasta'), [res.data['id']])
@@ -0,0 +1,223 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import stats
+from core.models import Tag, Ingredient, Recipe, RecipeStats
+
+
+STATS_URL = reverse('recipe:recipe-stats')
+
+
+def sample_recipe(user, time_minutes=10, price='5.00'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title='Sample recipe',
+        time_minutes=time_minutes,
+        price=price
+    )
+
+
+def summary_fields(user):
+    """Return the stored summary of a user as a comparable tuple"""
+    row = RecipeStats.objects.get(user=user)
+    return (row.recipe_count, row.time_minutes_total, row.price_total,
+            row.time_histogram, row.price_histogram)
+
+
+class StatsApiTests(TestCase):
+    """Test the recipe statistics endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def get_stats(self, params=None):
+        res = self.client.get(STATS_URL, params or {})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def assert_summary_exact(self):
+        """Test the maintained summary equals a full recount"""
+        maintained = summary_fields(self.user)
+        stats.refresh_user(self.user.pk)
+
+        self.assertEqual(maintained, summary_fields(self.user))
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_no_recipes(self):
+        """Test the statistics of a user without recipes"""
+        data = self.get_stats()
+
+        self.assertEqual(data['recipe_count'], 0)
+        self.assertIsNone(data['average_time_minutes'])
+        self.assertIsNone(data['average_price'])
+        self.assertEqual(
+            [b['count'] for b in data['time_histogram']], [0] * 5
+        )
+        self.assertEqual(data['tags'], [])
+        self.assertEqual(data['ingredients'], [])
+
+    def test_summary(self):
+        """Test counts, averages and histograms of the user's recipes"""
+        sample_recipe(self.user, time_minutes=10, price='4.00')
+        sample_recipe(self.user, time_minutes=45, price='12.50')
+        sample_recipe(self.user, time_minutes=200, price='60.00')
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        sample_recipe(other)
+
+        data = self.get_stats()
+
+        self.assertEqual(data['recipe_count'], 3)
+        self.assertEqual(data['average_time_minutes'], 85.0)
+        self.assertEqual(data['average_price'], '25.50')
+        self.assertEqual(
+            [b['count'] for b in data['time_histogram']], [1, 0, 1, 0, 1]
+        )
+        self.assertEqual(data['price_histogram'][0],
+                         {'min': None, 'max': '5.00', 'count': 1})
+        self.assertEqual(data['price_histogram'][-1],
+                         {'min': '50.00', 'max': None, 'count': 1})
+
+    def test_changes_applied_incrementally(self):
+        """Test saves and deletes update an existing summary"""
+        recipe = sample_recipe(self.user, time_minutes=10)
+        deleted = sample_recipe(self.user, time_minutes=90, price='30.00')
+        self.get_stats()
+
+        recipe.time_minutes = 100
+        recipe.price = '15.00'
+        recipe.save()
+        deleted.delete()
+        sample_recipe(self.user, time_minutes=20)
+
+        data = self.get_stats()
+        self.assertEqual(data['recipe_count'], 2)
+        self.assertEqual(
+            [b['count'] for b in data['time_histogram']], [0, 1, 0, 1, 0]
+        )
+        self.assert_summary_exact()
+
+    def test_most_used_tags_and_ingredients(self):
+        """Test tags and ingredients are ranked by their recipes"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        Tag.objects.create(user=self.user, name='Unused')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        recipes = [sample_recipe(self.user) for _ in range(3)]
+        for recipe in recipes:
+            recipe.tags.add(vegan)
+            recipe.ingredients.add(salt)
+        quick.recipe_set.add(recipes[0])
+
+        data = self.get_stats()
+
+        self.assertEqual(data['tags'], [
+            {'id': vegan.id, 'name': 'Vegan', 'recipe_count': 3},
+            {'id': quick.id, 'name': 'Quick', 'recipe_count': 1},
+        ])
+        self.assertEqual(data['ingredients'], [
+            {'id': salt.id, 'name': 'Salt', 'recipe_count': 3},
+        ])
+        self.assertEqual(len(self.get_stats({'limit': 1})['tags']), 1)
+
+    def test_unlinking_counted(self):
+        """Test removing, clearing and deleting update the tag counts"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipes = [sample_recipe(self.user) for _ in range(4)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+
+        recipes[0].tags.remove(tag)
+        recipes[1].tags.clear()
+        recipes[2].delete()
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+
+        tag.recipe_set.clear()
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 0)
+
+    def test_bulk_delete_recomputed(self):
+        """Test bulk deletes are reflected in the statistics"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(tag)
+        sample_recipe(self.user)
+        self.get_stats()
+
+        res = self.client.delete(
+            reverse('recipe:recipe-bulk'), {'ids': [recipe.id]},
+            format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        data = self.get_stats()
+        self.assertEqual(data['recipe_count'], 1)
+        self.assertEqual(data['tags'], [])
+
+    def test_summary_read_from_rows(self):
+        """Test a maintained summary is read without aggregating"""
+        for _ in range(5):
+            sample_recipe(self.user)
+        self.get_stats()
+
+        # the summary row and the top tags and ingredients
+        with self.assertNumQueries(3):
+            self.get_stats()
+
+    def test_invalid_limit(self):
+        """Test the limit must be in range"""
+        for limit in ('abc', '0', '1000'):
+            res = self.client.get(STATS_URL, {'limit': limit})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StatsConcurrencyTests(TransactionTestCase):
+    """Test recomputes and deltas of other connections are serialized"""
+
+    def test_recompute_waits_for_writer(self):
+        """Test a recipe committed during a recompute is counted once"""
+        user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        results = []
+
+        def recompute():
+            try:
+                results.append(stats.get_stats(user.pk).recipe_count)
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            # no summary row yet, the delta finds nothing to update
+            sample_recipe(user)
+            reader = threading.Thread(target=recompute)
+            reader.start()
+            reader.join(0.5)
+            self.assertTrue(reader.is_alive())
+        reader.join(10)
+
+        self.assertEqual(results, [1])
+        self.assertEqual(RecipeStats.objects.get(user=user).recipe_count, 1)
@@ -0,0 +1,181 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe, Tombstone
+
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def sample_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=5.00
+    )
+
+
+class SyncApiTests(TestCase):
+    """Test the delta sync endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe = sample_recipe(self.user)
+        self.recipe.tags.add(self.tag)
+
+    def sync(self, since=None):
+        params = {} if since is None else {'since': since}
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_full_sync(self):
+        """Test syncing without a version returns everything"""
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        sample_recipe(other)
+
+        data = self.sync()
+
+        self.assertGreater(data['version'], 0)
+        self.assertEqual(len(data['recipes']), 1)
+        self.assertEqual(data['recipes'][0]['tags'], [self.tag.id])
+        self.assertEqual(data['tags'], [{'id': self.tag.id, 'name': 'Vegan'}])
+        self.assertEqual(data['ingredients'], [])
+
+    def test_nothing_changed(self):
+        """Test syncing from the last version returns nothing"""
+        version = self.sync()['version']
+
+        data = self.sync(version)
+
+        self.assertEqual(data['version'], version)
+        self.assertEqual(data['recipes'], [])
+        self.assertEqual(data['tags'], [])
+        self.assertEqual(
+            data['deleted'], {'recipes': [], 'tags': [], 'ingredients': []}
+        )
+
+    def test_only_changes_returned(self):
+        """Test only objects changed since the version are returned"""
+        sample_recipe(self.user, 'Unchanged')
+        version = self.sync()['version']
+        self.recipe.title = 'Changed'
+        self.recipe.save()
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+
+        data = self.sync(version)
+
+        self.assertGreater(data['version'], version)
+        self.assertEqual(
+            [recipe['title'] for recipe in data['recipes']], ['Changed']
+        )
+        self.assertEqual(data['tags'], [])
+        self.assertEqual(data['ingredients'][0]['id'], ingredient.id)
+
+    def test_relinked_recipe_returned(self):
+        """Test recipes whose tags changed are returned"""
+        version = self.sync()['version']
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        tag.recipe_set.add(self.recipe)
+
+        data = self.sync(version)
+
+        self.assertEqual(data['recipes'][0]['tags'], [self.tag.id, tag.id])
+
+    def test_deleted_returned(self):
+        """Test deleted objects are returned as ids"""
+        version = self.sync()['version']
+        recipe = sample_recipe(self.user)
+        recipe_id, tag_id = recipe.id, self.tag.id
+        recipe.delete()
+        self.tag.delete()
+
+        data = self.sync(version)
+
+        self.assertEqual(data['deleted']['recipes'], [recipe_id])
+        self.assertEqual(data['deleted']['tags'], [tag_id])
+        # its recipe lost the tag
+        self.assertEqual(data['recipes'][0]['tags'], [])
+
+    def test_bulk_changes_returned(self):
+        """Test bulk operations are synced too"""
+        version = self.sync()['version']
+        res = self.client.post(
+            reverse('recipe:tag-bulk'), [{'name': 'A'}], format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.client.delete(
+            reverse('recipe:recipe-bulk'), {'ids': [self.recipe.id]},
+            format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        data = self.sync(version)
+
+        self.assertEqual([tag['name'] for tag in data['tags']], ['A'])
+        self.assertEqual(data['deleted']['recipes'], [self.recipe.id])
+
+    def test_queries_independent_of_size(self):
+        """Test a delta sync doesn't read the unchanged objects"""
+        for n in range(20):
+            sample_recipe(self.user, f'Recipe {n}')
+        version = self.sync()['version']
+        self.recipe.save()
+
+        with self.assertNumQueries(7):
+            data = self.sync(version)
+
+        self.assertEqual(len(data['recipes']), 1)
+
+    def test_invalid_since(self):
+        """Test since must be a version"""
+        for since in ('abc', '-1'):
+            res = self.client.get(SYNC_URL, {'since': since})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleting_user(self):
+        """Test deleting a user doesn't leave tombstones behind"""
+        self.user.delete()
+
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_failed_user_delete_forgotten(self):
+        """Test a user delete that fails doesn't suppress tombstones"""
+        version = self.sync()['version']
+        with patch('django.db.models.deletion.Collector.delete',
+                   side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.user.delete()
+
+        recipe_id = self.recipe.id
+        self.recipe.delete()
+
+        self.assertEqual(
+            self.sync(version)['deleted']['recipes'], [recipe_id]
+        )
@@ -81,6 +81,27 @@ class PrivateTagApiTests(TestCase):
         ).exists()
         self.assertTrue(exists)
 
+    def test_create_tag_duplicate_name(self):
+        """Test creating a tag with a name the user already has fails"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_create_tag_name_used_by_other_user(self):
+        """Test that tag names only need to be unique per user"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'passwordother',
+        )
+        Tag.objects.create(user=user2, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
     def test_create_tag_invalid(self):
         """Test creating a new tag with invalid payload"""
         payload = {'name': ''}
@@ -129,3 +150,9 @@ class PrivateTagApiTests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_tags_assigned_invalid(self):
+        """Test that a non integer assigned_only is rejected"""
+        res = self.client.get(TAGS_URL, {'assigned_only': 'yes'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
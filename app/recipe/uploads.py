@@ -0,0 +1,237 @@
+"""Streaming and resumable uploads of recipe images
+
+Uploads are written to disk as they arrive, so the memory a worker
+needs doesn't depend on the size of the file. Resumable sessions let
+clients on flaky connections send a file in several PATCH requests
+and pick up where they stopped, roughly following the tus protocol.
+"""
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import FileUploadHandler, \
+    TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as \
+    DjangoMultiPartParser, MultiPartParserError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions, status
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+from core.models import UploadSession
+
+
+# Bytes read from the request and written to disk at a time
+CHUNK_SIZE = 64 * 1024
+# Seconds a request writing a chunk keeps others from writing
+LOCK_SECONDS = 60
+
+
+class RequestEntityTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('The upload is too large.')
+    default_code = 'too_large'
+
+
+class UploadConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('The upload offset does not match.')
+    default_code = 'conflict'
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """Stop uploads larger than max_size as early as possible
+
+    The declared Content-Length is checked before anything is read,
+    the bytes actually received while the file is streamed.
+    """
+
+    def __init__(self, max_size, request=None):
+        super().__init__(request)
+        self.max_size = max_size
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > self.max_size:
+            raise RequestEntityTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            raise RequestEntityTooLarge()
+        # passed on to the next handler, which stores it
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class StreamingMultiPartParser(MultiPartParser):
+    """Parse multipart uploads straight to temporary files on disk
+
+    Django keeps files up to FILE_UPLOAD_MAX_MEMORY_SIZE in memory, and
+    validating an in-memory image copies it once more.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        upload_handlers = [
+            MaxSizeUploadHandler(settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE),
+            TemporaryFileUploadHandler(request._request),
+        ]
+
+        try:
+            parser = DjangoMultiPartParser(
+                meta, stream, upload_handlers, encoding
+            )
+            data, files = parser.parse()
+            return DataAndFiles(data, files)
+        except MultiPartParserError as exc:
+            raise exceptions.ParseError(
+                _('Multipart form parse error - {exc}').format(exc=exc)
+            )
+
+
+class SessionFile(File):
+    """A completed session upload, read from disk like a temporary file
+
+    Image validation opens the path instead of reading the file into
+    memory, and the storage moves it into place instead of copying.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _path(upload_id):
+    return os.path.join(settings.RECIPE_UPLOAD_SESSION_DIR, upload_id)
+
+
+def _expires():
+    return timezone.now() + timedelta(
+        seconds=settings.RECIPE_UPLOAD_SESSION_TTL
+    )
+
+
+def create_session(user, recipe, size, filename):
+    """Start a resumable upload of an image for a recipe"""
+    if size > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+        raise RequestEntityTooLarge()
+
+    purge_expired()
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user=user,
+        recipe=recipe,
+        size=size,
+        filename=filename,
+        expires=_expires()
+    )
+    os.makedirs(settings.RECIPE_UPLOAD_SESSION_DIR, exist_ok=True)
+    open(_path(session.id), 'wb').close()
+    session.save(force_insert=True)
+
+    return session
+
+
+def get_session(user, recipe, upload_id):
+    """Return a session of the user for the recipe, raise 404 if none"""
+    session = UploadSession.objects.filter(
+        pk=upload_id, user=user, recipe=recipe, expires__gt=timezone.now()
+    ).first()
+    if session is None:
+        raise exceptions.NotFound()
+
+    return session
+
+
+def append_chunk(session, offset, stream, length):
+    """Write length bytes from stream at offset, return the session
+
+    offset must be where the upload currently stops: a client that lost
+    a response asks for the offset and resends from there.
+    """
+    if offset != session.offset:
+        raise UploadConflict()
+    if length > session.size - offset:
+        raise RequestEntityTooLarge()
+
+    # taken with one UPDATE, whichever worker the other request is on
+    now = timezone.now()
+    locked = UploadSession.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        pk=session.pk, offset=offset
+    ).update(locked_until=now + timedelta(seconds=LOCK_SECONDS))
+    if not locked:
+        raise UploadConflict(_('Another request is writing this upload.'))
+    try:
+        with open(_path(session.id), 'r+b') as f:
+            # drop what an interrupted request wrote past the offset
+            f.seek(offset)
+            f.truncate()
+            remaining = length
+            while remaining:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            raise exceptions.ParseError(_('The request body was cut short.'))
+
+        session.offset = offset + length
+        session.expires = _expires()
+    finally:
+        session.locked_until = None
+        session.save(update_fields=['offset', 'expires', 'locked_until'])
+
+    return session
+
+
+def is_complete(session):
+    return session.offset == session.size
+
+
+def open_upload(session):
+    """Return the uploaded file of a complete session"""
+    return SessionFile(open(_path(session.id), 'rb'), name=session.filename)
+
+
+def delete_session(session):
+    """Forget a session and delete what was uploaded"""
+    path = _path(session.id)
+    session.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # moved into the storage when the upload was saved
+        pass
+
+
+def purge_expired():
+    """Delete sessions that expired without completing"""
+    UploadSession.objects.filter(expires__lte=timezone.now()).delete()
+    purge_expired_files()
+
+
+def purge_expired_files():
+    """Delete files of sessions that expired or are gone"""
+    try:
+        names = os.listdir(settings.RECIPE_UPLOAD_SESSION_DIR)
+    except FileNotFoundError:
+        return
+    expired = time.time() - settings.RECIPE_UPLOAD_SESSION_TTL
+    for name in names:
+        path = os.path.join(settings.RECIPE_UPLOAD_SESSION_DIR, name)
+        try:
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
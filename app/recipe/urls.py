@@ -12,5 +12,7 @@ router.register('recipes', views.RecipeViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
+    # changes since an earlier sync, for offline clients
+    path('sync/', views.SyncView.as_view(), name='sync'),
     path('', include(router.urls))
 ]
@@ -1,37 +1,99 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import transaction
+from django.db.models import F, Prefetch
+
+from django.utils.translation import ugettext_lazy as _
+
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from core import stats, sync
+from core.models import Tag, Ingredient, Recipe, Tombstone
+from core.search import SEARCH_CONFIG
+
+from user.authentication import CachedTokenAuthentication
+
+from recipe import autocomplete, bulk, images, serializers, filters, \
+    matching, uploads
+from recipe.cache import CachedListMixin
+from recipe.pagination import RecipeAttrCursorPagination, \
+    RecipeCursorPagination
+
 
-from core.models import Tag, Ingredient, Recipe
+def param_to_int(query_params, param, default, low, high):
+    """Convert a query param to an integer from low to high"""
+    try:
+        value = int(query_params.get(param, default))
+        if not low <= value <= high:
+            raise ValueError
+    except ValueError:
+        raise ValidationError({param: _(
+            'Must be a number from {low} to {high}.'
+        ).format(low=low, high=high)})
 
-from recipe import serializers
+    return value
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(CachedListMixin,
+                            bulk.BulkMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base viewset for user owned recipe attributes"""
     # this requires token authentication is used
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     # user is authenticated to use the API
     permission_classes = (IsAuthenticated,)
+    # ?cursor= / ?page_size= switch the list to keyset pagination
+    pagination_class = RecipeAttrCursorPagination
+    # Recipe field the objects are assigned through, set by subclasses
+    recipe_field = None
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
         # Request object should be passed in to self as a class variable
         # user should be assigned to that because authentication is required
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
+        try:
+            assigned_only = bool(
+                int(self.request.query_params.get('assigned_only', 0))
+            )
+        except ValueError:
+            raise ValidationError(
+                {'assigned_only': _('Must be 0 or 1.')}
+            )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            # EXISTS returns each object once, no need for distinct()
+            queryset = filters.filter_assigned(queryset, self.recipe_field)
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name', 'id')
+
+    def list(self, request, *args, **kwargs):
+        if 'prefix' in request.query_params:
+            return self.autocomplete(request)
+
+        return super().list(request, *args, **kwargs)
+
+    def autocomplete(self, request):
+        """List the most used objects whose name starts with ?prefix="""
+        limit = param_to_int(
+            request.query_params, 'limit', settings.AUTOCOMPLETE_LIMIT, 1,
+            settings.AUTOCOMPLETE_MAX_LIMIT
+        )
+        objs = autocomplete.suggest(
+            self.queryset.model, request.user.pk,
+            request.query_params['prefix'].strip(), limit
+        )
+
+        return Response(self.get_serializer(objs, many=True).data)
 
     def perform_create(self, serializer):
         """Create a new object """
@@ -39,6 +101,19 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
         # Called by CreateModelMixin when saving a new object instance.
         serializer.save(user=self.request.user)
 
+    def perform_bulk_create(self, items):
+        return bulk.create_attrs(self.queryset.model, self.request.user, items)
+
+    def perform_bulk_update(self, items):
+        return bulk.update_attrs(
+            self.queryset.model, self.request.user, items, self.recipe_field
+        )
+
+    def perform_bulk_delete(self, ids):
+        bulk.delete_attrs(
+            self.queryset.model, self.request.user, ids, self.recipe_field
+        )
+
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database"""
@@ -46,43 +121,170 @@ class TagViewSet(BaseRecipeAttrViewSet):
     # of BaseRecipeAttrViewSet
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    bulk_serializer_class = serializers.TagBulkSerializer
+    recipe_field = 'tags'
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database"""
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    bulk_serializer_class = serializers.IngredientBulkSerializer
+    recipe_field = 'ingredients'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedListMixin, bulk.BulkMixin, viewsets.ModelViewSet):
     """Manage recipes in the database"""
     serializer_class = serializers.RecipeSerializer
-    queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    bulk_serializer_class = serializers.RecipeBulkSerializer
+    # the search vector is only ever read by the database
+    queryset = Recipe.objects.defer('search_vector')
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
 
-    def _params_to_ints(self, qs):
+    def _params_to_ints(self, qs, param):
         """Convert a list of string IDs to a list of intergers"""
         # our_string = '1,2,3'
         # our_string_list = [1,2,3]
-        return [int(str_id) for str_id in qs.split(',')]
+        try:
+            return [int(str_id) for str_id in qs.split(',')]
+        except ValueError:
+            raise ValidationError(
+                {param: _('Must be a comma separated list of ids.')}
+            )
+
+    def _params_to_names(self, param, choices):
+        """Convert a comma separated list of names, checking each one"""
+        names = [
+            name.strip()
+            for name in self.request.query_params[param].split(',')
+            if name.strip()
+        ]
+        if any(name not in choices for name in names):
+            raise ValidationError({param: _(
+                'Must be a comma separated list of: {choices}.'
+            ).format(choices=', '.join(choices))})
+
+        return names
+
+    def _output_fields(self):
+        """Return the names of the fields in the serializer's output"""
+        return [
+            name for name in self.serializer_class.Meta.fields
+            if name not in self.serializer_class.name_fields
+        ]
+
+    def get_field_selection(self):
+        """Return the fields and expand serializer kwargs of the request"""
+        # ?fields=id,title returns just those fields and
+        # ?expand=ingredients,tags nests the related objects
+        if not hasattr(self, '_field_selection'):
+            params = self.request.query_params
+            expandable = tuple(self.serializer_class.expandable_fields)
+            expand = []
+            if 'expand' in params:
+                expand = self._params_to_names('expand', expandable)
+            fields = None
+            if 'fields' in params:
+                fields = self._params_to_names(
+                    'fields', self._output_fields()
+                )
+                # expanding a field implies asking for it
+                fields += [name for name in expand if name not in fields]
+            self._field_selection = {'fields': fields, 'expand': expand}
+
+        return self._field_selection
 
     def get_queryset(self):
         """Retrieve the recipes for the authenticated user"""
         # retrieve get parameters, query params is dictionary
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        # any: linked to at least one of the ids, all: linked to every id
+        match = self.request.query_params.get('match', filters.MATCH_ANY)
+        if match not in filters.MATCH_MODES:
+            raise ValidationError(
+                {'match': _('Must be one of: any, all.')}
+            )
         # we do this not reassign our queryset
         queryset = self.queryset
         if tags:
-            tag_ids = self._params_to_ints(tags)
-            # First underscore is Django syntax for filtering on foreignKey
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            tag_ids = self._params_to_ints(tags, 'tags')
+            queryset = filters.filter_linked(
+                queryset, 'tags', tag_ids, match
+            )
         if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            ingredient_ids = self._params_to_ints(ingredients, 'ingredients')
+            queryset = filters.filter_linked(
+                queryset, 'ingredients', ingredient_ids, match
+            )
+
+        queryset = queryset.filter(user=self.request.user)
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            # served by the GIN index on the maintained search vector,
+            # best matches first (cursor pages keep the -id order)
+            query = SearchQuery(search, config=SEARCH_CONFIG)
+            queryset = queryset.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query)
+            ).order_by('-rank', '-id')
+        else:
+            # newest first, the same order the cursor pagination uses
+            queryset = queryset.order_by('-id')
+
+        return self._apply_query_plan(queryset)
+
+    def _apply_query_plan(self, queryset):
+        """Load only what the serializer of the current action reads"""
+        # Without prefetching, every recipe in a list runs one query for
+        # its ingredients and one for its tags (2N + 1 queries in total)
+        if self.action in ('list', 'bulk', 'retrieve'):
+            return self._apply_field_selection(queryset)
+        if self.action in ('upload_image', 'upload_session'):
+            # only the image and its renditions are read and written
+            return queryset.only(
+                'id', 'user', 'image', 'image_status', 'image_renditions'
+            )
+
+        return queryset
+
+    def _apply_field_selection(self, queryset):
+        """Load the columns and relations of the selected fields only"""
+        selection = self.get_field_selection()
+        fields = selection['fields'] or self._output_fields()
+        expandable = self.serializer_class.expandable_fields
+        if self.action == 'retrieve':
+            # the detail serializer always nests the full objects
+            expanded = set(expandable)
+        else:
+            # the list serializer shows primary keys unless expanded
+            expanded = set(selection['expand'])
+
+        prefetches = []
+        for name in expandable:
+            if name not in fields:
+                continue
+            model = Recipe._meta.get_field(name).related_model
+            columns = ('id', 'name') if name in expanded else ('id',)
+            prefetches.append(
+                Prefetch(name, queryset=model.objects.only(*columns))
+            )
+
+        return queryset.only(
+            *(name for name in fields if name not in expandable)
+        ).prefetch_related(*prefetches)
+
+    def get_bulk_queryset(self):
+        """Load the selected fields of the recipes a bulk request wrote"""
+        return self._apply_field_selection(super().get_bulk_queryset())
+
+    def get_serializer(self, *args, **kwargs):
+        """Return the serializer with the selected fields"""
+        if self.action in ('list', 'bulk', 'retrieve'):
+            kwargs.update(self.get_field_selection())
 
-        return queryset.filter(user=self.request.user)
+        return super().get_serializer(*args, **kwargs)
 
     # to retrive the serializer class for a particular request
     # ViewSet a number of actions available, list returns default
@@ -92,7 +294,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # action being used for our current request
         if self.action == 'retrieve':
             return serializers.RecipeDetailSerializer
-        elif self.action == 'upload_image':
+        elif self.action in ('upload_image', 'upload_session'):
             return serializers.RecipeImageSerializer
 
         return self.serializer_class
@@ -102,22 +304,34 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
 
+    def perform_bulk_create(self, items):
+        return bulk.create_recipes(self.request.user, items)
+
+    def perform_bulk_update(self, items):
+        return bulk.update_recipes(self.request.user, items)
+
+    def perform_bulk_delete(self, ids):
+        bulk.delete_recipes(self.request.user, ids)
+
     # Above functions are default ones that overrode.
     # By using @action, we can create custom function
     # This action is for detail view, use detail view + url_path
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['GET', 'POST'], detail=True, url_path='upload-image',
+            parser_classes=(uploads.StreamingMultiPartParser,))
     def upload_image(self, request, pk=None):
-        """Upload an image to a recipe"""
+        """Upload an image to a recipe, or poll its processing status"""
         # Retrieve the recipe object that is being accessed based on ID in URL
         recipe = self.get_object()
+        if request.method == 'GET':
+            return Response(self.get_serializer(recipe).data)
+
         serializer = self.get_serializer(
             recipe,
             data=request.data
         )
         # validate that the data is all correct
         if serializer.is_valid():
-            # We use ModelSerializer so, we can use .save()
-            serializer.save()
+            self._save_image(recipe, serializer)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -127,3 +341,225 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    def _save_image(self, recipe, serializer):
+        """Save a validated image and queue making its renditions"""
+        old_renditions = recipe.image_renditions
+        # We use ModelSerializer so, we can use .save()
+        # The renditions are made in the background, clients poll
+        # until image_status is ready
+        serializer.save(
+            image_status=Recipe.IMAGE_PENDING, image_renditions={}
+        )
+        images.enqueue(recipe.id, recipe.image.name)
+        transaction.on_commit(
+            lambda: images.delete_renditions(old_renditions)
+        )
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """Summarize the user's recipes, tags and ingredients"""
+        limit = param_to_int(
+            request.query_params, 'limit', settings.RECIPE_STATS_TOP, 1,
+            settings.RECIPE_STATS_MAX_TOP
+        )
+        data = serializers.RecipeStatsSerializer(
+            stats.get_stats(request.user.pk)
+        ).data
+        for key, model in (('tags', Tag), ('ingredients', Ingredient)):
+            # read from the (user, -recipe_count) index
+            data[key] = serializers.LinkCountSerializer(
+                model.objects.filter(
+                    user=request.user, recipe_count__gt=0
+                ).only('id', 'name', 'recipe_count').order_by(
+                    '-recipe_count', 'name'
+                )[:limit],
+                many=True
+            ).data
+
+        return Response(data)
+
+    @action(methods=['GET'], detail=False)
+    def match(self, request):
+        """Rank recipes by how few of their ingredients are missing"""
+        have = request.query_params.get('ingredients')
+        if not have:
+            raise ValidationError(
+                {'ingredients': _('Give the ids of the ingredients at hand.')}
+            )
+        have = self._params_to_ints(have, 'ingredients')
+        max_missing = param_to_int(
+            request.query_params, 'max_missing', 0, 0,
+            settings.RECIPE_MATCH_MAX_MISSING
+        )
+        limit = param_to_int(
+            request.query_params, 'limit', settings.RECIPE_MATCH_LIMIT, 1,
+            settings.RECIPE_MATCH_MAX_LIMIT
+        )
+
+        index = matching.get_index(request.user.pk)
+        matches, total = index.match(have, max_missing, limit)
+        recipes = self.queryset.filter(
+            user=request.user,
+            id__in=[recipe_id for recipe_id, missing in matches]
+        ).prefetch_related(
+            Prefetch('ingredients', queryset=Ingredient.objects.only('id')),
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+        ).in_bulk()
+        results = []
+        for recipe_id, missing in matches:
+            # deleted since the index was read
+            if recipe_id not in recipes:
+                continue
+            data = self.get_serializer(recipes[recipe_id]).data
+            data['missing'] = len(missing)
+            data['missing_ingredients'] = missing
+            results.append(data)
+
+        return Response({'count': total, 'results': results})
+
+    # Resumable uploads: POST starts a session, each PATCH appends the
+    # bytes of its body at the Upload-Offset header and HEAD tells how
+    # much was received. The image is saved with the last chunk.
+    @action(methods=['POST'], detail=True,
+            url_path='upload-image/sessions')
+    def upload_sessions(self, request, pk=None):
+        """Start a resumable image upload"""
+        recipe = self.get_object()
+        serializer = serializers.UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = uploads.create_session(
+            request.user, recipe, **serializer.validated_data
+        )
+        url = reverse(
+            'recipe:recipe-upload-session',
+            args=[recipe.id, session.id],
+            request=request
+        )
+
+        return Response(
+            {'id': session.id, 'offset': 0, 'url': url},
+            status=status.HTTP_201_CREATED,
+            headers={'Location': url, 'Upload-Offset': '0'}
+        )
+
+    @action(methods=['GET', 'HEAD', 'PATCH', 'DELETE'], detail=True,
+            url_path=r'upload-image/sessions/(?P<upload_id>[0-9a-f]{32})',
+            url_name='upload-session')
+    def upload_session(self, request, pk=None, upload_id=None):
+        """Resume, check or cancel a resumable image upload"""
+        recipe = self.get_object()
+        session = uploads.get_session(request.user, recipe, upload_id)
+        if request.method == 'DELETE':
+            uploads.delete_session(session)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if request.method == 'PATCH':
+            try:
+                offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except (KeyError, ValueError):
+                raise ValidationError(
+                    {'Upload-Offset': _('Send the offset of the chunk.')}
+                )
+            # the body is streamed to disk, never parsed as request.data
+            session = uploads.append_chunk(
+                session, offset, request.stream, length
+            )
+            if uploads.is_complete(session):
+                return self._complete_upload(recipe, session)
+
+        return Response(
+            {'id': session.id, 'offset': session.offset,
+             'size': session.size},
+            status=status.HTTP_200_OK,
+            headers={
+                'Upload-Offset': str(session.offset),
+                'Upload-Length': str(session.size),
+                'Cache-Control': 'no-store',
+            }
+        )
+
+    def _complete_upload(self, recipe, session):
+        """Save the image of a finished session like a direct upload"""
+        try:
+            with uploads.open_upload(session) as upload:
+                serializer = self.get_serializer(
+                    recipe,
+                    data={'image': upload}
+                )
+                if not serializer.is_valid():
+                    return Response(
+                        serializer.errors,
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                self._save_image(recipe, serializer)
+        finally:
+            uploads.delete_session(session)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class SyncView(APIView):
+    """Return what changed in the user's recipes, tags and ingredients
+
+    ?since= is the version returned by the previous sync. Without it
+    everything is returned, with it only the objects changed after that
+    version and the ids of the deleted ones, both read through the
+    (user, version) indexes.
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    # key of deleted ids in the response by Tombstone.model
+    deleted_keys = {
+        'recipe': 'recipes',
+        'tag': 'tags',
+        'ingredient': 'ingredients',
+    }
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+            if since < 0:
+                raise ValueError
+        except ValueError:
+            raise ValidationError(
+                {'since': _('Must be a version returned by a sync.')}
+            )
+        user = request.user
+        # Read before the changes: rows committed in between have higher
+        # versions and are returned again by the next sync
+        version = sync.current_version(user.pk)
+
+        recipes = Recipe.objects.filter(user=user).defer(
+            'search_vector'
+        ).prefetch_related(
+            Prefetch('ingredients', queryset=Ingredient.objects.only('id')),
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+        )
+        tags = Tag.objects.filter(user=user)
+        ingredients = Ingredient.objects.filter(user=user)
+        deleted = {key: [] for key in self.deleted_keys.values()}
+        if since:
+            recipes = recipes.filter(version__gt=since)
+            tags = tags.filter(version__gt=since)
+            ingredients = ingredients.filter(version__gt=since)
+            for model, object_id in Tombstone.objects.filter(
+                    user=user, version__gt=since
+            ).values_list('model', 'object_id'):
+                deleted[self.deleted_keys[model]].append(object_id)
+
+        context = {'request': request}
+        return Response({
+            'version': version,
+            'recipes': serializers.RecipeSerializer(
+                recipes.order_by('id'), many=True, context=context
+            ).data,
+            'tags': serializers.TagSerializer(
+                tags.order_by('id'), many=True, context=context
+            ).data,
+            'ingredients': serializers.IngredientSerializer(
+                ingredients.order_by('id'), many=True, context=context
+            ).data,
+            'deleted': deleted,
+        })
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class UserConfig(AppConfig):
     name = 'user'
+
+    def ready(self):
+        # Connect the token cache eviction signal handlers
+        from user import signals  # noqa: F401
@@ -0,0 +1,197 @@
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class LRUCache:
+    """Thread safe, size bounded in-process cache with a TTL"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            # mark as most recently used
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenCache:
+    """Two level cache of authenticated (user, token) pairs
+
+    The first level lives in the process, the optional second level is
+    a Django cache shared between processes. The shared level only
+    holds the user id of a token, never the user row with its password
+    hash, and the user is read again when a process first sees the
+    token there.
+
+    Each user has a revocation version, a random value kept in the
+    shared cache (in the process without one) that signals in
+    user.signals replace when a token of the user is deleted or the
+    user is deactivated or changes password. First level entries
+    remember the version they were cached under and are dropped on the
+    first hit after it changed, so every process stops authenticating
+    a revoked token at once, for the price of one shared cache read.
+    """
+    key_prefix = 'authtoken'
+    version_prefix = 'authtoken-user'
+
+    def __init__(self):
+        self.local = LRUCache(
+            settings.TOKEN_AUTH_CACHE_SIZE,
+            settings.TOKEN_AUTH_CACHE_TTL
+        )
+
+    def _shared(self):
+        alias = settings.TOKEN_AUTH_SHARED_CACHE
+        return caches[alias] if alias else None
+
+    def _cache_key(self, key):
+        # never use the raw token as a cache key, it is a credential
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f'{self.key_prefix}:{digest}'
+
+    def _version_key(self, user_id):
+        return f'{self.version_prefix}:{user_id}'
+
+    def get_version(self, user_id):
+        """Return the revocation version of a user, None if never set"""
+        version_key = self._version_key(user_id)
+        shared = self._shared()
+        if shared is not None:
+            return shared.get(version_key)
+        return self.local.get(version_key)
+
+    def revoke_user(self, user_id):
+        """Drop the cached tokens of a user in every process"""
+        # a new random value, not a counter, so a version that expired
+        # or was evicted can never come back with the same value
+        version_key = self._version_key(user_id)
+        version = uuid.uuid4().hex
+        shared = self._shared()
+        if shared is not None:
+            shared.set(
+                version_key, version,
+                max(settings.TOKEN_AUTH_SHARED_CACHE_TTL,
+                    settings.TOKEN_AUTH_CACHE_TTL)
+            )
+        else:
+            self.local.set(version_key, version)
+
+    def get(self, key):
+        """Return the cached (user, token) pair for a token key"""
+        cache_key = self._cache_key(key)
+        entry = self.local.get(cache_key)
+        if entry is not None:
+            user_id, version, data = entry
+            if version == self.get_version(user_id):
+                # pickled so every request gets its own user instance
+                return pickle.loads(data)
+            self.local.delete(cache_key)
+
+        shared = self._shared()
+        if shared is None:
+            return None
+        ids = shared.get(cache_key)
+        if ids is None:
+            return None
+        user_id, created = ids
+        # read before the user, a revocation in between drops the entry
+        version = self.get_version(user_id)
+        user = get_user_model()._default_manager.filter(
+            pk=user_id, is_active=True
+        ).first()
+        if user is None:
+            return None
+        token = Token(key=key, user=user, created=created)
+        self._set_local(cache_key, user, token, version)
+
+        return user, token
+
+    def set(self, key, user, token):
+        """Cache the (user, token) pair of a token key"""
+        cache_key = self._cache_key(key)
+        # read after the user, user.signals revoke once more on commit
+        # in case the user was read just before a revocation
+        self._set_local(cache_key, user, token, self.get_version(user.pk))
+        shared = self._shared()
+        if shared is not None:
+            shared.set(
+                cache_key, (user.pk, token.created),
+                settings.TOKEN_AUTH_SHARED_CACHE_TTL
+            )
+
+    def _set_local(self, cache_key, user, token, version):
+        self.local.set(cache_key, (
+            user.pk, version,
+            pickle.dumps((user, token), pickle.HIGHEST_PROTOCOL)
+        ))
+
+    def evict(self, key):
+        """Remove a token key from both cache levels"""
+        cache_key = self._cache_key(key)
+        self.local.delete(cache_key)
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(cache_key)
+
+    def clear(self):
+        """Empty the in-process cache"""
+        self.local.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that skips the token query on cache hits"""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # runs the authtoken_token / core_user select_related query,
+        # and rejects unknown tokens and inactive users
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+
+        return user, token
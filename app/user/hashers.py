@@ -0,0 +1,27 @@
+"""Password hashers with their work factors taken from the settings
+
+PASSWORD_HASHERS lists the preferred hasher first. Django rehashes a
+password with it on the next successful login whenever the stored hash
+was made by another hasher or with other parameters, so changing these
+settings upgrades users transparently.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2 with PASSWORD_ARGON2_* parameters, needs argon2-cffi"""
+    time_cost = settings.PASSWORD_ARGON2_TIME_COST
+    # KiB
+    memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+    parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    """bcrypt with PASSWORD_BCRYPT_ROUNDS, needs bcrypt"""
+    rounds = settings.PASSWORD_BCRYPT_ROUNDS
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2 with PASSWORD_PBKDF2_ITERATIONS, always available"""
+    iterations = settings.PASSWORD_PBKDF2_ITERATIONS
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from user.authentication import token_cache
+
+
+# User fields whose change stops or refreshes the user's cached tokens
+AUTH_FIELDS = ('is_active', 'password')
+
+
+def _revoke(user_id, key=None):
+    if key is not None:
+        token_cache.evict(key)
+    token_cache.revoke_user(user_id)
+    # revoke again once committed, a request running concurrently may
+    # have cached the old row before this change was visible
+    transaction.on_commit(lambda: token_cache.revoke_user(user_id))
+
+
+def _auth_values(instance):
+    # deferred fields aren't loaded just to be compared
+    return tuple(instance.__dict__.get(field) for field in AUTH_FIELDS)
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    """Stop authenticating a token as soon as it is deleted"""
+    _revoke(instance.user_id, instance.key)
+
+
+@receiver(post_init, sender=get_user_model())
+def remember_auth_values(sender, instance, **kwargs):
+    """Remember what the user's cached tokens depend on"""
+    instance._auth_values = _auth_values(instance)
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_user_tokens(sender, instance, created, **kwargs):
+    """Drop cached tokens of a user deactivated or given a new password
+
+    Other saves, such as update_last_login, run no query here.
+    """
+    values = _auth_values(instance)
+    changed = values != instance._auth_values
+    instance._auth_values = values
+    if not created and changed:
+        _revoke(instance.pk)
@@ -0,0 +1,155 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import token_cache
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the cached token authentication backend"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='password',
+            name='name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_query_skipped_when_cached(self):
+        """Test that only the first request looks the token up"""
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token_rejected(self):
+        """Test that unknown tokens are not authenticated"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_evicted(self):
+        """Test a deleted token stops working immediately"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_evicted(self):
+        """Test a deactivated user's token stops working immediately"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_update_evicted(self):
+        """Test updating the user through the API refreshes the cache"""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'new name'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'new name')
+
+    def test_last_login_not_evicting(self):
+        """Test saving the last login time doesn't look up the tokens"""
+        with self.assertNumQueries(1):
+            update_last_login(None, self.user)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_revoked_in_other_process(self):
+        """Test a revocation by another process drops the local entry"""
+        self.client.get(ME_URL)
+        # deactivated by a process whose signals only reach the shared
+        # cache, not this process' LRU
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False
+        )
+        caches['default'].set(token_cache._version_key(self.user.pk), 'x')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_user_not_shared(self):
+        """Test each request gets its own copy of the cached user"""
+        token_cache.set(self.token.key, self.user, self.token)
+
+        user1, _ = token_cache.get(self.token.key)
+        user2, _ = token_cache.get(self.token.key)
+
+        self.assertEqual(user1, user2)
+        self.assertIsNot(user1, user2)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_shared_cache_fills_local_cache(self):
+        """Test a token cached by another process is used"""
+        self.client.get(ME_URL)
+        # simulate a fresh process that only sees the shared cache
+        token_cache.clear()
+
+        # the user is read again, the token isn't
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_shared_cache_holds_ids(self):
+        """Test the user row and password hash aren't shared"""
+        self.client.get(ME_URL)
+
+        data = caches['default'].get(token_cache._cache_key(self.token.key))
+
+        self.assertEqual(data, (self.user.pk, self.token.created))
+
+    def test_update_not_from_stale_user(self):
+        """Test a profile update doesn't write back an old cached user"""
+        self.client.get(ME_URL)
+        # changed by another process, whose eviction this one never saw
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            password='changed elsewhere'
+        )
+
+        self.client.patch(ME_URL, {'name': 'new name'})
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, 'changed elsewhere')
+        self.assertEqual(self.user.name, 'new name')
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_shared_cache_evicted(self):
+        """Test deleting a token evicts it from the shared cache too"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        token_cache.clear()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,181 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model, authenticate
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user.throttling import LoginRateThrottle
+
+
+TOKEN_URL = reverse('user:token')
+
+
+class PasswordUpgradeTests(TestCase):
+    """Test passwords are rehashed with the preferred hasher on login"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='password'
+        )
+
+    def login(self):
+        return self.client.post(
+            TOKEN_URL, {'email': 'test@gmail.com', 'password': 'password'}
+        )
+
+    def test_preferred_hasher_used(self):
+        """Test new passwords are hashed by the first configured hasher"""
+        self.assertEqual(
+            self.user.password.split('$')[0],
+            get_hasher('default').algorithm
+        )
+
+    def test_other_hasher_upgraded(self):
+        """Test a password of a hasher that isn't preferred is rehashed"""
+        self.user.password = make_password('password', hasher='pbkdf2_sha1')
+        self.user.save()
+
+        res = self.login()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(
+            self.user.password.split('$')[0],
+            get_hasher('default').algorithm
+        )
+
+    def test_changed_work_factor_upgraded(self):
+        """Test a hash made with other PBKDF2 iterations is rehashed"""
+        hasher = get_hasher('pbkdf2_sha256')
+        self.user.password = hasher.encode('password', hasher.salt(), 1000)
+        self.user.save()
+
+        res = self.login()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertFalse(get_hasher('default').must_update(
+            self.user.password
+        ))
+        self.assertNotIn('$1000$', self.user.password)
+        self.assertIsNotNone(authenticate(
+            username='test@gmail.com', password='password'
+        ))
+
+
+@override_settings(LOGIN_THROTTLE_RATES={
+    'login_ip': '5/min',
+    'login_email': '3/min',
+})
+class LoginThrottleTests(TestCase):
+    """Test login attempts are rate limited"""
+
+    def setUp(self):
+        cache.clear()
+        # keep every attempt of a test in the same window
+        patcher = mock.patch.object(
+            LoginRateThrottle, 'timer', return_value=1200.0
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='password'
+        )
+
+    def test_email_throttled(self):
+        """Test attempts on one email over the rate are rejected"""
+        payload = {'email': 'test@gmail.com', 'password': 'wrong'}
+        for _ in range(3):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # the right password doesn't help once throttled
+        payload['password'] = 'password'
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        self.assertNotIn('token', res.data)
+
+    def test_new_window_allowed(self):
+        """Test attempts are allowed again in the next window"""
+        payload = {'email': 'test@gmail.com', 'password': 'password'}
+        for _ in range(4):
+            res = self.client.post(TOKEN_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        LoginRateThrottle.timer.return_value = 1260.0
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_email_counted_case_insensitive(self):
+        """Test changing the case of the email doesn't reset the count"""
+        for email in ('test@gmail.com', 'TEST@gmail.com', ' Test@Gmail.com'):
+            self.client.post(TOKEN_URL, {'email': email, 'password': 'x'})
+
+        res = self.client.post(
+            TOKEN_URL, {'email': 'tEst@gmail.com', 'password': 'x'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_ip_throttled(self):
+        """Test attempts from one IP over the rate are rejected"""
+        for i in range(5):
+            res = self.client.post(
+                TOKEN_URL, {'email': f'{i}@gmail.com', 'password': 'x'}
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(
+            TOKEN_URL, {'email': 'other@gmail.com', 'password': 'x'}
+        )
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # another client address is counted separately
+        res = self.client.post(
+            TOKEN_URL, {'email': 'other@gmail.com', 'password': 'x'},
+            REMOTE_ADDR='10.0.0.2'
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_forwarded_for_ignored(self):
+        """Test clients can't reset the IP count with X-Forwarded-For"""
+        for i in range(6):
+            res = self.client.post(
+                TOKEN_URL, {'email': f'{i}@gmail.com', 'password': 'x'},
+                HTTP_X_FORWARDED_FOR=f'10.0.1.{i}'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_throttled_attempt_not_hashed(self):
+        """Test a rejected attempt never authenticates"""
+        payload = {'email': 'test@gmail.com', 'password': 'wrong'}
+        with mock.patch(
+                'user.serializer.authenticate', return_value=None) as auth:
+            for _ in range(5):
+                self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(auth.call_count, 3)
+
+    @override_settings(LOGIN_THROTTLE_RATES={})
+    def test_throttling_disabled(self):
+        """Test no rate disables a throttle"""
+        for _ in range(12):
+            res = self.client.post(
+                TOKEN_URL, {'email': 'test@gmail.com', 'password': 'x'}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,75 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginRateThrottle(SimpleRateThrottle):
+    """Fixed window login attempt counter kept in the cache
+
+    Unlike SimpleRateThrottle, which stores the timestamp of every
+    request, a window is a single integer bumped with cache.incr in the
+    LOGIN_THROTTLE_CACHE alias, atomic with a shared cache such as
+    Redis. The rate is read from LOGIN_THROTTLE_RATES by scope.
+    Throttles run in APIView.initial, so a rejected attempt never
+    reaches the password hasher.
+    """
+
+    def get_rate(self):
+        return settings.LOGIN_THROTTLE_RATES.get(self.scope)
+
+    def get_ident_key(self, request):
+        """Return what attempts are counted by, None to not count
+
+        The client IP by default: REMOTE_ADDR, or the X-Forwarded-For
+        address added by the last of REST_FRAMEWORK['NUM_PROXIES']
+        trusted proxies.
+        """
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        self.window_end = (window + 1) * self.duration
+        self.now = now
+        # never put emails or addresses in keys as they are
+        digest = hashlib.sha256(ident.encode()).hexdigest()
+        key = f'throttle:{self.scope}:{digest}:{window}'
+
+        cache = caches[settings.LOGIN_THROTTLE_CACHE]
+        cache.add(key, 0, self.duration)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # expired between add and incr, a new window starts
+            cache.add(key, 1, self.duration)
+            count = 1
+
+        return count <= self.num_requests
+
+    def wait(self):
+        return self.window_end - self.now
+
+
+class LoginIPThrottle(LoginRateThrottle):
+    """Limit login attempts per client IP"""
+    scope = 'login_ip'
+
+
+class LoginEmailThrottle(LoginRateThrottle):
+    """Limit login attempts per email, from any number of IPs"""
+    scope = 'login_email'
+
+    def get_ident_key(self, request):
+        email = request.data.get('email')
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return email.strip().lower()
@@ -1,8 +1,12 @@
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from user.authentication import CachedTokenAuthentication, token_cache
 from user.serializer import UserSerializer, AuthTokenSerializer
+from user.throttling import LoginIPThrottle, LoginEmailThrottle
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -15,14 +19,27 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     # View this endpoint in the browser with the browsable api
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # checked before the serializer hashes the password
+    throttle_classes = (LoginIPThrottle, LoginEmailThrottle)
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
         """Retrive and return authentication user"""
-        return self.request.user
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user
+        # the cached user can be up to TOKEN_AUTH_CACHE_TTL seconds old,
+        # saving it would write back a password or is_active changed
+        # by another process since
+        return get_user_model().objects.get(pk=self.request.user.pk)
+
+    def perform_update(self, serializer):
+        user = serializer.save()
+        # user.signals only revoke on is_active or password changes,
+        # the cached copies of the profile are refreshed here
+        token_cache.revoke_user(user.pk)